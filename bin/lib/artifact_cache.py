@@ -0,0 +1,176 @@
+"""Content-addressed local cache of downloaded artifacts.
+
+Downloads are stored by the SHA256 of their content, with a small index from URL to content hash plus the ETag and
+Content-Length the server gave at the time. A later fetch of the same URL is served from the cache if the server still
+reports the same ETag (or, lacking one, the same Content-Length). The cache is bounded in size, evicting the least
+recently used artifacts first.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from collections.abc import Callable, Iterator, Mapping
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO
+
+import humanfriendly
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class _Validator:
+    etag: str
+    content_length: int
+
+    @staticmethod
+    def from_headers(headers: Mapping[str, str]) -> _Validator | None:
+        # With a content encoding, the length is of the encoded content, not of what we get to store.
+        content_length = 0 if headers.get("content-encoding") else int(headers.get("content-length", 0) or 0)
+        validator = _Validator(headers.get("etag", ""), content_length)
+        if not validator.etag and not validator.content_length:
+            return None
+        return validator
+
+    def matches(self, other: _Validator) -> bool:
+        if self.etag or other.etag:
+            return self.etag == other.etag
+        return self.content_length == other.content_length
+
+
+class ArtifactCache:
+    """Size-bounded, LRU-evicting cache of downloads, safe to use from several threads and processes."""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+
+    @property
+    def _blob_dir(self) -> Path:
+        return self.root / "blobs"
+
+    @property
+    def _index_dir(self) -> Path:
+        return self.root / "urls"
+
+    def _index_path(self, url: str) -> Path:
+        return self._index_dir / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+    def open_cached(self, url: str, headers: Mapping[str, str]) -> IO[bytes] | None:
+        """Open the cached content of `url` if it's still what the server (per `headers`) is offering."""
+        validator = _Validator.from_headers(headers)
+        if validator is None:
+            return None
+        try:
+            entry = json.loads(self._index_path(url).read_text(encoding="utf-8"))
+            cached = _Validator(entry["etag"], entry["content_length"])
+            blob = self._blob_dir / entry["sha256"]
+            if not cached.matches(validator):
+                return None
+            fd = blob.open("rb")
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            _LOGGER.debug("Ignoring unreadable download cache entry for %s: %s", url, e)
+            return None
+        size = os.fstat(fd.fileno()).st_size
+        if validator.content_length and size != validator.content_length:
+            fd.close()
+            return None
+        # Touch it, so it's the most recently used.
+        with contextlib.suppress(OSError):
+            os.utime(blob)
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += size
+        _LOGGER.info("Download cache hit for %s (%s saved)", url, humanfriendly.format_size(size, binary=True))
+        return fd
+
+    @contextlib.contextmanager
+    def storing(self, url: str, headers: Mapping[str, str]) -> Iterator[Callable[[bytes], None] | None]:
+        """Context manager giving a function to pass each downloaded chunk to, or None if `url` can't be cached.
+
+        The artifact is only added to the cache if the block completes without raising.
+        """
+        with self._lock:
+            self.misses += 1
+        validator = _Validator.from_headers(headers)
+        if validator is None or (validator.content_length and validator.content_length > self.max_bytes):
+            yield None
+            return
+        self._blob_dir.mkdir(parents=True, exist_ok=True)
+        temp_path = self._blob_dir / f"incoming-{uuid.uuid4()}.tmp"
+        digest = hashlib.sha256()
+        try:
+            with temp_path.open("wb") as temp_file:
+
+                def add(chunk: bytes) -> None:
+                    temp_file.write(chunk)
+                    digest.update(chunk)
+
+                yield add
+            if validator.content_length and temp_path.stat().st_size != validator.content_length:
+                _LOGGER.warning(
+                    "Not caching %s: got %d bytes, expected %d", url, temp_path.stat().st_size, validator.content_length
+                )
+                return
+            sha256 = digest.hexdigest()
+            temp_path.replace(self._blob_dir / sha256)
+            self._write_index(url, validator, sha256)
+        finally:
+            temp_path.unlink(missing_ok=True)
+        self.evict()
+
+    def _write_index(self, url: str, validator: _Validator, sha256: str) -> None:
+        self._index_dir.mkdir(parents=True, exist_ok=True)
+        index_path = self._index_path(url)
+        temp_path = index_path.with_name(f"{index_path.name}.{uuid.uuid4()}.tmp")
+        temp_path.write_text(
+            json.dumps({
+                "url": url,
+                "etag": validator.etag,
+                "content_length": validator.content_length,
+                "sha256": sha256,
+            }),
+            encoding="utf-8",
+        )
+        temp_path.replace(index_path)
+
+    def evict(self) -> None:
+        """Remove least recently used artifacts until the cache fits in its size limit."""
+        try:
+            blobs = []
+            for entry in os.scandir(self._blob_dir):
+                if not entry.name.endswith(".tmp"):
+                    entry_stat = entry.stat()
+                    blobs.append((entry_stat.st_mtime, entry_stat.st_size, Path(entry.path)))
+        except FileNotFoundError:
+            return
+        total = sum(size for _, size, _ in blobs)
+        for _, size, path in sorted(blobs):
+            if total <= self.max_bytes:
+                break
+            _LOGGER.debug("Evicting %s from download cache", path.name)
+            path.unlink(missing_ok=True)
+            total -= size
+        # Index entries for evicted blobs are dropped lazily, when they fail to open.
+
+    def report(self) -> None:
+        if self.hits or self.misses:
+            _LOGGER.info(
+                "Download cache: %d hits, %d misses, %s saved",
+                self.hits,
+                self.misses,
+                humanfriendly.format_size(self.bytes_saved, binary=True),
+            )
@@ -7,6 +7,7 @@ from collections.abc import Iterable
 from pathlib import Path
 from typing import Any
 
+from lib.elf_header import has_elf_magic
 from lib.library_platform import LibraryPlatform
 
 SYMBOLLINE_RE = re.compile(
@@ -14,6 +15,7 @@ SYMBOLLINE_RE = re.compile(
 )
 SYMBOLLINE_NM_RE = re.compile(r"^[0-9a-f ]*\s(\w)\s(.*)\r$", re.MULTILINE)
 SO_STRANGE_SYMLINK = re.compile(r"INPUT \((\S*)\)")
+AR_MAGICS = (b"!<arch>\n", b"!<thin>\n")
 
 ELF_CLASS_RE = re.compile(r"^\s*Class:\s*(.*)$", re.MULTILINE)
 ELF_OSABI_RE = re.compile(r"^\s*OS\/ABI:\s*(.*)$", re.MULTILINE)
@@ -64,6 +66,12 @@ class BinaryInfo:
             self.filepath = self.filepath.resolve()
             self.logger.debug("Was symlink -> readelf on %s", self.filepath)
 
+        if self.platform == LibraryPlatform.Linux:
+            if not has_elf_magic(self.filepath) and not self._is_archive():
+                # Not something readelf understands, but it may be a linker script pointing at the real library.
+                self._follow_linker_script()
+                return
+
         try:
             if self.platform == LibraryPlatform.Linux:
                 self.readelf_header_details = self._debug_check_output(["readelf", "-h", str(self.filepath)])
@@ -84,13 +92,20 @@ class BinaryInfo:
                     self.nm_used = True
 
         except subprocess.CalledProcessError:
-            try:
-                match = SO_STRANGE_SYMLINK.match(Path(self.filepath).read_text(encoding="utf-8"))
-                if match:
-                    self.filepath = self.buildfolder / match[1]
-                    self._follow_and_readelf()
-            except UnicodeDecodeError:
-                return
+            self._follow_linker_script()
+
+    def _is_archive(self) -> bool:
+        with self.filepath.open("rb") as f:
+            return f.read(8) in AR_MAGICS
+
+    def _follow_linker_script(self) -> None:
+        try:
+            match = SO_STRANGE_SYMLINK.match(Path(self.filepath).read_text(encoding="utf-8"))
+            if match:
+                self.filepath = self.buildfolder / match[1]
+                self._follow_and_readelf()
+        except UnicodeDecodeError:
+            return
 
     def _read_symbols_from_binary(self) -> None:
         self.required_symbols = set()
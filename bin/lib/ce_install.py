@@ -9,28 +9,33 @@ import multiprocessing
 import os
 import signal
 import sys
-import traceback
+from collections.abc import Mapping, MutableMapping
 from dataclasses import dataclass, field
 from functools import partial
 from multiprocessing.pool import ThreadPool
 from pathlib import Path
-from typing import TextIO
+from typing import Any, TextIO
 
 import click
+import humanfriendly
 import yaml
 from click.core import ParameterSource
 from packaging import specifiers, version
 
 from lib.amazon_properties import get_properties_compilers_and_libraries
+from lib.cefs.paths import get_directory_size
 from lib.compiler_id_lookup import get_compiler_id_lookup
-from lib.config import Config
+from lib.config import Config, SquashfsConfig
+from lib.config_cache import ExpandedTargetCache, default_cache_dir
 from lib.config_safe_loader import ConfigSafeLoader
-from lib.installable.installable import Installable
-from lib.installation import installers_for
+from lib.install_scheduler import InstallScheduler
+from lib.installable.installable import Installable, VerifyResult
+from lib.installation import installer_base_config, installers_for, installers_for_targets
 from lib.installation_context import FetchFailure, InstallationContext
 from lib.library_platform import LibraryPlatform
 from lib.library_yaml import LibraryYaml
-from lib.squashfs import verify_squashfs_contents
+from lib.squash_jobs import SizedJob, processors_per_job, run_sized_jobs
+from lib.squashfs import CONTENT_CHECK_FULL, CONTENT_CHECK_SAMPLE, verify_squashfs_contents
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -42,6 +47,7 @@ class CliContext:
     filter_match_all: bool
     parallel: int
     config: Config
+    target_cache: ExpandedTargetCache = field(default_factory=lambda: ExpandedTargetCache(None))
     _name_to_installable_cache: dict[str, Installable] = field(default_factory=dict, init=False, repr=False)
 
     def pool(self):  # no type hint as mypy freaks out, really a multiprocessing.Pool
@@ -55,22 +61,46 @@ class CliContext:
     def get_installables(self, args_filter: list[str], bypass_enable_check: bool = False) -> list[Installable]:
         """Get installables matching the filter.
 
+        Filtering happens on the expanded targets, so only matching targets (and whatever they depend on) are
+        turned into Installables; some of those hit S3 or other web services just to be constructed.
+
         Args:
             args_filter: Filter strings to match installables
             bypass_enable_check: If True, bypass all 'if:' conditions (nightly, non-free, etc.)
         """
-        installables = []
+        base_config = installer_base_config(self.installation_context)
+        enabled = bypass_enable_check or self.enabled
+        targets: list[tuple[_TargetView, MutableMapping[str, Any]]] = []
         for yaml_path in Path(self.installation_context.yaml_dir).glob("*.yaml"):
-            with yaml_path.open(encoding="utf-8") as yaml_file:
-                yaml_doc = yaml.load(yaml_file, Loader=ConfigSafeLoader)
-            for installer in installers_for(self.installation_context, yaml_doc, bypass_enable_check or self.enabled):
-                installables.append(installer)
+            for target in self.target_cache.targets_for(yaml_path, enabled, base_config):
+                targets.append((_TargetView.of(target), target))
+        targets_by_name = {view.name: target for view, target in targets}
+        _LOGGER.debug("Target cache: %d files cached, %d expanded", self.target_cache.hits, self.target_cache.misses)
+
+        matching = {view.name for view, _ in targets if filter_aggregate(args_filter, view, self.filter_match_all)}
+        needed = set(matching)
+        pending = list(matching)
+        while pending:
+            for dependency in targets_by_name[pending.pop()].get("depends", []):
+                if dependency not in needed and dependency in targets_by_name:
+                    needed.add(dependency)
+                    pending.append(dependency)
+        _LOGGER.debug(
+            "%d of %d targets match, constructing %d including dependencies",
+            len(matching),
+            len(targets),
+            len(needed),
+        )
+
+        installables = list(
+            installers_for_targets(
+                self.installation_context, (target for view, target in targets if view.name in needed)
+            )
+        )
         Installable.resolve(installables)
-        installables = sorted(
-            filter(lambda installable: filter_aggregate(args_filter, installable, self.filter_match_all), installables),
-            key=lambda x: x.sort_key,
+        return sorted(
+            (installable for installable in installables if installable.name in matching), key=lambda x: x.sort_key
         )
-        return installables
 
     def find_installable_by_exact_name(self, name: str) -> Installable:
         """Find an installable by its exact name.
@@ -99,7 +129,23 @@ class CliContext:
         return self._name_to_installable_cache[name]
 
 
-def _context_match(context_query: str, installable: Installable) -> bool:
+@dataclass(frozen=True)
+class _TargetView:
+    """Just enough of an Installable, built from a target's config, to match filters against."""
+
+    context: list[str]
+    target_name: str
+
+    @staticmethod
+    def of(target: Mapping[str, Any]) -> _TargetView:
+        return _TargetView(context=target.get("context", []), target_name=str(target.get("name", "(unnamed)")))
+
+    @property
+    def name(self) -> str:
+        return f"{'/'.join(self.context)} {self.target_name}"
+
+
+def _context_match(context_query: str, installable: Installable | _TargetView) -> bool:
     """Match context query against installable's context path.
 
     Context matching rules:
@@ -186,7 +232,7 @@ def _version_matches_range(version_str: str, specifiers: specifiers.SpecifierSet
     return v in specifiers
 
 
-def _target_match(target: str, installable: Installable) -> bool:
+def _target_match(target: str, installable: Installable | _TargetView) -> bool:
     """Match target query against installable's target name.
 
     Args:
@@ -215,7 +261,7 @@ def _target_match(target: str, installable: Installable) -> bool:
     return fnmatch.fnmatch(installable.target_name, target)
 
 
-def filter_match(filter_query: str, installable: Installable) -> bool:
+def filter_match(filter_query: str, installable: Installable | _TargetView) -> bool:
     """Match a filter query against an installable.
 
     Filter syntax:
@@ -249,7 +295,7 @@ def filter_match(filter_query: str, installable: Installable) -> bool:
     return _context_match(split[0], installable) and _target_match(split[1], installable)
 
 
-def filter_aggregate(filters: list, installable: Installable, filter_match_all: bool = True) -> bool:
+def filter_aggregate(filters: list, installable: Installable | _TargetView, filter_match_all: bool = True) -> bool:
     """Apply multiple filters to an installable with AND/OR logic.
 
     Args:
@@ -377,6 +423,43 @@ def squash_mount_check(rootfolder: Path, subdir: str, context: CliContext) -> in
     metavar="N",
     show_default=True,
 )
+@click.option(
+    "--target-cache",
+    default=default_cache_dir(),
+    metavar="DIR",
+    help="Cache expanded installation targets in DIR",
+    show_default=True,
+    type=click.Path(file_okay=False, path_type=Path),
+)
+@click.option("--no-target-cache", is_flag=True, help="Always parse and expand the installation yaml from scratch")
+@click.option(
+    "--check-cache/--no-check-cache",
+    default=True,
+    help="Remember passed installation checks (in DEST) and skip re-running them while the installation is unchanged",
+    show_default=True,
+)
+@click.option(
+    "--stream-fetches/--buffer-fetches",
+    default=True,
+    help="Unpack archives while they download (spooling to disk only if unpacking falls behind), "
+    "rather than downloading them completely first",
+    show_default=True,
+)
+@click.option(
+    "--fetch-parts",
+    type=int,
+    default=4,
+    metavar="N",
+    help="Download large archives over N connections at once, if the server supports ranged requests",
+    show_default=True,
+)
+@click.option(
+    "--fetch-parts-min-size",
+    default="64MiB",
+    metavar="SIZE",
+    help="Only download archives of at least SIZE over several connections",
+    show_default=True,
+)
 @click.option("--force-cefs", is_flag=True, help="Force CEFS installation mode even if disabled in config")
 @click.option(
     "--force-traditional", is_flag=True, help="Force traditional NFS installation even if CEFS enabled in config"
@@ -387,6 +470,12 @@ def squash_mount_check(rootfolder: Path, subdir: str, context: CliContext) -> in
     help="Override local temp directory for CEFS staging",
     type=click.Path(file_okay=False, path_type=Path),
 )
+@click.option(
+    "--download-cache-size",
+    metavar="SIZE",
+    help="Cache up to SIZE (e.g. 50GiB, or 0 to disable) of downloads under the CEFS temp directory, "
+    "overriding the config",
+)
 @click.pass_context
 def cli(
     ctx: click.Context,
@@ -408,9 +497,16 @@ def cli(
     filter_match_all: bool,
     parallel: int,
     check_user: str,
+    target_cache: Path,
+    no_target_cache: bool,
+    check_cache: bool,
+    stream_fetches: bool,
+    fetch_parts: int,
+    fetch_parts_min_size: str,
     force_cefs: bool,
     force_traditional: bool,
     cefs_temp_dir: Path | None,
+    download_cache_size: str | None,
 ):
     """Install binaries, libraries and compilers for Compiler Explorer."""
     formatter = logging.Formatter(fmt="%(asctime)s %(name)-15s %(levelname)-8s %(message)s")
@@ -438,6 +534,9 @@ def cli(
         force_cefs=force_cefs,
         force_traditional=force_traditional,
         cefs_temp_dir=cefs_temp_dir,
+        download_cache_size=humanfriendly.parse_size(download_cache_size, binary=True)
+        if download_cache_size is not None
+        else None,
     )
     context = InstallationContext(
         destination=dest,
@@ -454,13 +553,20 @@ def cli(
         check_user=check_user,
         platform=platform,
         config=config,
+        cache_check_results=check_cache,
+        stream_fetches=stream_fetches,
+        fetch_parts=fetch_parts,
+        fetch_parts_min_size=humanfriendly.parse_size(fetch_parts_min_size, binary=True),
     )
+    ctx.call_on_close(context.save_check_results)
+    ctx.call_on_close(context.report_download_cache)
     ctx.obj = CliContext(
         installation_context=context,
         enabled=enable,
         filter_match_all=filter_match_all,
         parallel=parallel,
         config=config,
+        target_cache=ExpandedTargetCache(None if no_target_cache else target_cache),
     )
 
 
@@ -479,6 +585,19 @@ def get_exe_path_for_installable(installable, destination) -> str | None:
     return None
 
 
+def _is_installed(installable: Installable) -> bool:
+    return installable.is_installed()
+
+
+def _verify(show_progress: bool, installable: Installable) -> VerifyResult | None:
+    """Verify an installable, or return None if it isn't installed."""
+    if show_progress:
+        print(f"Checking {installable.name}")
+    if not installable.is_installed():
+        return None
+    return installable.verify()
+
+
 @cli.command(name="list")
 @click.pass_obj
 @click.option("--json", "as_json", is_flag=True, help="Output in JSON format")
@@ -490,10 +609,15 @@ def list_cmd(context: CliContext, filter_: list[str], as_json: bool, installed_o
     lookup = get_compiler_id_lookup() if show_compiler_ids else None
     json_output: list[dict] = []
 
-    for installable in context.get_installables(filter_):
-        if installed_only and not installable.is_installed():
-            continue
+    installables = context.get_installables(filter_)
+    if installed_only:
+        with context.pool() as pool:
+            installed = pool.map(_is_installed, installables)
+        installables = [
+            installable for installable, is_installed in zip(installables, installed, strict=True) if is_installed
+        ]
 
+    for installable in installables:
         if as_json:
             output = installable.to_json_dict()
             if lookup is not None:
@@ -525,22 +649,38 @@ def list_cmd(context: CliContext, filter_: list[str], as_json: bool, installed_o
 
 @cli.command()
 @click.pass_obj
+@click.option("--json", "as_json", is_flag=True, help="Output a JSON report of the differences found")
 @click.argument("filter_", metavar="FILTER", nargs=-1)
-def verify(context: CliContext, filter_: list[str]):
+def verify(context: CliContext, filter_: list[str], as_json: bool):
     """Verify the installations of targets matching FILTER."""
     num_ok = 0
     num_not_ok = 0
-    for installable in context.get_installables(filter_):
-        print(f"Checking {installable.name}")
-        if not installable.is_installed():
+    report = []
+    installables = context.get_installables(filter_)
+    with context.pool() as pool:
+        results = pool.map(partial(_verify, not as_json), installables)
+    for installable, result in zip(installables, results, strict=True):
+        installed = result is not None
+        ok = result is not None and result.ok
+        if not installed:
             _LOGGER.info("%s is not installed", installable.name)
-            num_not_ok += 1
-        elif not installable.verify():
+        elif not ok:
             _LOGGER.info("%s is not OK", installable.name)
-            num_not_ok += 1
-        else:
+        if ok:
             num_ok += 1
-    print(f"{num_ok} packages OK, {num_not_ok} not OK or not installed")
+        else:
+            num_not_ok += 1
+        differences = result.differences if result is not None else None
+        report.append({
+            "name": installable.name,
+            "installed": installed,
+            "ok": ok,
+            "differences": differences.to_json() if differences is not None else None,
+        })
+    if as_json:
+        print(json.dumps({"ok": num_ok, "not_ok": num_not_ok, "targets": report}, indent=2))
+    else:
+        print(f"{num_ok} packages OK, {num_not_ok} not OK or not installed")
     if num_not_ok:
         sys.exit(1)
 
@@ -575,8 +715,11 @@ def list_paths(context: CliContext, filter_: list[str], as_json: bool, absolute:
 @click.argument("filter_", metavar="FILTER", nargs=-1)
 def check_installed(context: CliContext, filter_: list[str]):
     """Check whether targets matching FILTER are installed."""
-    for installable in context.get_installables(filter_):
-        if installable.is_installed():
+    installables = context.get_installables(filter_)
+    with context.pool() as pool:
+        installed = pool.map(_is_installed, installables)
+    for installable, is_installed in zip(installables, installed, strict=True):
+        if is_installed:
             print(f"{installable.name}: installed")
         else:
             print(f"{installable.name}: not installed")
@@ -669,19 +812,53 @@ def squash(context: CliContext, filter_: list[str], force: bool, image_dir: Path
 
     with context.pool() as pool:
         should_install_func = partial(_to_squash, image_dir, force)
-        to_do = filter(lambda x: x is not None, pool.map(should_install_func, context.get_installables(filter_)))
-
-    for installable, destination in to_do:
+        to_do = [x for x in pool.map(should_install_func, context.get_installables(filter_)) if x is not None]
         if context.installation_context.dry_run:
-            _LOGGER.info("Would squash %s to %s", installable.name, destination)
-        else:
-            _LOGGER.info("Squashing %s to %s", installable.name, destination)
-            installable.squash_to(destination, context.config.squashfs)
+            for installable, destination in to_do:
+                _LOGGER.info("Would squash %s to %s", installable.name, destination)
+            return
+        sizes = pool.map(_squash_source_size, [installable for installable, _ in to_do])
+
+    # Each mksquashfs gets an equal share of the cores, so between them they never use more than there are.
+    workers = min(context.parallel, multiprocessing.cpu_count())
+    processors = processors_per_job(workers)
+    jobs = [
+        SizedJob(
+            installable.name,
+            size,
+            partial(_squash_one, installable, destination, context.config.squashfs, processors),
+        )
+        for (installable, destination), size in zip(to_do, sizes, strict=True)
+    ]
+    _LOGGER.info("Squashing %d targets, %d at a time with %d processors each", len(jobs), workers, processors)
+    results = run_sized_jobs(jobs, workers, "Squashed")
+    failed = sorted(result.name for result in results if not result.ok)
+    print(f"{len(results) - len(failed)} images squashed OK, and {len(failed)} failed")
+    if failed:
+        print("Failed:")
+        for name in failed:
+            print(f"  {name}")
+        sys.exit(1)
+
+
+def _squash_source_size(installable: Installable) -> int:
+    return get_directory_size(installable.install_context.destination / installable.install_path)
+
+
+def _squash_one(installable: Installable, destination: Path, squashfs_config: SquashfsConfig, processors: int) -> None:
+    _LOGGER.info("Squashing %s to %s", installable.name, destination)
+    installable.squash_to(destination, squashfs_config, processors)
 
 
 @cli.command()
 @click.pass_obj
 @click.option("--verify", is_flag=True, help="Verify squashfs contents match NFS directories")
+@click.option(
+    "--verify-content",
+    type=click.Choice([CONTENT_CHECK_SAMPLE, CONTENT_CHECK_FULL]),
+    default=None,
+    help="With --verify, also compare the contents of a sample of (or all) files, not just their types and sizes",
+)
 @click.option("--no-check-mount-targets", is_flag=True, help="Skip checking mount targets exist")
 @click.option(
     "--image-dir",
@@ -692,7 +869,12 @@ def squash(context: CliContext, filter_: list[str], force: bool, image_dir: Path
 )
 @click.argument("filter_", metavar="FILTER", nargs=-1)
 def squash_check(
-    context: CliContext, filter_: list[str], image_dir: Path | None, verify: bool, no_check_mount_targets: bool
+    context: CliContext,
+    filter_: list[str],
+    image_dir: Path | None,
+    verify: bool,
+    verify_content: str | None,
+    no_check_mount_targets: bool,
 ):
     """Check squash images matching FILTER, optionally verify contents."""
     if image_dir is None:
@@ -706,6 +888,7 @@ def squash_check(
 
     # Check for missing/unexpected squash images
     installables = context.get_installables(filter_)
+    to_verify: list[SizedJob[int]] = []
     for installable in installables:
         destination = image_dir / f"{installable.install_path}.img"
         if not installable.is_squashable:
@@ -720,8 +903,21 @@ def squash_check(
         elif verify:
             # Verify contents if requested
             nfs_path = context.installation_context.destination / installable.install_path
-            _LOGGER.info("Verifying %s...", installable.name)
-            total_errors += verify_squashfs_contents(destination, nfs_path)
+            to_verify.append(
+                SizedJob(
+                    installable.name,
+                    destination.stat().st_size,
+                    partial(_verify_one, installable.name, destination, nfs_path, verify_content),
+                )
+            )
+
+    if to_verify:
+        results = run_sized_jobs(to_verify, context.parallel, "Verified")
+        for result in sorted(results, key=lambda result: result.name):
+            errors = result.result if result.ok else 1
+            if errors:
+                _LOGGER.error("%s: %d errors", result.name, errors)
+                total_errors += errors
 
     # Check mount points (unless disabled)
     if not no_check_mount_targets:
@@ -736,6 +932,11 @@ def squash_check(
         sys.exit(0)
 
 
+def _verify_one(name: str, destination: Path, nfs_path: Path, content_check: str | None) -> int:
+    _LOGGER.info("Verifying %s...", name)
+    return verify_squashfs_contents(destination, nfs_path, content_check=content_check)
+
+
 def _should_install(force: bool, installable: Installable) -> tuple[Installable, bool]:
     try:
         return installable, force or installable.should_install()
@@ -746,45 +947,52 @@ def _should_install(force: bool, installable: Installable) -> tuple[Installable,
 @cli.command()
 @click.pass_obj
 @click.option("--force", is_flag=True, help="Force even if would otherwise skip")
+@click.option(
+    "--max-fetches",
+    type=int,
+    default=4,
+    metavar="N",
+    help="Limit the number of concurrent downloads to N",
+    show_default=True,
+)
+@click.option(
+    "--max-extracts",
+    type=int,
+    default=min(8, multiprocessing.cpu_count()),
+    metavar="N",
+    help="Limit the number of concurrent archive extractions to N",
+    show_default=True,
+)
+@click.option(
+    "--max-moves",
+    type=int,
+    default=2,
+    metavar="N",
+    help="Limit the number of concurrent moves from staging to the destination (or CEFS deploys) to N",
+    show_default=True,
+)
 @click.argument("filter_", metavar="FILTER", nargs=-1)
-def install(context: CliContext, filter_: list[str], force: bool):
-    """Install targets matching FILTER."""
-    num_installed = 0
-    num_skipped = 0
-    failed = []
+def install(context: CliContext, filter_: list[str], force: bool, max_fetches: int, max_extracts: int, max_moves: int):
+    """Install targets matching FILTER.
 
+    Independent targets are installed concurrently (up to --parallel at once); a target is only started once
+    everything it depends on is installed.
+    """
     with context.pool() as pool:
         to_do = pool.map(partial(_should_install, force), context.get_installables(filter_))
 
-    for installable, should_install in to_do:
-        print(f"Installing {installable.name}")
-        if should_install:
-            try:
-                installable.install()
-                if context.installation_context.dry_run:
-                    _LOGGER.info("Assuming %s installed OK (dry run)", installable.name)
-                    num_installed += 1
-                else:
-                    if not installable.is_installed():
-                        _LOGGER.error("%s installed OK, but doesn't appear as installed after", installable.name)
-                        failed.append(installable.name)
-                    else:
-                        _LOGGER.info("%s installed OK", installable.name)
-                        num_installed += 1
-            except Exception as e:  # noqa: BLE001
-                _LOGGER.info("%s failed to install: %s\n%s", installable.name, e, traceback.format_exc(5))
-                failed.append(installable.name)
-        else:
-            _LOGGER.info("%s is already installed, skipping", installable.name)
-            num_skipped += 1
+    context.installation_context.limit_concurrency(fetches=max_fetches, extracts=max_extracts, moves=max_moves)
+    scheduler = InstallScheduler(max_workers=context.parallel, dry_run=context.installation_context.dry_run)
+    summary = scheduler.run(to_do)
+
     print(
-        f"{num_installed} packages installed "
+        f"{len(summary.installed)} packages installed "
         f"{'(apparently; this was a dry-run) ' if context.installation_context.dry_run else ''}OK, "
-        f"{num_skipped} skipped, and {len(failed)} failed installation"
+        f"{len(summary.skipped)} skipped, and {len(summary.failed)} failed installation"
     )
-    if failed:
+    if summary.failed:
         print("Failed:")
-        for f in sorted(failed):
+        for f in sorted(summary.failed):
             print(f"  {f}")
         sys.exit(1)
 
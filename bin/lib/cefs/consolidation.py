@@ -3,11 +3,22 @@
 
 from __future__ import annotations
 
+import dataclasses
 import logging
+import multiprocessing
 import os
 import shutil
+import tarfile
 from collections.abc import Callable
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from contextlib import AbstractContextManager, nullcontext
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
@@ -18,10 +29,12 @@ from lib.cefs.deployment import (
     backup_and_symlink,
     check_temp_space_available,
     deploy_to_cefs_transactional,
+    get_available_space,
     verify_symlinks_unchanged,
 )
 from lib.cefs.gc import check_if_symlink_references_image
-from lib.cefs.models import ConsolidationCandidate
+from lib.cefs.index import CEFSIndex
+from lib.cefs.models import ConsolidationCandidate, PackingPlan
 from lib.cefs.paths import (
     CEFSPaths,
     get_cefs_filename_for_image,
@@ -38,8 +51,15 @@ from lib.cefs_manifest import (
     validate_manifest,
 )
 from lib.config import SquashfsConfig
-from lib.installation_context import fix_permissions, is_windows
-from lib.squashfs import create_squashfs_image, extract_squashfs_relocating_subdir
+from lib.installation_context import fix_permissions, fixed_permission_bits, is_windows
+from lib.squashfs import (
+    SquashfsError,
+    create_squashfs_image,
+    create_squashfs_image_from_trees,
+    extract_squashfs_relocating_subdir,
+    get_uncompressed_size,
+    verify_squashfs_contents,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -154,6 +174,7 @@ def create_consolidated_image(
     temp_dir: Path,
     output_path: Path,
     max_parallel_extractions: int | None = None,
+    expected_extracted_size: int | None = None,
 ) -> None:
     """Create a consolidated squashfs image from multiple CEFS items.
 
@@ -163,6 +184,7 @@ def create_consolidated_image(
         temp_dir: Temporary directory for extraction
         output_path: Path for the consolidated squashfs image
         max_parallel_extractions: Maximum number of parallel extractions (default: CPU count - 1)
+        expected_extracted_size: Total size the items are expected to extract to, for reporting progress
 
     Raises:
         RuntimeError: If consolidation fails
@@ -195,7 +217,10 @@ def create_consolidated_image(
         partial_extracted_size = 0
         failed_extractions = []
 
-        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        # Not forked: several groups may be consolidated at once, from different threads.
+        with ProcessPoolExecutor(
+            max_workers=num_workers, mp_context=multiprocessing.get_context("forkserver")
+        ) as executor:
             future_to_args = {executor.submit(_extract_single_squashfs, args): args for args in extraction_tasks}
 
             completed = 0
@@ -222,12 +247,23 @@ def create_consolidated_image(
 
                 total_extracted_size += result.extracted_size
 
-                _LOGGER.info(
-                    "[%d/%d] Completed extraction of %s",
-                    completed,
-                    len(items),
-                    result.subdir_name,
-                )
+                if expected_extracted_size:
+                    _LOGGER.info(
+                        "[%d/%d] Completed extraction of %s (%s of %s extracted, %.0f%%)",
+                        completed,
+                        len(items),
+                        result.subdir_name,
+                        humanfriendly.format_size(total_extracted_size, binary=True),
+                        humanfriendly.format_size(expected_extracted_size, binary=True),
+                        100 * total_extracted_size / expected_extracted_size,
+                    )
+                else:
+                    _LOGGER.info(
+                        "[%d/%d] Completed extraction of %s",
+                        completed,
+                        len(items),
+                        result.subdir_name,
+                    )
 
         if failed_extractions:
             raise RuntimeError(
@@ -297,6 +333,64 @@ def create_consolidated_image(
             _LOGGER.debug("Cleaned up extraction directory: %s", extraction_dir)
 
 
+def _with_fixed_permissions(info: tarfile.TarInfo) -> tarfile.TarInfo:
+    """As fix_permissions does for extracted files, for files streamed into an image."""
+    if info.issym() or info.islnk():
+        return info
+    return info.replace(mode=fixed_permission_bits(info.mode), deep=False)
+
+
+def stream_consolidated_image(
+    squashfs_config: SquashfsConfig,
+    items: list[tuple[Path, Path, str, Path | None]],
+    mount_point: Path,
+    output_path: Path,
+) -> None:
+    """Create a consolidated squashfs image from multiple CEFS items, without extracting them to local disk.
+
+    Each item is read through its image's CEFS mount and streamed into mksquashfs (see
+    create_squashfs_image_from_trees), then the consolidated image is checked against the mounted items with
+    verify_squashfs_contents.
+
+    Args:
+        squashfs_config: SquashFsConfig object with tool paths and settings
+        items: List of (nfs_path, squashfs_path, subdirectory_name, extraction_path) tuples
+        mount_point: CEFS mount point the items' images are mounted under
+        output_path: Path for the consolidated squashfs image
+
+    Raises:
+        RuntimeError: If consolidation fails
+    """
+    trees = []
+    for _, squashfs_path, subdir_name, extraction_path in items:
+        source = get_cefs_mount_path(mount_point, squashfs_path.name)
+        if extraction_path is not None:
+            source = source / extraction_path
+        trees.append((source, subdir_name))
+
+    total_size = 0
+
+    def account(info: tarfile.TarInfo) -> tarfile.TarInfo:
+        nonlocal total_size
+        if info.isfile():
+            total_size += info.size
+        return _with_fixed_permissions(info)
+
+    _LOGGER.info("Streaming %d items into consolidated squashfs image at %s", len(items), output_path)
+    create_squashfs_image_from_trees(squashfs_config, trees, output_path, account)
+    consolidated_size = output_path.stat().st_size
+    _LOGGER.info(
+        "Consolidation complete: %s -> %s (%.1fx)",
+        humanfriendly.format_size(total_size, binary=True),
+        humanfriendly.format_size(consolidated_size, binary=True),
+        total_size / consolidated_size if consolidated_size > 0 else 0,
+    )
+
+    errors = sum(verify_squashfs_contents(output_path, source, Path(name)) for source, name in trees)
+    if errors:
+        raise RuntimeError(f"Consolidated image {output_path} doesn't match its sources: {errors} differences")
+
+
 def update_symlinks_for_consolidation(
     unchanged_symlinks: list[Path],
     consolidated_filename: str,
@@ -587,8 +681,98 @@ def extract_candidates_from_manifest(
     return candidates
 
 
+NEXT_FIT = "next-fit"
+FIRST_FIT_DECREASING = "first-fit-decreasing"
+BEST_FIT_DECREASING = "best-fit-decreasing"
+
+
+def _locality_key(item: ConsolidationCandidate) -> str:
+    """The installable name without its version, e.g. "compilers/c++/x86/gcc" for "compilers/c++/x86/gcc 15.1.0"."""
+    return item.name.rsplit(" ", 1)[0]
+
+
+def _units_size(unit: list[ConsolidationCandidate]) -> int:
+    return sum(item.size for item in unit)
+
+
+def _packing_units(
+    items: list[ConsolidationCandidate], max_size_bytes: int, locality: bool
+) -> list[list[ConsolidationCandidate]]:
+    """Split items (sorted by name) into the units that get packed: single items, or with locality, runs of items
+    sharing a prefix, as large as fit in one image."""
+    if not locality:
+        return [[item] for item in items]
+    units: list[list[ConsolidationCandidate]] = []
+    previous_key = None
+    for item in items:
+        key = _locality_key(item)
+        if key != previous_key or _units_size(units[-1]) + item.size > max_size_bytes:
+            units.append([])
+        units[-1].append(item)
+        previous_key = key
+    return units
+
+
+def _next_fit(
+    units: list[list[ConsolidationCandidate]], max_size_bytes: int, min_items: int
+) -> list[list[ConsolidationCandidate]]:
+    """Fill one group at a time in name order, moving on when the next unit doesn't fit.
+
+    A group is allowed over the size limit rather than closed with fewer than min_items items.
+    """
+    groups: list[list[ConsolidationCandidate]] = []
+    current_group: list[ConsolidationCandidate] = []
+    current_size = 0
+    for unit in units:
+        unit_size = _units_size(unit)
+        if current_group and current_size + unit_size > max_size_bytes and len(current_group) >= min_items:
+            groups.append(current_group)
+            current_group = []
+            current_size = 0
+        current_group.extend(unit)
+        current_size += unit_size
+    if current_group:
+        groups.append(current_group)
+    return groups
+
+
+def _fit_decreasing(
+    units: list[list[ConsolidationCandidate]], max_size_bytes: int, best_fit: bool
+) -> list[list[ConsolidationCandidate]]:
+    """Place units largest first into the first (or with best_fit, the fullest) group they fit in."""
+    groups: list[list[ConsolidationCandidate]] = []
+    sizes: list[int] = []
+    for unit in sorted(units, key=lambda u: (-_units_size(u), u[0].name)):
+        unit_size = _units_size(unit)
+        fitting = [i for i, size in enumerate(sizes) if size + unit_size <= max_size_bytes]
+        if not fitting:
+            groups.append([])
+            sizes.append(0)
+            index = len(groups) - 1
+        elif best_fit:
+            index = max(fitting, key=lambda i: sizes[i])
+        else:
+            index = fitting[0]
+        groups[index].extend(unit)
+        sizes[index] += unit_size
+    return groups
+
+
+PackingStrategy = Callable[[list[list[ConsolidationCandidate]], int, int], list[list[ConsolidationCandidate]]]
+
+PACKING_STRATEGIES: dict[str, PackingStrategy] = {
+    NEXT_FIT: _next_fit,
+    FIRST_FIT_DECREASING: lambda units, max_size_bytes, _: _fit_decreasing(units, max_size_bytes, best_fit=False),
+    BEST_FIT_DECREASING: lambda units, max_size_bytes, _: _fit_decreasing(units, max_size_bytes, best_fit=True),
+}
+
+
 def pack_items_into_groups(
-    items: list[ConsolidationCandidate], max_size_bytes: int, min_items: int
+    items: list[ConsolidationCandidate],
+    max_size_bytes: int,
+    min_items: int,
+    strategy: str = NEXT_FIT,
+    locality: bool = False,
 ) -> list[list[ConsolidationCandidate]]:
     """Pack consolidation candidates into groups based on size and count constraints.
 
@@ -596,49 +780,83 @@ def pack_items_into_groups(
         items: List of items to pack into groups
         max_size_bytes: Maximum size per group in bytes
         min_items: Minimum number of items per group
+        strategy: Name of the packing strategy to use (one of PACKING_STRATEGIES)
+        locality: If True, keep items sharing a name prefix (e.g. all versions of a compiler) in the same group
+                  where they fit in one
 
     Returns:
         List of groups, where each group is a list of ConsolidationCandidate
     """
     # Sort by name for deterministic packing
     sorted_items = sorted(items, key=lambda x: x.name)
+    units = _packing_units(sorted_items, max_size_bytes, locality)
 
     groups: list[list[ConsolidationCandidate]] = []
-    current_group: list[ConsolidationCandidate] = []
-    current_size = 0
-
-    for item in sorted_items:
-        if current_size + item.size > max_size_bytes and len(current_group) >= min_items:
-            # Start new group
-            groups.append(current_group)
-            current_group = [item]
-            current_size = item.size
+    for group in PACKING_STRATEGIES[strategy](units, max_size_bytes, min_items):
+        if len(group) >= min_items:
+            groups.append(sorted(group, key=lambda x: x.name))
         else:
-            current_group.append(item)
-            current_size += item.size
+            _LOGGER.info("Group has only %d items (< %d minimum), not consolidating", len(group), min_items)
+    return groups
 
-    # Add final group if it meets minimum criteria
-    if len(current_group) >= min_items:
-        groups.append(current_group)
-    elif current_group:
-        _LOGGER.info(
-            "Final group has only %d items (< %d minimum), not consolidating",
-            len(current_group),
-            min_items,
-        )
 
-    return groups
+def plan_packing(
+    items: list[ConsolidationCandidate],
+    max_size_bytes: int,
+    min_items: int,
+    strategy: str,
+    locality: bool = False,
+    stream: bool = False,
+) -> PackingPlan:
+    """Work out how a packing strategy would group the items, and what that would do to the number of mounts."""
+    groups = pack_items_into_groups(items, max_size_bytes, min_items, strategy, locality)
+    packed = {id(item) for group in groups for item in group}
+    unpacked_images = {item.squashfs_path for item in items if id(item) not in packed}
+    return PackingPlan(
+        strategy=strategy,
+        groups=groups,
+        max_size_bytes=max_size_bytes,
+        temp_space=max((group_temp_space(group, stream) for group in groups), default=0),
+        mounts_before=len({item.squashfs_path for item in items}),
+        mounts_after=len(groups) + len(unpacked_images),
+    )
+
+
+# Temp space needed to consolidate an item whose extracted size isn't known, as a multiple of its compressed size.
+# Conservative, to cover extraction and compression.
+TEMP_SPACE_MULTIPLIER = 5
+# Headroom over an item's extracted and compressed sizes, for filesystem overhead (block rounding, directories).
+TEMP_SPACE_HEADROOM = 1.1
 
 
-def validate_space_requirements(groups: list[list[ConsolidationCandidate]], temp_dir: Path) -> tuple[int, int]:
+def group_temp_space(group: list[ConsolidationCandidate], stream: bool = False) -> int:
+    """Temp space needed to consolidate a group: room to extract every item and build the consolidated image.
+
+    When streaming (see stream_consolidated_image) nothing is extracted, so only the consolidated image needs room.
+    """
+    required = 0
+    for item in group:
+        if stream:
+            required += int(item.size * TEMP_SPACE_HEADROOM)
+        elif item.extracted_size is None:
+            required += item.size * TEMP_SPACE_MULTIPLIER
+        else:
+            required += int((item.extracted_size + item.size) * TEMP_SPACE_HEADROOM)
+    return required
+
+
+def validate_space_requirements(
+    groups: list[list[ConsolidationCandidate]], temp_dir: Path, stream: bool = False
+) -> tuple[int, int]:
     """Validate that there's enough space for consolidation.
 
     Args:
         groups: List of consolidation groups
         temp_dir: Temporary directory to check space for
+        stream: Whether the groups will be streamed rather than extracted (see group_temp_space)
 
     Returns:
-        Tuple of (required_space, largest_group_size)
+        Tuple of (required_space for the group needing the most, compressed size of the largest group)
 
     Raises:
         RuntimeError: If insufficient space is available
@@ -648,7 +866,7 @@ def validate_space_requirements(groups: list[list[ConsolidationCandidate]], temp
 
     # Calculate space requirements
     largest_group_size = max(sum(item.size for item in group) for group in groups)
-    required_temp_space = largest_group_size * 5  # Conservative multiplier for extraction/compression
+    required_temp_space = max(group_temp_space(group, stream) for group in groups)
 
     # Check available space
     temp_dir.mkdir(parents=True, exist_ok=True)
@@ -659,8 +877,7 @@ def validate_space_requirements(groups: list[list[ConsolidationCandidate]], temp
     if not temp_dir.exists():
         raise RuntimeError(f"Temp directory does not exist: {temp_dir}")
 
-    stat = os.statvfs(temp_dir)
-    available = stat.f_bavail * stat.f_frsize
+    available = get_available_space(temp_dir)
     raise RuntimeError(
         f"Insufficient temp space. Required: {humanfriendly.format_size(required_temp_space, binary=True)}, "
         f"Available: {humanfriendly.format_size(available, binary=True)}"
@@ -848,6 +1065,7 @@ def _deploy_consolidated_image(
     group_idx: int,
     find_installable_func: Callable[[str], Any],
     dry_run: bool,
+    symlink_lock: AbstractContextManager | None = None,
 ) -> tuple[int, int]:
     """Deploy consolidated image and update symlinks.
 
@@ -864,18 +1082,21 @@ def _deploy_consolidated_image(
         group_idx: Group index for logging
         find_installable_func: Function to find installables by exact name
         dry_run: Whether this is a dry run
+        symlink_lock: Held while updating (and if need be, rolling back) symlinks, so that groups processed
+                      concurrently never write symlinks at the same time
 
     Returns:
         Tuple of (updated_symlinks, skipped_symlinks)
     """
     if cefs_paths.image_path.exists():
         _LOGGER.info("Consolidated image already exists: %s", cefs_paths.image_path)
-        updated, skipped = handle_symlink_updates(
-            group, symlink_snapshot, filename, mount_point, subdir_mapping, defer_backup_cleanup
-        )
+        with symlink_lock or nullcontext():
+            updated, skipped = handle_symlink_updates(
+                group, symlink_snapshot, filename, mount_point, subdir_mapping, defer_backup_cleanup
+            )
 
-        if not dry_run and updated > 0:
-            updated = _perform_safety_check_and_rollback(group, group_idx, find_installable_func, updated)
+            if not dry_run and updated > 0:
+                updated = _perform_safety_check_and_rollback(group, group_idx, find_installable_func, updated)
 
         return updated, skipped
 
@@ -885,14 +1106,15 @@ def _deploy_consolidated_image(
         manifest,
         dry_run,
     ):
-        updated, skipped = handle_symlink_updates(
-            group, symlink_snapshot, filename, mount_point, subdir_mapping, defer_backup_cleanup
-        )
-        if updated:
-            _LOGGER.info("Updated %d symlinks for group %d", updated, group_idx + 1)
+        with symlink_lock or nullcontext():
+            updated, skipped = handle_symlink_updates(
+                group, symlink_snapshot, filename, mount_point, subdir_mapping, defer_backup_cleanup
+            )
+            if updated:
+                _LOGGER.info("Updated %d symlinks for group %d", updated, group_idx + 1)
 
-        if not dry_run:
-            updated = _perform_safety_check_and_rollback(group, group_idx, find_installable_func, updated)
+            if not dry_run:
+                updated = _perform_safety_check_and_rollback(group, group_idx, find_installable_func, updated)
 
         return updated, skipped
 
@@ -909,6 +1131,8 @@ def process_consolidation_group(
     max_parallel_extractions: int | None,
     find_installable_func: Callable[[str], Any],
     dry_run: bool = False,
+    symlink_lock: AbstractContextManager | None = None,
+    stream: bool = False,
 ) -> tuple[bool, int, int]:
     """Process a single consolidation group.
 
@@ -924,13 +1148,15 @@ def process_consolidation_group(
         max_parallel_extractions: Maximum parallel extractions
         find_installable_func: Function to find installables by exact name
         dry_run: Whether this is a dry run
+        symlink_lock: Held while updating symlinks (see run_consolidation_groups)
+        stream: Stream the items from their mounted images (see stream_consolidated_image) rather than extract them
 
     Returns:
         Tuple of (success, updated_symlinks, skipped_symlinks)
     """
     _LOGGER.info("Processing group %d (%d items)", group_idx + 1, len(group))
 
-    group_temp_dir = consolidation_dir / "extract"
+    group_temp_dir = consolidation_dir / f"extract-{group_idx + 1}"
 
     try:
         # Create temp directory for this group
@@ -948,13 +1174,18 @@ def process_consolidation_group(
 
         # Create temporary consolidated image
         temp_consolidated_path = group_temp_dir / "consolidated.sqfs"
-        create_consolidated_image(
-            squashfs_config,
-            items_for_consolidation,
-            group_temp_dir,
-            temp_consolidated_path,
-            max_parallel_extractions,
-        )
+        if stream:
+            stream_consolidated_image(squashfs_config, items_for_consolidation, mount_point, temp_consolidated_path)
+        else:
+            expected_sizes = [item.extracted_size for item in group if item.extracted_size is not None]
+            create_consolidated_image(
+                squashfs_config,
+                items_for_consolidation,
+                group_temp_dir,
+                temp_consolidated_path,
+                max_parallel_extractions,
+                sum(expected_sizes) if len(expected_sizes) == len(group) else None,
+            )
 
         # Get CEFS paths for the image
         filename = get_cefs_filename_for_image(temp_consolidated_path, "consolidate")
@@ -974,6 +1205,7 @@ def process_consolidation_group(
             group_idx,
             find_installable_func,
             dry_run,
+            symlink_lock,
         )
 
         return True, updated_symlinks, skipped_symlinks
@@ -988,3 +1220,156 @@ def process_consolidation_group(
         # Clean up group temp directory
         if group_temp_dir.exists():
             shutil.rmtree(group_temp_dir)
+
+
+def run_consolidation_groups(
+    groups: list[list[ConsolidationCandidate]],
+    process_group: Callable[[list[ConsolidationCandidate], int, int], tuple[bool, int, int]],
+    temp_space_budget: int,
+    max_parallel_groups: int,
+    max_parallel_extractions: int | None = None,
+    stream: bool = False,
+) -> list[tuple[bool, int, int]]:
+    """Process consolidation groups, several at once where temp space allows.
+
+    A group is only started while the temp space it needs (see group_temp_space), added to that of
+    the groups already running, fits within temp_space_budget; if a group doesn't fit, smaller ones later on may be
+    started ahead of it. The first group to start always does, as validate_space_requirements has checked the
+    largest group fits on its own. The extraction workers are shared between the groups running at once.
+
+    Args:
+        groups: Groups to consolidate
+        process_group: Called as process_group(group, group_idx, max_parallel_extractions) to consolidate a group,
+                       returning (success, updated_symlinks, skipped_symlinks). It may be called from several threads
+                       at once, so must serialize its own symlink updates (see process_consolidation_group)
+        temp_space_budget: Temp space the running groups may need between them, in bytes
+        max_parallel_groups: Maximum number of groups to process at once
+        max_parallel_extractions: Maximum parallel extractions overall (default: CPU count - 1)
+        stream: Whether the groups are streamed rather than extracted (see group_temp_space)
+
+    Returns:
+        The (success, updated_symlinks, skipped_symlinks) of each group, in the order of groups. A group that raised
+        is reported as failed, without affecting the others.
+    """
+    results: list[tuple[bool, int, int]] = [(False, 0, 0)] * len(groups)
+    if not groups:
+        return results
+    max_parallel_groups = max(1, min(max_parallel_groups, len(groups)))
+    if max_parallel_extractions is None:
+        max_parallel_extractions = max(1, (os.cpu_count() or 1) - 1)
+    extractions_per_group = max(1, max_parallel_extractions // max_parallel_groups)
+
+    pending = list(range(len(groups)))
+    running: dict[Future[tuple[bool, int, int]], tuple[int, int]] = {}
+    reserved = 0
+    with ThreadPoolExecutor(max_workers=max_parallel_groups, thread_name_prefix="consolidate") as executor:
+        while pending or running:
+            for group_idx in list(pending):
+                if len(running) >= max_parallel_groups:
+                    break
+                needed = group_temp_space(groups[group_idx], stream)
+                if running and reserved + needed > temp_space_budget:
+                    continue
+                pending.remove(group_idx)
+                future = executor.submit(process_group, groups[group_idx], group_idx, extractions_per_group)
+                running[future] = (group_idx, needed)
+                reserved += needed
+                _LOGGER.debug(
+                    "Started group %d, %d running, reserving %s of temp space",
+                    group_idx + 1,
+                    len(running),
+                    humanfriendly.format_size(reserved, binary=True),
+                )
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                group_idx, needed = running.pop(future)
+                reserved -= needed
+                try:
+                    results[group_idx] = future.result()
+                except Exception as e:  # noqa: BLE001
+                    group_items = ", ".join(item.name for item in groups[group_idx])
+                    _LOGGER.error("Failed to consolidate group %d (%s): %s", group_idx + 1, group_items, e)
+                    _LOGGER.debug("Full error details:", exc_info=e)
+    return results
+
+
+def _size_key(extraction_path: Path | None) -> str:
+    return "." if extraction_path is None else str(extraction_path)
+
+
+def _extraction_path_of(item: ConsolidationCandidate, mount_point: Path) -> Path | None:
+    if item.from_reconsolidation:
+        return item.extraction_path
+    try:
+        return get_extraction_path_from_symlink(item.nfs_path.readlink(), mount_point)
+    except OSError:
+        return None
+
+
+def _list_extracted_sizes(
+    squashfs_config: SquashfsConfig, image_path: Path, paths_in_image: set[Path | None]
+) -> dict[str, int]:
+    sizes = {}
+    for path_in_image in paths_in_image:
+        key = _size_key(path_in_image)
+        try:
+            sizes[key] = get_uncompressed_size(squashfs_config, image_path, path_in_image)
+        except SquashfsError as e:
+            _LOGGER.warning("Unable to estimate extracted size of %s in %s: %s", key, image_path, e)
+    return sizes
+
+
+def estimate_extracted_sizes(
+    squashfs_config: SquashfsConfig,
+    items: list[ConsolidationCandidate],
+    mount_point: Path,
+    index: CEFSIndex | None,
+    max_workers: int | None = None,
+) -> list[ConsolidationCandidate]:
+    """Work out how large each candidate will be once extracted, without extracting anything.
+
+    Sizes come from a listing of each image's inode table (see get_uncompressed_size). With an index, the sizes are
+    stored in it, and reused while the image is unchanged. (They're kept out of the manifests, which are shared with
+    older versions of ce_install that reject fields they don't know.) A candidate whose size can't be found is left
+    with extracted_size None.
+
+    Returns:
+        The candidates, in the same order, with extracted_size filled in
+    """
+    paths_by_image: dict[Path, set[Path | None]] = {}
+    item_keys = []
+    for item in items:
+        extraction_path = _extraction_path_of(item, mount_point)
+        paths_by_image.setdefault(item.squashfs_path, set()).add(extraction_path)
+        item_keys.append(_size_key(extraction_path))
+
+    sizes_by_image: dict[Path, dict[str, int]] = {}
+    to_list: dict[Path, set[Path | None]] = {}
+    image_stats: dict[Path, os.stat_result] = {}
+    for image, paths_in_image in paths_by_image.items():
+        stored: dict[str, int] = {}
+        if index is not None:
+            try:
+                image_stats[image] = image.stat()
+                stored = index.uncompressed_sizes(image, image_stats[image])
+            except OSError:
+                pass
+        sizes_by_image[image] = {key: stored[key] for key in map(_size_key, paths_in_image) if key in stored}
+        missing = {path for path in paths_in_image if _size_key(path) not in stored}
+        if missing:
+            to_list[image] = missing
+
+    workers = max_workers or min(8, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="estimate") as executor:
+        listed = executor.map(lambda image: _list_extracted_sizes(squashfs_config, image, to_list[image]), to_list)
+        # The index is only used from this thread
+        for image, sizes in zip(to_list, listed, strict=True):
+            sizes_by_image[image].update(sizes)
+            if index is not None and sizes and image in image_stats:
+                index.store_uncompressed_sizes(image, image_stats[image], sizes)
+
+    return [
+        dataclasses.replace(item, extracted_size=sizes_by_image[item.squashfs_path].get(key))
+        for item, key in zip(items, item_keys, strict=True)
+    ]
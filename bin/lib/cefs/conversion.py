@@ -3,71 +3,137 @@
 
 from __future__ import annotations
 
+import json
 import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Any
 
-from lib.cefs.deployment import backup_and_symlink, deploy_to_cefs_transactional
+from lib.cefs.deployment import backup_and_symlink, copy_to_cefs_atomically
 from lib.cefs.paths import (
+    CEFSPaths,
     detect_nfs_state,
     get_cefs_filename_for_image,
     get_cefs_paths,
 )
-from lib.cefs_manifest import create_installable_manifest_entry, create_manifest
+from lib.cefs_manifest import (
+    create_installable_manifest_entry,
+    create_manifest,
+    finalize_manifest,
+    get_inprogress_manifest_path,
+    write_manifest_inprogress,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
 
-def convert_to_cefs(
+def default_journal_path() -> Path:
+    return Path.home() / ".cache" / "ce_install" / "cefs-convert-journal.jsonl"
+
+
+class ConversionJournal:
+    """Append-only record of the images a conversion run has hashed, so an interrupted run can skip rehashing them.
+
+    Each line records an image's CEFS filename along with the image's size and mtime when it was hashed; a record is
+    only used if the image still has the same size and mtime.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._filenames: dict[str, tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+        if path.exists():
+            with path.open(encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self._filenames[record["image"]] = (record["size"], record["mtime_ns"], record["filename"])
+                    except (ValueError, KeyError, TypeError):
+                        # A torn last line from an interrupted write
+                        _LOGGER.warning("Ignoring malformed line in conversion journal %s", path)
+            _LOGGER.info("Resuming from conversion journal %s (%d images hashed)", path, len(self._filenames))
+
+    def filename_for(self, squashfs_image_path: Path) -> str | None:
+        recorded = self._filenames.get(str(squashfs_image_path))
+        if recorded is None:
+            return None
+        stat = squashfs_image_path.stat()
+        size, mtime_ns, filename = recorded
+        return filename if (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns) else None
+
+    def record(self, squashfs_image_path: Path, filename: str) -> None:
+        stat = squashfs_image_path.stat()
+        line = json.dumps({
+            "image": str(squashfs_image_path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "filename": filename,
+        })
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self._filenames[str(squashfs_image_path)] = (stat.st_size, stat.st_mtime_ns, filename)
+
+    def remove(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+@dataclass(frozen=True)
+class PendingConversion:
+    """An installable whose squashfs image has been hashed, ready to deploy to CEFS and symlink."""
+
+    installable: Any
+    nfs_path: Path
+    squashfs_image_path: Path
+    cefs_paths: CEFSPaths
+    manifest: dict[str, Any]
+
+
+def prepare_conversion(
     installable,
     destination_path: Path,
     squashfs_image_path: Path,
     config_squashfs,
     config_cefs,
     force: bool,
-    defer_cleanup: bool,
-    dry_run: bool,
-) -> bool:
-    """Convert a single installable from squashfs to CEFS.
-
-    Args:
-        installable: The installable object to convert
-        destination_path: NFS destination path
-        squashfs_image_path: Path to the squashfs image
-        config_squashfs: Squashfs configuration
-        config_cefs: CEFS configuration
-        force: Force conversion even if already converted
-        defer_cleanup: Defer cleanup of backup directories
-        dry_run: Whether this is a dry run
+    journal: ConversionJournal | None = None,
+) -> tuple[bool, PendingConversion | None]:
+    """Check an installable can be converted, and hash its squashfs image to find its CEFS filename.
 
     Returns:
-        True if conversion was successful or already converted.
+        Tuple of (success, conversion still to do: None if it failed or was already converted)
     """
     nfs_path = destination_path / installable.install_path
 
     if not squashfs_image_path.exists():
         _LOGGER.error("No squashfs image found for %s at %s", installable.name, squashfs_image_path)
-        return False
+        return False, None
 
     match detect_nfs_state(nfs_path):
         case "symlink":
             if not force:
                 _LOGGER.info("Already converted to CEFS: %s", installable.name)
-                return True
+                return True, None
         case "missing":
             _LOGGER.error("NFS directory missing for %s: %s", installable.name, nfs_path)
-            return False
+            return False, None
 
     # Generate CEFS filename and paths
     try:
-        _LOGGER.info("Calculating hash for %s...", squashfs_image_path)
-        relative_path = squashfs_image_path.relative_to(config_squashfs.image_dir)
-        filename = get_cefs_filename_for_image(squashfs_image_path, "convert", relative_path)
+        filename = journal.filename_for(squashfs_image_path) if journal is not None else None
+        if filename is None:
+            _LOGGER.info("Calculating hash for %s...", squashfs_image_path)
+            relative_path = squashfs_image_path.relative_to(config_squashfs.image_dir)
+            filename = get_cefs_filename_for_image(squashfs_image_path, "convert", relative_path)
+            if journal is not None:
+                journal.record(squashfs_image_path, filename)
         _LOGGER.info("Filename: %s", filename)
     except OSError as e:
         _LOGGER.error("Failed to calculate hash for %s: %s", installable.name, e)
-        return False
-
-    cefs_paths = get_cefs_paths(config_cefs.image_dir, config_cefs.mount_point, filename)
+        return False, None
 
     installable_info = create_installable_manifest_entry(installable.name, nfs_path)
     manifest = create_manifest(
@@ -75,30 +141,57 @@ def convert_to_cefs(
         description=f"Created through conversion of {installable.name}",
         contents=[installable_info],
     )
+    return True, PendingConversion(
+        installable,
+        nfs_path,
+        squashfs_image_path,
+        get_cefs_paths(config_cefs.image_dir, config_cefs.mount_point, filename),
+        manifest,
+    )
+
+
+def deploy_conversion(pending: PendingConversion, dry_run: bool) -> bool:
+    """Copy a pending conversion's image to CEFS (if not already there) with an in-progress manifest."""
+    image_path = pending.cefs_paths.image_path
+    if dry_run:
+        _LOGGER.info("DRY RUN: Would deploy %s to %s", pending.squashfs_image_path, image_path)
+        return True
 
-    # Copy squashfs to CEFS images directory if not already there
     # Never overwrite - hash ensures content is identical
-    if cefs_paths.image_path.exists():
-        _LOGGER.info("CEFS image already exists: %s", cefs_paths.image_path)
-        # Still need to create symlink even if image exists
-        try:
-            backup_and_symlink(nfs_path, cefs_paths.mount_path, dry_run, defer_cleanup)
-        except RuntimeError as e:
-            _LOGGER.error("Failed to create symlink for %s: %s", installable.name, e)
-            return False
-    else:
-        # Deploy image and create symlink within transaction
-        try:
-            with deploy_to_cefs_transactional(squashfs_image_path, cefs_paths.image_path, manifest, dry_run):
-                # Create symlink while transaction is active
-                backup_and_symlink(nfs_path, cefs_paths.mount_path, dry_run, defer_cleanup)
-                # Manifest will be automatically finalized on successful exit
-        except RuntimeError as e:
-            _LOGGER.error("Failed to convert %s to CEFS: %s", installable.name, e)
-            return False
+    try:
+        if image_path.exists():
+            _LOGGER.info("CEFS image already exists: %s", image_path)
+        else:
+            copy_to_cefs_atomically(pending.squashfs_image_path, image_path)
+        if not image_path.with_suffix(".yaml").exists() and not get_inprogress_manifest_path(image_path).exists():
+            # A new image, or one whose copy was interrupted before its manifest was written
+            write_manifest_inprogress(pending.manifest, image_path)
+    except OSError as e:
+        _LOGGER.error("Failed to deploy %s to CEFS: %s", pending.installable.name, e)
+        return False
+    return True
+
+
+def commit_conversion(pending: PendingConversion, dry_run: bool, defer_cleanup: bool) -> bool:
+    """Swap a deployed conversion's NFS directory for a symlink to its CEFS image, and check it still works."""
+    installable = pending.installable
+    nfs_path = pending.nfs_path
+    try:
+        backup_and_symlink(nfs_path, pending.cefs_paths.mount_path, dry_run, defer_cleanup)
+    except RuntimeError as e:
+        _LOGGER.error("Failed to create symlink for %s: %s", installable.name, e)
+        if get_inprogress_manifest_path(pending.cefs_paths.image_path).exists():
+            _LOGGER.warning("Leaving manifest as .inprogress for debugging: %s", pending.cefs_paths.image_path)
+        return False
 
     # Post-migration validation (skip in dry-run)
     if not dry_run:
+        if get_inprogress_manifest_path(pending.cefs_paths.image_path).exists():
+            try:
+                finalize_manifest(pending.cefs_paths.image_path)
+            except OSError as e:
+                _LOGGER.error("Failed to finalize manifest for %s: %s", pending.cefs_paths.image_path, e)
+
         if not nfs_path.is_symlink():
             _LOGGER.error("Post-migration check failed: %s is not a symlink", nfs_path)
             return False
@@ -110,3 +203,100 @@ def convert_to_cefs(
 
     _LOGGER.info("Successfully converted %s to CEFS", installable.name)
     return True
+
+
+def convert_to_cefs(
+    installable,
+    destination_path: Path,
+    squashfs_image_path: Path,
+    config_squashfs,
+    config_cefs,
+    force: bool,
+    defer_cleanup: bool,
+    dry_run: bool,
+) -> bool:
+    """Convert a single installable from squashfs to CEFS.
+
+    Args:
+        installable: The installable object to convert
+        destination_path: NFS destination path
+        squashfs_image_path: Path to the squashfs image
+        config_squashfs: Squashfs configuration
+        config_cefs: CEFS configuration
+        force: Force conversion even if already converted
+        defer_cleanup: Defer cleanup of backup directories
+        dry_run: Whether this is a dry run
+
+    Returns:
+        True if conversion was successful or already converted.
+    """
+    success, pending = prepare_conversion(
+        installable, destination_path, squashfs_image_path, config_squashfs, config_cefs, force
+    )
+    if pending is None:
+        return success
+    return deploy_conversion(pending, dry_run) and commit_conversion(pending, dry_run, defer_cleanup)
+
+
+def convert_many_to_cefs(
+    items: list[tuple[Any, Path]],
+    destination_path: Path,
+    config_squashfs,
+    config_cefs,
+    force: bool,
+    defer_cleanup: bool,
+    dry_run: bool,
+    max_hashes: int,
+    max_copies: int,
+    journal: ConversionJournal | None = None,
+) -> tuple[int, int]:
+    """Convert many installables from squashfs to CEFS, as convert_to_cefs would one at a time.
+
+    Images are hashed on up to max_hashes threads and each is handed on to be copied to CEFS, up to max_copies at
+    once, as soon as it's hashed. Only once every copy has finished are the NFS directories swapped for symlinks, in
+    the order given, so an interrupted run leaves nothing half switched over; with a journal, rerunning it won't need
+    to rehash the images already hashed.
+
+    Args:
+        items: (installable, squashfs image path) pairs
+        (others as for convert_to_cefs)
+
+    Returns:
+        Tuple of (successful, failed)
+    """
+
+    def prepare(installable, squashfs_image_path: Path) -> tuple[bool, PendingConversion | None]:
+        try:
+            return prepare_conversion(
+                installable, destination_path, squashfs_image_path, config_squashfs, config_cefs, force, journal
+            )
+        except Exception as e:  # noqa: BLE001
+            _LOGGER.error("Failed to prepare %s for conversion: %s", installable.name, e)
+            return False, None
+
+    failed = 0
+    already_converted = 0
+    deploys: dict[int, tuple[PendingConversion, Future[bool]]] = {}
+    with (
+        ThreadPoolExecutor(max_workers=max(1, max_hashes), thread_name_prefix="hash") as hash_pool,
+        ThreadPoolExecutor(max_workers=max(1, max_copies), thread_name_prefix="copy") as copy_pool,
+    ):
+        preparing = {hash_pool.submit(prepare, *item): index for index, item in enumerate(items)}
+        for future in as_completed(preparing):
+            success, pending = future.result()
+            if pending is not None:
+                deploys[preparing[future]] = (pending, copy_pool.submit(deploy_conversion, pending, dry_run))
+            elif success:
+                already_converted += 1
+            else:
+                failed += 1
+
+    successful = already_converted
+    _LOGGER.info("Images deployed; switching %d installables over to CEFS", len(deploys))
+    for index in sorted(deploys):
+        pending, deployed = deploys[index]
+        if deployed.result() and commit_conversion(pending, dry_run, defer_cleanup):
+            successful += 1
+        else:
+            failed += 1
+    return successful, failed
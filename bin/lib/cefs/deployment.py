@@ -4,6 +4,7 @@
 from __future__ import annotations
 
 import datetime
+import hashlib
 import logging
 import os
 import shutil
@@ -11,8 +12,10 @@ import tempfile
 from collections.abc import Generator
 from contextlib import contextmanager
 from pathlib import Path
+from typing import IO
 
-from lib.cefs_manifest import finalize_manifest, write_manifest_inprogress
+from lib.cefs.paths import get_cefs_filename_for_image, get_cefs_image_path
+from lib.cefs_manifest import finalize_manifest, generate_cefs_filename, write_manifest_inprogress
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -94,9 +97,16 @@ def deploy_to_cefs_transactional(
     copy_to_cefs_atomically(source_path, cefs_image_path)
     write_manifest_inprogress(manifest, cefs_image_path)
 
+    with _finalizing_manifest(cefs_image_path):
+        yield cefs_image_path
+
+
+@contextmanager
+def _finalizing_manifest(cefs_image_path: Path) -> Generator[None, None, None]:
+    """Finalize the .inprogress manifest of `cefs_image_path` if the block succeeds, else leave it for debugging."""
     finalized = False
     try:
-        yield cefs_image_path
+        yield
         # If we get here, the context block completed successfully
         finalized = True
     finally:
@@ -111,6 +121,78 @@ def deploy_to_cefs_transactional(
                 # Note: We don't re-raise here because the main operation succeeded
 
 
+def _copy_hashing(source_path: Path, dest_file: IO[bytes]) -> str:
+    """Copy `source_path` to `dest_file`, returning the SHA256 of the content copied."""
+    sha256_hash = hashlib.sha256()
+    with open(source_path, "rb") as source_file:
+        while chunk := source_file.read(16 * 1024 * 1024):
+            sha256_hash.update(chunk)
+            dest_file.write(chunk)
+    return sha256_hash.hexdigest()
+
+
+@contextmanager
+def deploy_to_cefs_by_content(
+    source_path: Path, image_dir: Path, operation: str, path: Path | None, manifest: dict, dry_run: bool = False
+) -> Generator[tuple[str, bool], None, None]:
+    """Deploy an image to CEFS under its content-addressed name, reading it only once.
+
+    The image is hashed as it's copied to a temporary file in `image_dir`, which is then renamed to the name its hash
+    gives it, so there's no separate pass over the image to work out its name. If an image with that name is already
+    deployed the copy is discarded and the existing image (and its manifest) left alone. Otherwise the manifest is
+    written as .yaml.inprogress before the image appears under its final name, and finalized when the context block
+    completes successfully, as with deploy_to_cefs_transactional.
+
+    Args:
+        source_path: Source squashfs image to deploy
+        image_dir: Base CEFS images directory (e.g., Path("/efs/cefs-images"))
+        operation: Operation type for the filename suffix ("install", "convert", "consolidate")
+        path: Optional path for the filename suffix
+        manifest: Manifest dictionary to write alongside the image
+        dry_run: If True, only work out the filename (for testing)
+
+    Yields:
+        Tuple of (filename, newly_deployed)
+
+    Raises:
+        Exception: If deployment fails (manifest remains .inprogress if it was written)
+    """
+    if dry_run:
+        filename = get_cefs_filename_for_image(source_path, operation, path)
+        image_path = get_cefs_image_path(image_dir, filename)
+        _LOGGER.info("DRY RUN: Would deploy %s to %s", source_path, image_path)
+        yield filename, not image_path.exists()
+        return
+
+    image_dir.mkdir(parents=True, exist_ok=True)
+    # SAFETY: the temporary name doesn't end in .sqfs, and is outside the XX/ subdirectories GC scans.
+    with tempfile.NamedTemporaryFile(dir=image_dir, suffix=".tmp", prefix="cefs_", delete=False) as temp_file:
+        temp_path = Path(temp_file.name)
+        try:
+            _LOGGER.info("Copying %s to CEFS storage", source_path)
+            full_hash = _copy_hashing(source_path, temp_file)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+    try:
+        filename = generate_cefs_filename(full_hash[:24], operation, path)
+        image_path = get_cefs_image_path(image_dir, filename)
+        if image_path.exists():
+            _LOGGER.info("CEFS image already exists: %s", image_path)
+            temp_path.unlink()
+            yield filename, False
+            return
+        image_path.parent.mkdir(parents=True, exist_ok=True)
+        write_manifest_inprogress(manifest, image_path)
+        temp_path.replace(image_path)
+        _LOGGER.info("Deployed %s", image_path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+    with _finalizing_manifest(image_path):
+        yield filename, True
+
+
 def backup_and_symlink(nfs_path: Path, cefs_target: Path, dry_run: bool, defer_cleanup: bool) -> None:
     """Backup NFS directory and create CEFS symlink with rollback on failure.
 
@@ -173,6 +255,12 @@ def has_enough_space(available_bytes: int, required_bytes: int) -> bool:
     return available_bytes >= required_bytes
 
 
+def get_available_space(directory: Path) -> int:
+    """Get the space available to unprivileged users on the filesystem holding directory, in bytes."""
+    stat = os.statvfs(directory)
+    return stat.f_bavail * stat.f_frsize
+
+
 def check_temp_space_available(temp_dir: Path, required_bytes: int) -> bool:
     """Check if temp directory has enough space for consolidation.
 
@@ -184,8 +272,7 @@ def check_temp_space_available(temp_dir: Path, required_bytes: int) -> bool:
         True if enough space is available
     """
     try:
-        stat = os.statvfs(temp_dir)
-        available_bytes = stat.f_bavail * stat.f_frsize
+        available_bytes = get_available_space(temp_dir)
         _LOGGER.debug("Available space: %d bytes, required: %d bytes", available_bytes, required_bytes)
         return has_enough_space(available_bytes, required_bytes)
     except OSError as e:
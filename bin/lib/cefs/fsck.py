@@ -3,16 +3,24 @@
 
 from __future__ import annotations
 
+import hashlib
 import logging
+import os
 import time
 from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from functools import partial
 from pathlib import Path
 
+import lib.cefs_manifest
+import pydantic
 import yaml
 from lib.cefs.constants import NFS_MAX_RECURSION_DEPTH
-from lib.cefs.paths import FileWithAge, glob_with_depth
+from lib.cefs.index import CEFSIndex
+from lib.cefs.paths import FileWithAge, calculate_squashfs_hash, glob_with_depth
 from lib.cefs.state import CEFSState
-from lib.cefs_manifest import validate_manifest
+from lib.cefs_manifest import load_manifest_unvalidated, validate_manifest
+from lib.squash_jobs import SizedJob, run_sized_jobs
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -31,6 +39,7 @@ class FSCKResults:
     inprogress_files: list[FileWithAge] = field(default_factory=list)
     pending_backups: list[FileWithAge] = field(default_factory=list)
     pending_deletes: list[FileWithAge] = field(default_factory=list)
+    hash_mismatches: list[tuple[Path, str]] = field(default_factory=list)
 
     @property
     def total_invalid(self) -> int:
@@ -51,6 +60,7 @@ class FSCKResults:
             or len(self.inprogress_files) > 0
             or len(self.pending_backups) > 0
             or len(self.pending_deletes) > 0
+            or len(self.hash_mismatches) > 0
         )
 
 
@@ -100,36 +110,27 @@ def check_inprogress_files(cefs_image_dir: Path, current_time: float) -> list[Fi
     return sorted(files, key=lambda x: x.age_seconds, reverse=True)
 
 
-def validate_single_manifest(manifest_path: Path, mount_point: Path, filename_stem: str) -> tuple[bool, str | None]:
-    """Validate a single manifest file.
+def check_manifest(manifest_path: Path) -> tuple[str | None, str | None]:
+    """Validate a manifest file.
 
     Args:
         manifest_path: Path to the manifest file
-        mount_point: CEFS mount point
-        filename_stem: Stem of the image filename
 
     Returns:
-        Tuple of (is_valid, error_type)
-        where error_type is None if valid, or one of:
-        - "missing": manifest file doesn't exist
-        - "unreadable": file exists but can't be read
-        - "old_format": uses deprecated 'target' field
-        - "invalid_name": has invalid installable names
-        - "other": other validation errors
+        Tuple of (error_type, error message), both None if valid. See validate_single_manifest for the error types.
     """
     if not manifest_path.exists():
-        return False, "missing"
+        return "missing", None
 
     try:
-        with manifest_path.open(encoding="utf-8") as f:
-            manifest_dict = yaml.safe_load(f)
+        manifest_dict = load_manifest_unvalidated(manifest_path)
     except (OSError, yaml.YAMLError):
-        return False, "unreadable"
+        return "unreadable", "Cannot read manifest file"
 
     contents = manifest_dict.get("contents", []) if manifest_dict else []
 
     if any("target" in content for content in contents):
-        return False, "old_format"
+        return "old_format", None
 
     try:
         validate_manifest(manifest_dict)
@@ -138,20 +139,144 @@ def validate_single_manifest(manifest_path: Path, mount_point: Path, filename_st
         error_type = (
             "invalid_name" if "invalid name" in error_msg or "entries with invalid name" in error_msg else "other"
         )
-        return False, error_type
+        return error_type, str(e)
+
+    return None, None
+
+
+def validate_single_manifest(manifest_path: Path, mount_point: Path, filename_stem: str) -> tuple[bool, str | None]:
+    """Validate a single manifest file.
+
+    Args:
+        manifest_path: Path to the manifest file
+        mount_point: CEFS mount point
+        filename_stem: Stem of the image filename
+
+    Returns:
+        Tuple of (is_valid, error_type)
+        where error_type is None if valid, or one of:
+        - "missing": manifest file doesn't exist
+        - "unreadable": file exists but can't be read
+        - "old_format": uses deprecated 'target' field
+        - "invalid_name": has invalid installable names
+        - "other": other validation errors
+    """
+    error_type, _ = check_manifest(manifest_path)
+    return error_type is None, error_type
+
+
+def _validator_version() -> str:
+    """Hash of the code validating manifests, so results stored in the index are discarded when it changes."""
+    digest = hashlib.sha256(pydantic.VERSION.encode())
+    for source in (Path(__file__), Path(lib.cefs_manifest.__file__)):
+        digest.update(source.read_bytes())
+    return digest.hexdigest()
+
+
+def _check_manifest_cached(manifest_path: Path, index: CEFSIndex | None, full: bool) -> tuple[str | None, str | None]:
+    """As check_manifest, reusing the index's result for the manifest if it hasn't changed since (unless full)."""
+    if index is None:
+        return check_manifest(manifest_path)
+    try:
+        manifest_stat = manifest_path.stat()
+    except FileNotFoundError:
+        return "missing", None
+    if not full:
+        cached = index.fsck_result(manifest_path, manifest_stat)
+        if cached is not None:
+            return cached
+    error_type, message = check_manifest(manifest_path)
+    # Only results from what the manifest holds are stored: failing to read it may be transient (NFS EIO, ESTALE...)
+    if error_type not in ("missing", "unreadable"):
+        index.store_fsck_result(manifest_path, manifest_stat, error_type, message)
+    return error_type, message
+
+
+def find_pending_cleanups(
+    nfs_dir: Path, current_time: float, max_depth: int | None = None
+) -> tuple[list[FileWithAge], list[FileWithAge]]:
+    """Find the *.bak and *.DELETE_ME_* entries under nfs_dir, in one walk.
+
+    Finds what find_files_by_pattern would for each pattern: it walks the same way as glob_with_depth (not following
+    symlinks, down to max_depth).
+
+    Returns:
+        Tuple of (pending backups, pending deletes)
+    """
+    pending_backups: list[FileWithAge] = []
+    pending_deletes: list[FileWithAge] = []
+    pending = [(nfs_dir, 0)]
+    while pending:
+        directory, depth = pending.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            continue  # as os.walk does
+        for entry in entries:
+            if fnmatch(entry.name, "*.bak"):
+                found = pending_backups
+            elif fnmatch(entry.name, "*.DELETE_ME_*"):
+                found = pending_deletes
+            else:
+                found = None
+            if found is not None:
+                try:
+                    # The modification time of the item itself (not following symlinks)
+                    found.append(
+                        FileWithAge(Path(entry.path), current_time - entry.stat(follow_symlinks=False).st_mtime)
+                    )
+                except OSError:
+                    # Disappeared or permission denied - skip silently
+                    pass
+            if entry.is_dir(follow_symlinks=False) and (max_depth is None or depth < max_depth):
+                pending.append((Path(entry.path), depth + 1))
+    return pending_backups, pending_deletes
+
+
+def _image_size(image_path: Path) -> int:
+    try:
+        return image_path.stat().st_size
+    except OSError:
+        return 0
 
-    return True, None
+
+def verify_image_hashes(image_paths: list[Path], max_workers: int) -> list[tuple[Path, str]]:
+    """Check each image's content still hashes to the hash its filename starts with, hashing up to max_workers at once.
+
+    Returns:
+        (image path, problem) for each image whose content doesn't match its name, or that couldn't be read
+    """
+    jobs = [
+        SizedJob(str(image_path), _image_size(image_path), partial(calculate_squashfs_hash, image_path))
+        for image_path in image_paths
+    ]
+    mismatches = []
+    for image_path, result in zip(image_paths, run_sized_jobs(jobs, max_workers, "Hashed"), strict=True):
+        if not result.ok:
+            mismatches.append((image_path, f"Cannot hash image: {result.error}"))
+        elif not image_path.name.startswith(f"{result.result}_"):
+            mismatches.append((image_path, f"Content hashes to {result.result}"))
+    return mismatches
 
 
 def run_fsck_validation(
     state: CEFSState,
     mount_point: Path,
+    full: bool = False,
+    verify_hashes: bool = False,
+    max_hashes: int = 4,
 ) -> FSCKResults:
     """Run CEFS filesystem validation checks.
 
+    With an index, each manifest's validation result is stored in it, and only manifests that have changed (by mtime,
+    size or inode) since are validated again. All are revalidated when the validation code changes.
+
     Args:
         state: CEFSState with scanned images
         mount_point: CEFS mount point
+        full: Validate every manifest, ignoring any results stored in the index
+        verify_hashes: Also rehash every image (up to max_hashes at once) to check its content matches its name
 
     Returns:
         FSCKResults containing all validation results
@@ -164,38 +289,35 @@ def run_fsck_validation(
     other_invalid_manifests = []
     unreadable_manifests = []
 
-    for filename_stem, image_path in state.all_cefs_images.items():
+    if state.index is not None:
+        state.index.use_fsck_validator(_validator_version())
+
+    for image_path in state.all_cefs_images.values():
         total_images += 1
         manifest_path = image_path.with_suffix(".yaml")
-        is_valid, error_type = validate_single_manifest(manifest_path, mount_point, filename_stem)
-
-        if is_valid:
-            valid_manifests += 1
-        else:
-            match error_type:
-                case "missing":
-                    missing_manifests.append(manifest_path)
-                case "old_format":
-                    old_format_manifests.append(manifest_path)
-                case "invalid_name" | "other":
-                    # Re-validate to capture the specific error message since we only got the type earlier
-                    try:
-                        with manifest_path.open(encoding="utf-8") as f:
-                            manifest_dict = yaml.safe_load(f)
-                        validate_manifest(manifest_dict)
-                    except ValueError as e:
-                        if error_type == "invalid_name":
-                            invalid_name_manifests.append((manifest_path, str(e)))
-                        else:
-                            other_invalid_manifests.append((manifest_path, str(e)))
-                case "unreadable":
-                    unreadable_manifests.append((manifest_path, "Cannot read manifest file"))
+        error_type, message = _check_manifest_cached(manifest_path, state.index, full)
+
+        match error_type:
+            case None:
+                valid_manifests += 1
+            case "missing":
+                missing_manifests.append(manifest_path)
+            case "old_format":
+                old_format_manifests.append(manifest_path)
+            case "invalid_name":
+                invalid_name_manifests.append((manifest_path, message or ""))
+            case "other":
+                other_invalid_manifests.append((manifest_path, message or ""))
+            case "unreadable":
+                unreadable_manifests.append((manifest_path, message or ""))
 
     current_time = time.time()
     inprogress_files = check_inprogress_files(state.cefs_image_dir, current_time)
-    pending_backups = find_files_by_pattern(state.nfs_dir, "*.bak", current_time, max_depth=NFS_MAX_RECURSION_DEPTH)
-    pending_deletes = find_files_by_pattern(
-        state.nfs_dir, "*.DELETE_ME_*", current_time, max_depth=NFS_MAX_RECURSION_DEPTH
+    pending_backups, pending_deletes = find_pending_cleanups(state.nfs_dir, current_time, NFS_MAX_RECURSION_DEPTH)
+    hash_mismatches = (
+        verify_image_hashes(list(state.all_cefs_images.values()) + state.broken_images, max_hashes)
+        if verify_hashes
+        else []
     )
 
     return FSCKResults(
@@ -209,4 +331,5 @@ def run_fsck_validation(
         inprogress_files=inprogress_files,
         pending_backups=pending_backups,
         pending_deletes=pending_deletes,
+        hash_mismatches=hash_mismatches,
     )
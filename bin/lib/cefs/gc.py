@@ -5,9 +5,12 @@ from __future__ import annotations
 
 import datetime
 import logging
+import time
 from dataclasses import dataclass, field
 from pathlib import Path
 
+from lib.cefs_manifest import get_sidecar_path
+
 _LOGGER = logging.getLogger(__name__)
 
 
@@ -38,6 +41,86 @@ class GCSummary:
     space_to_reclaim: int
 
 
+@dataclass(frozen=True)
+class GCCandidate:
+    """An unreferenced image old enough to be deleted."""
+
+    image_path: Path
+    size: int | None  # None if it couldn't be stat'ed
+    age: datetime.timedelta | None
+
+
+# Deleting an image takes about this many NFS metadata round trips: the final reference check, the stat and the unlinks
+# of the image, its manifest and its sidecar.
+_ROUND_TRIPS_PER_DELETION = 5
+
+
+@dataclass(frozen=True)
+class GCPlan:
+    """Which unreferenced images to delete this run, biggest first, and which are left over the budget for later."""
+
+    to_delete: list[GCCandidate]
+    deferred: list[GCCandidate]
+    round_trip_seconds: float  # Mean time of an NFS metadata operation, as measured while planning
+
+    @property
+    def bytes_to_reclaim(self) -> int:
+        return sum(candidate.size or 0 for candidate in self.to_delete)
+
+    @property
+    def bytes_deferred(self) -> int:
+        return sum(candidate.size or 0 for candidate in self.deferred)
+
+    def estimated_seconds(self, max_workers: int) -> float:
+        """Estimated time to delete the planned images, max_workers at once."""
+        return len(self.to_delete) * _ROUND_TRIPS_PER_DELETION * self.round_trip_seconds / max(1, max_workers)
+
+
+def plan_gc(
+    images: list[Path], now: datetime.datetime, max_bytes: int | None = None, max_images: int | None = None
+) -> GCPlan:
+    """Rank images for deletion by the space they reclaim, and pick as many as the budgets allow.
+
+    Images are taken biggest first (oldest first among equals); one that would take the total over max_bytes is
+    deferred, but smaller ones after it may still fit. Images that can't be stat'ed are ranked last, as taking no
+    space, so they can still be deleted.
+
+    Args:
+        images: Unreferenced images, already filtered by age
+        now: Current time to use for age calculation
+        max_bytes: Maximum total size of images to delete (None for no limit)
+        max_images: Maximum number of images to delete (None for no limit)
+
+    Returns:
+        GCPlan with the images to delete, in order, and those deferred
+    """
+    candidates = []
+    start = time.perf_counter()
+    for image_path in images:
+        try:
+            stat = image_path.stat()
+            candidates.append(
+                GCCandidate(image_path, stat.st_size, now - datetime.datetime.fromtimestamp(stat.st_mtime))
+            )
+        except OSError:
+            candidates.append(GCCandidate(image_path, None, None))
+    round_trip_seconds = (time.perf_counter() - start) / len(images) if images else 0.0
+
+    candidates.sort(key=lambda c: (-(c.size or 0), -(c.age or datetime.timedelta()).total_seconds()))
+    to_delete: list[GCCandidate] = []
+    deferred: list[GCCandidate] = []
+    total_bytes = 0
+    for candidate in candidates:
+        if (max_images is not None and len(to_delete) >= max_images) or (
+            max_bytes is not None and total_bytes + (candidate.size or 0) > max_bytes
+        ):
+            deferred.append(candidate)
+            continue
+        to_delete.append(candidate)
+        total_bytes += candidate.size or 0
+    return GCPlan(to_delete=to_delete, deferred=deferred, round_trip_seconds=round_trip_seconds)
+
+
 def filter_images_by_age(
     images: list[Path], min_age_delta: datetime.timedelta, now: datetime.datetime
 ) -> ImageAgeFilterResult:
@@ -70,7 +153,7 @@ def filter_images_by_age(
 
 
 def delete_image_with_manifest(image_path: Path) -> ImageDeletionResult:
-    """Delete a CEFS image and its associated manifest file.
+    """Delete a CEFS image and its associated manifest file (and manifest sidecar).
 
     Args:
         image_path: Path to the CEFS image to delete
@@ -104,6 +187,12 @@ def delete_image_with_manifest(image_path: Path) -> ImageDeletionResult:
             errors.append(f"Failed to delete manifest {manifest_path}: {e}")
             # This is non-fatal - image was deleted
 
+    sidecar_path = get_sidecar_path(image_path)
+    try:
+        sidecar_path.unlink(missing_ok=True)
+    except OSError as e:
+        errors.append(f"Failed to delete manifest sidecar {sidecar_path}: {e}")
+
     return ImageDeletionResult(success=True, deleted_size=deleted_size, errors=errors)
 
 
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""Persistent local index of CEFS state, to avoid rescanning NFS and reparsing manifests on every command.
+
+The index is a SQLite database holding:
+- directory listings of the CEFS image directory (with image sizes) and of the NFS tree down to
+  NFS_MAX_RECURSION_DEPTH (with symlink targets, and which CEFS image each symlink points into);
+- parsed manifests;
+- the results of validating manifests in `ce cefs fsck`;
+- how large images (or paths within them) are once extracted, as estimated by `ce cefs consolidate`.
+
+Everything is revalidated against the filesystem when used: a directory is only relisted if its mtime has changed
+(adding, removing, renaming or replacing an entry all change its directory's mtime), and a manifest is only reparsed
+if its own mtime or size has changed. Directories and manifests modified very recently are always rescanned, so
+changes made within the filesystem's timestamp granularity (or NFS attribute cache lifetime) aren't missed.
+
+Callers must still check symlinks live before acting on them (e.g. deleting an image): the index only narrows down
+where to look.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from lib.cefs.constants import NFS_MAX_RECURSION_DEPTH
+from lib.cefs.paths import get_image_stem_from_symlink
+from lib.cefs_manifest import ManifestLoadTimings, read_manifests_from_alongside
+
+_LOGGER = logging.getLogger(__name__)
+
+_SCHEMA_VERSION = "1"
+# Anything modified more recently than this is rescanned regardless of its mtime.
+_RACY_NS = 120 * 1_000_000_000
+_IMAGES = "images"
+_NFS = "nfs"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS dirs (tree TEXT, path TEXT, mtime_ns INTEGER NOT NULL, PRIMARY KEY (tree, path));
+CREATE TABLE IF NOT EXISTS entries (
+    tree TEXT,
+    dir TEXT,
+    name TEXT,
+    is_dir INTEGER NOT NULL,
+    size INTEGER,
+    target TEXT,
+    image_stem TEXT,
+    PRIMARY KEY (tree, dir, name)
+);
+CREATE INDEX IF NOT EXISTS entries_by_image_stem ON entries (image_stem);
+CREATE TABLE IF NOT EXISTS manifests (
+    image_path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    manifest TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fsck_results (
+    manifest_path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    error_type TEXT,
+    message TEXT
+);
+CREATE TABLE IF NOT EXISTS uncompressed_sizes (
+    image_path TEXT,
+    path_in_image TEXT,
+    image_mtime_ns INTEGER NOT NULL,
+    image_size INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (image_path, path_in_image)
+);
+"""
+
+
+def default_index_path() -> Path:
+    return Path.home() / ".cache" / "ce_install" / "cefs-index.sqlite"
+
+
+@dataclass(frozen=True)
+class _Entry:
+    name: str
+    is_dir: bool
+    size: int | None = None
+    target: str | None = None
+    image_stem: str | None = None
+
+
+class CEFSIndex:
+    """Incrementally refreshed index of CEFS images, their manifests, and the NFS symlinks that point to them."""
+
+    def __init__(self, db_path: Path, nfs_dir: Path, cefs_image_dir: Path, mount_point: Path, rebuild: bool = False):
+        self.db_path = db_path
+        self.nfs_dir = nfs_dir
+        self.cefs_image_dir = cefs_image_dir
+        self.mount_point = mount_point
+        self.dirs_listed = 0
+        self.dirs_reused = 0
+        self.manifests_parsed = 0
+        self.manifests_reused = 0
+        self.fsck_results_reused = 0
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(db_path, timeout=60)
+        self._db.executescript(_SCHEMA)
+        roots = json.dumps([_SCHEMA_VERSION, str(nfs_dir), str(cefs_image_dir), str(mount_point)])
+        existing = self._db.execute("SELECT value FROM meta WHERE key = 'roots'").fetchone()
+        if rebuild or (existing is not None and existing[0] != roots):
+            _LOGGER.info("Rebuilding CEFS state index %s", db_path)
+            with self._db:
+                for table in ("dirs", "entries", "manifests", "fsck_results", "uncompressed_sizes"):
+                    self._db.execute(f"DELETE FROM {table}")  # noqa: S608 (fixed table names)
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('roots', ?)", (roots,))
+
+    def close(self) -> None:
+        _LOGGER.debug(
+            "CEFS index: listed %d directories (reused %d), parsed %d manifests (reused %d), reused %d fsck results",
+            self.dirs_listed,
+            self.dirs_reused,
+            self.manifests_parsed,
+            self.manifests_reused,
+            self.fsck_results_reused,
+        )
+        self._db.close()
+
+    @staticmethod
+    def _is_racy(mtime_ns: int) -> bool:
+        return time.time_ns() - mtime_ns < _RACY_NS
+
+    def _scan(self, tree: str, path: Path) -> list[_Entry]:
+        entries = []
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_symlink():
+                    if tree == _NFS:
+                        target = os.readlink(entry.path)
+                        entries.append(
+                            _Entry(
+                                entry.name,
+                                False,
+                                target=target,
+                                image_stem=get_image_stem_from_symlink(Path(target), self.mount_point),
+                            )
+                        )
+                elif entry.is_dir(follow_symlinks=False):
+                    entries.append(_Entry(entry.name, True))
+                elif tree == _IMAGES:
+                    size = entry.stat(follow_symlinks=False).st_size if entry.name.endswith(".sqfs") else None
+                    entries.append(_Entry(entry.name, False, size=size))
+        return entries
+
+    def _forget_dir(self, tree: str, path: Path) -> None:
+        self._db.execute("DELETE FROM dirs WHERE tree = ? AND path = ?", (tree, str(path)))
+        self._db.execute("DELETE FROM entries WHERE tree = ? AND dir = ?", (tree, str(path)))
+
+    def _listing(self, tree: str, path: Path) -> list[_Entry] | None:
+        """The entries of directory `path`, from the index if it hasn't changed, else from disk."""
+        try:
+            mtime_ns = path.stat().st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            self._forget_dir(tree, path)
+            return None
+        row = self._db.execute("SELECT mtime_ns FROM dirs WHERE tree = ? AND path = ?", (tree, str(path))).fetchone()
+        if row is not None and row[0] == mtime_ns and not self._is_racy(mtime_ns):
+            self.dirs_reused += 1
+            return [
+                _Entry(name, bool(is_dir), size, target, image_stem)
+                for name, is_dir, size, target, image_stem in self._db.execute(
+                    "SELECT name, is_dir, size, target, image_stem FROM entries WHERE tree = ? AND dir = ?",
+                    (tree, str(path)),
+                )
+            ]
+        self.dirs_listed += 1
+        entries = self._scan(tree, path)
+        self._forget_dir(tree, path)
+        self._db.execute("INSERT INTO dirs (tree, path, mtime_ns) VALUES (?, ?, ?)", (tree, str(path), mtime_ns))
+        self._db.executemany(
+            "INSERT INTO entries (tree, dir, name, is_dir, size, target, image_stem) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (tree, str(path), entry.name, entry.is_dir, entry.size, entry.target, entry.image_stem)
+                for entry in entries
+            ],
+        )
+        return entries
+
+    def _forget_unvisited(self, tree: str, visited: set[str]) -> None:
+        known = [row[0] for row in self._db.execute("SELECT path FROM dirs WHERE tree = ?", (tree,))]
+        for path in known:
+            if path not in visited:
+                self._forget_dir(tree, Path(path))
+
+    def image_subdirs(self) -> dict[Path, dict[str, int | None]]:
+        """Map each subdirectory of the image directory to its files (and the sizes of the .sqfs images in it)."""
+        result: dict[Path, dict[str, int | None]] = {}
+        visited = {str(self.cefs_image_dir)}
+        with self._db:
+            for subdir_entry in self._listing(_IMAGES, self.cefs_image_dir) or []:
+                if not subdir_entry.is_dir:
+                    continue
+                subdir = self.cefs_image_dir / subdir_entry.name
+                visited.add(str(subdir))
+                listing = self._listing(_IMAGES, subdir)
+                if listing is not None:
+                    result[subdir] = {entry.name: entry.size for entry in listing if not entry.is_dir}
+            self._forget_unvisited(_IMAGES, visited)
+        return result
+
+    def refresh_symlinks(self) -> None:
+        """Bring the index of NFS symlinks up to date."""
+        visited: set[str] = set()
+        pending = [(self.nfs_dir, 0)]
+        with self._db:
+            while pending:
+                path, depth = pending.pop()
+                visited.add(str(path))
+                for entry in self._listing(_NFS, path) or []:
+                    if entry.is_dir and depth < NFS_MAX_RECURSION_DEPTH:
+                        pending.append((path / entry.name, depth + 1))
+            self._forget_unvisited(_NFS, visited)
+
+    def symlinks_to(self, image_stem: str) -> list[Path]:
+        """NFS symlinks (as of the last refresh_symlinks) pointing into the image with the given filename stem."""
+        return sorted(
+            Path(directory) / name
+            for directory, name in self._db.execute(
+                "SELECT dir, name FROM entries WHERE tree = ? AND image_stem = ?", (_NFS, image_stem)
+            )
+        )
+
+    def symlinks_into_mount(self) -> Iterator[tuple[Path, str]]:
+        """All (symlink, target) pairs (as of the last refresh_symlinks) pointing into the CEFS mount point."""
+        for directory, name, target in self._db.execute(
+            "SELECT dir, name, target FROM entries WHERE tree = ? AND image_stem IS NOT NULL", (_NFS,)
+        ):
+            yield Path(directory) / name, target
+
+    def _indexed_manifest(self, image_path: Path, manifest_stat: os.stat_result) -> tuple[bool, dict[str, Any] | None]:
+        """(Whether the index has the manifest as it is now, and if so the manifest)."""
+        row = self._db.execute(
+            "SELECT mtime_ns, size, manifest FROM manifests WHERE image_path = ?", (str(image_path),)
+        ).fetchone()
+        if (
+            row is not None
+            and (row[0], row[1]) == (manifest_stat.st_mtime_ns, manifest_stat.st_size)
+            and not self._is_racy(manifest_stat.st_mtime_ns)
+        ):
+            return True, json.loads(row[2])
+        return False, None
+
+    def read_manifests(
+        self, image_paths: list[Path], timings: ManifestLoadTimings | None = None
+    ) -> list[dict[str, Any] | None]:
+        """As read_manifest for each image, reading those that have changed with read_manifests_from_alongside."""
+        manifests: list[dict[str, Any] | None] = [None] * len(image_paths)
+        to_read: list[tuple[int, os.stat_result]] = []
+        for position, image_path in enumerate(image_paths):
+            try:
+                manifest_stat = image_path.with_suffix(".yaml").stat()
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                _LOGGER.warning("Failed to read manifest for %s: %s", image_path, e)
+                continue
+            indexed, manifest = self._indexed_manifest(image_path, manifest_stat)
+            if indexed:
+                manifests[position] = manifest
+            else:
+                to_read.append((position, manifest_stat))
+
+        self.manifests_reused += len(image_paths) - len(to_read)
+        self.manifests_parsed += len(to_read)
+        read = read_manifests_from_alongside([image_paths[position] for position, _ in to_read], timings=timings)
+        with self._db:
+            for (position, manifest_stat), manifest in zip(to_read, read, strict=True):
+                self._db.execute(
+                    "INSERT OR REPLACE INTO manifests (image_path, mtime_ns, size, manifest) VALUES (?, ?, ?, ?)",
+                    (
+                        str(image_paths[position]),
+                        manifest_stat.st_mtime_ns,
+                        manifest_stat.st_size,
+                        json.dumps(manifest, default=str),
+                    ),
+                )
+                manifests[position] = manifest
+        return manifests
+
+    def read_manifest(self, image_path: Path) -> dict[str, Any] | None:
+        """As read_manifest_from_alongside, but reusing the previously parsed manifest if it hasn't changed."""
+        return self.read_manifests([image_path])[0]
+
+    def uncompressed_sizes(self, image_path: Path, image_stat: os.stat_result) -> dict[str, int]:
+        """The extracted sizes stored for paths within an image by store_uncompressed_sizes, if it hasn't changed since.
+
+        Returns:
+            Size by path within the image ("." for the whole image)
+        """
+        return {
+            path_in_image: size
+            for path_in_image, size in self._db.execute(
+                "SELECT path_in_image, size FROM uncompressed_sizes"
+                " WHERE image_path = ? AND image_mtime_ns = ? AND image_size = ?",
+                (str(image_path), image_stat.st_mtime_ns, image_stat.st_size),
+            )
+        }
+
+    def store_uncompressed_sizes(self, image_path: Path, image_stat: os.stat_result, sizes: dict[str, int]) -> None:
+        """Store extracted sizes of paths within an image, as of image_stat."""
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO uncompressed_sizes"
+                " (image_path, path_in_image, image_mtime_ns, image_size, size) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (str(image_path), path_in_image, image_stat.st_mtime_ns, image_stat.st_size, size)
+                    for path_in_image, size in sizes.items()
+                ],
+            )
+
+    def use_fsck_validator(self, version: str) -> None:
+        """Discard the stored fsck results if they were found by a different version of the validation code."""
+        existing = self._db.execute("SELECT value FROM meta WHERE key = 'fsck_validator'").fetchone()
+        if existing is not None and existing[0] == version:
+            return
+        if existing is not None:
+            _LOGGER.info("Manifest validation has changed since the last fsck; revalidating all manifests")
+        with self._db:
+            self._db.execute("DELETE FROM fsck_results")
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fsck_validator', ?)", (version,))
+
+    def fsck_result(self, manifest_path: Path, manifest_stat: os.stat_result) -> tuple[str | None, str | None] | None:
+        """The (error type, message) stored for a manifest by store_fsck_result, if it hasn't changed since."""
+        row = self._db.execute(
+            "SELECT mtime_ns, size, inode, error_type, message FROM fsck_results WHERE manifest_path = ?",
+            (str(manifest_path),),
+        ).fetchone()
+        if (
+            row is None
+            or tuple(row[:3]) != (manifest_stat.st_mtime_ns, manifest_stat.st_size, manifest_stat.st_ino)
+            or self._is_racy(manifest_stat.st_mtime_ns)
+        ):
+            return None
+        self.fsck_results_reused += 1
+        return row[3], row[4]
+
+    def store_fsck_result(
+        self, manifest_path: Path, manifest_stat: os.stat_result, error_type: str | None, message: str | None
+    ) -> None:
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO fsck_results (manifest_path, mtime_ns, size, inode, error_type, message)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    str(manifest_path),
+                    manifest_stat.st_mtime_ns,
+                    manifest_stat.st_size,
+                    manifest_stat.st_ino,
+                    error_type,
+                    message,
+                ),
+            )
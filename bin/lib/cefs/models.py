@@ -17,6 +17,34 @@ class ConsolidationCandidate:
     size: int
     extraction_path: Path | None = None
     from_reconsolidation: bool = False
+    extracted_size: int | None = None  # Size once extracted, where known (see estimate_extracted_sizes)
+
+
+@dataclass(frozen=True)
+class PackingPlan:
+    """How a packing strategy would group consolidation candidates."""
+
+    strategy: str
+    groups: list[list[ConsolidationCandidate]]
+    max_size_bytes: int
+    temp_space: int  # temp space needed by the group needing the most (see group_temp_space)
+    mounts_before: int  # distinct images the candidates are mounted from now
+    mounts_after: int  # consolidated images, plus images of candidates left out of every group
+
+    @property
+    def image_count(self) -> int:
+        return len(self.groups)
+
+    @property
+    def packed_size(self) -> int:
+        return sum(item.size for group in self.groups for item in group)
+
+    @property
+    def fill_ratio(self) -> float:
+        """How full the consolidated images are on average, as a fraction of the maximum image size."""
+        if not self.groups:
+            return 0.0
+        return self.packed_size / (self.image_count * self.max_size_bytes)
 
 
 @dataclass(frozen=True)
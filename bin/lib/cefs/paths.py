@@ -6,6 +6,7 @@ from __future__ import annotations
 import hashlib
 import logging
 import os
+import threading
 from dataclasses import dataclass
 from fnmatch import fnmatch
 from pathlib import Path
@@ -75,15 +76,34 @@ def get_cefs_paths(image_dir: Path, mount_point: Path, filename: str) -> CEFSPat
     )
 
 
+# The full SHA256 of each image hashed so far, by the identity of its content: repeat checks within a run (e.g. fsck
+# hashing an image convert has just hashed) needn't reread multi-GB files.
+_IMAGE_HASHES: dict[tuple[int, int, int, int], str] = {}
+_IMAGE_HASHES_LOCK = threading.Lock()
+
+
+def _content_key(stat: os.stat_result) -> tuple[int, int, int, int]:
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
 def calculate_squashfs_hash(squashfs_path: Path) -> str:
-    """Calculate SHA256 hash of squashfs image using Python hashlib."""
-    sha256_hash = hashlib.sha256()
-    file_size = squashfs_path.stat().st_size
-    _LOGGER.debug("Calculating hash for %s (size: %d bytes)", squashfs_path, file_size)
-    with open(squashfs_path, "rb") as f:
-        for chunk in iter(lambda: f.read(16 * 1024 * 1024), b""):
-            sha256_hash.update(chunk)
-    full_hash = sha256_hash.hexdigest()
+    """Calculate SHA256 hash of squashfs image using Python hashlib.
+
+    The result is remembered by the image's device, inode, size and mtime, so hashing the same unchanged image again
+    is free. Hashing releases the GIL, so several images can be hashed at once on threads.
+    """
+    key = _content_key(squashfs_path.stat())
+    with _IMAGE_HASHES_LOCK:
+        full_hash = _IMAGE_HASHES.get(key)
+    if full_hash is None:
+        _LOGGER.debug("Calculating hash for %s (size: %d bytes)", squashfs_path, key[2])
+        with open(squashfs_path, "rb") as f:
+            # Reads into one reused buffer, rather than allocating a new bytes object for every chunk
+            full_hash = hashlib.file_digest(f, "sha256").hexdigest()
+        # Only remember it if the image wasn't replaced or modified while we read it
+        if _content_key(squashfs_path.stat()) == key:
+            with _IMAGE_HASHES_LOCK:
+                _IMAGE_HASHES[key] = full_hash
     truncated_hash = full_hash[:24]
     _LOGGER.debug("Hash for %s: full=%s, truncated=%s", squashfs_path, full_hash, truncated_hash)
     return truncated_hash
@@ -245,6 +265,25 @@ def get_extraction_path_from_symlink(symlink_target: Path, mount_point: Path) ->
     return Path(*relative_parts)
 
 
+def get_image_stem_from_symlink(symlink_target: Path, mount_point: Path) -> str | None:
+    """Get the filename stem of the CEFS image a symlink target points into.
+
+    Args:
+        symlink_target: The symlink target path
+        mount_point: CEFS mount point (e.g., /cefs)
+
+    Examples (assuming mount_point=/cefs):
+        /cefs/ab/abcd1234567890abcdef12_gcc → "abcd1234567890abcdef12_gcc"
+        /cefs/ab/abcd1234567890abcdef12_libs/libs/boost → "abcd1234567890abcdef12_libs"
+        /opt/compiler-explorer/gcc-4.5 → None
+    """
+    parts = symlink_target.parts
+    mount_parts = mount_point.parts
+    if len(parts) < len(mount_parts) + 2 or parts[: len(mount_parts)] != mount_parts:
+        return None
+    return parts[len(mount_parts) + 1]
+
+
 def describe_cefs_image(filename: str, cefs_mount_point: Path) -> list[str]:
     """Get top-level entries from a CEFS image by triggering autofs mount.
 
@@ -317,3 +356,44 @@ def glob_with_depth(base_dir: Path, pattern: str, max_depth: int | None = None):
 
         yield from (root_path / f for f in files if fnmatch(f, pattern))
         yield from (root_path / d for d in dirs if fnmatch(d, pattern))
+
+
+def map_symlinks_to_images(
+    base_dir: Path, mount_point: Path, max_depth: int | None = None
+) -> tuple[dict[str, list[Path]], list[Path]]:
+    """Map each CEFS image to the symlinks under base_dir pointing into it, in a single walk.
+
+    Walks like glob_with_depth (not following symlinks, down to max_depth), so it finds the same symlinks as checking
+    every path it would yield, including .bak symlinks.
+
+    Args:
+        base_dir: Directory to search in
+        mount_point: CEFS mount point (e.g., /cefs)
+        max_depth: Maximum directory depth (0-based). None for unlimited.
+
+    Returns:
+        Tuple of (image filename stem -> symlinks pointing into it, symlinks whose target couldn't be read)
+    """
+    by_image: dict[str, list[Path]] = {}
+    unreadable: list[Path] = []
+    pending = [(base_dir, 0)]
+    while pending:
+        directory, depth = pending.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            continue  # as os.walk does
+        for entry in entries:
+            if entry.is_symlink():
+                try:
+                    target = Path(os.readlink(entry.path))
+                except OSError:
+                    unreadable.append(Path(entry.path))
+                    continue
+                image_stem = get_image_stem_from_symlink(target, mount_point)
+                if image_stem is not None:
+                    by_image.setdefault(image_stem, []).append(Path(entry.path))
+            elif entry.is_dir(follow_symlinks=False) and (max_depth is None or depth < max_depth):
+                pending.append((Path(entry.path), depth + 1))
+    return by_image, unreadable
@@ -4,6 +4,8 @@
 from __future__ import annotations
 
 import logging
+import time
+from collections.abc import Iterable
 from pathlib import Path
 
 import humanfriendly
@@ -15,9 +17,14 @@ from lib.cefs.consolidation import (
 )
 from lib.cefs.constants import NFS_MAX_RECURSION_DEPTH
 from lib.cefs.gc import GCSummary
+from lib.cefs.index import CEFSIndex
 from lib.cefs.models import ConsolidationCandidate, ImageUsageStats
-from lib.cefs.paths import glob_with_depth
-from lib.cefs_manifest import read_manifest_from_alongside
+from lib.cefs.paths import get_image_stem_from_symlink, map_symlinks_to_images
+from lib.cefs_manifest import (
+    ManifestLoadTimings,
+    read_manifest_from_alongside,
+    read_manifests_from_alongside,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -25,22 +32,46 @@ _LOGGER = logging.getLogger(__name__)
 class CEFSState:
     """Track CEFS images and their references for garbage collection using manifests."""
 
-    def __init__(self, nfs_dir: Path, cefs_image_dir: Path, mount_point: Path):
+    def __init__(self, nfs_dir: Path, cefs_image_dir: Path, mount_point: Path, index: CEFSIndex | None = None):
         """Initialize CEFS state tracker.
 
         Args:
             nfs_dir: Base NFS directory (e.g., /opt/compiler-explorer)
             cefs_image_dir: CEFS images directory (e.g., /efs/cefs-images)
             mount_point: CEFS mount point (e.g., /cefs)
+            index: Optional persistent index to avoid rescanning unchanged directories and manifests
         """
         self.nfs_dir = nfs_dir
         self.cefs_image_dir = cefs_image_dir
         self.mount_point = mount_point
+        self.index = index
         self.all_cefs_images: dict[str, Path] = {}  # filename_stem -> image_path
         self.image_references: dict[str, list[Path]] = {}  # filename_stem -> list of expected symlink destinations
         self.referenced_images: set[str] = set()  # Set of filename_stems that have valid symlinks
         self.inprogress_images: list[Path] = []  # List of .yaml.inprogress files found
         self.broken_images: list[Path] = []  # Images without .yaml or .yaml.inprogress
+        self.image_sizes: dict[Path, int] = {}  # image_path -> size, where known from the index
+        self._symlinks_indexed = False
+        self._symlink_map: tuple[dict[str, list[Path]], list[Path]] | None = None
+
+    def _list_image_subdirs(self) -> dict[Path, dict[str, int | None]]:
+        if self.index is not None:
+            return self.index.image_subdirs()
+        return {
+            subdir: {child.name: None for child in subdir.iterdir()}
+            for subdir in self.cefs_image_dir.iterdir()
+            if subdir.is_dir()
+        }
+
+    def _read_manifests(self, image_paths: list[Path], timings: ManifestLoadTimings) -> list[dict | None]:
+        if self.index is not None:
+            return self.index.read_manifests(image_paths, timings)
+        return read_manifests_from_alongside(image_paths, timings=timings)
+
+    def _image_size(self, image_path: Path) -> int:
+        if image_path in self.image_sizes:
+            return self.image_sizes[image_path]
+        return image_path.stat().st_size
 
     def scan_cefs_images_with_manifests(self) -> None:
         """Scan all CEFS images and read their manifests to determine expected references.
@@ -51,29 +82,34 @@ class CEFSState:
             _LOGGER.warning("CEFS images directory does not exist: %s", self.cefs_image_dir)
             return
 
-        for subdir in self.cefs_image_dir.iterdir():
-            if not subdir.is_dir():
-                continue
-
+        timings = ManifestLoadTimings()
+        start = time.perf_counter()
+        to_read: list[tuple[str, Path]] = []
+        for subdir, files in self._list_image_subdirs().items():
             # First check for .yaml.inprogress files (incomplete operations)
-            for inprogress_file in subdir.glob("*.yaml.inprogress"):
-                self.inprogress_images.append(inprogress_file)
-                _LOGGER.warning("Found in-progress manifest: %s", inprogress_file)
-
-            for image_file in subdir.glob("*.sqfs"):
+            for name in sorted(files):
+                if name.endswith(".yaml.inprogress"):
+                    inprogress_file = subdir / name
+                    self.inprogress_images.append(inprogress_file)
+                    _LOGGER.warning("Found in-progress manifest: %s", inprogress_file)
+
+            for name in sorted(files):
+                if not name.endswith(".sqfs"):
+                    continue
+                image_file = subdir / name
                 filename_stem = image_file.stem
+                if (size := files[name]) is not None:
+                    self.image_sizes[image_file] = size
 
                 # SAFETY: Check if this image has an .yaml.inprogress file indicating incomplete operation
                 # This prevents deletion of images that are being installed/converted/consolidated
                 # even if the operation is taking a long time or has failed partway through
-                inprogress_path = Path(str(image_file.with_suffix(".yaml")) + ".inprogress")
-                if inprogress_path.exists():
+                if f"{filename_stem}.yaml.inprogress" in files:
                     _LOGGER.info("Skipping image with in-progress operation: %s", image_file)
                     self.referenced_images.add(filename_stem)
                     continue
 
-                manifest_path = image_file.with_suffix(".yaml")
-                if not manifest_path.exists():
+                if f"{filename_stem}.yaml" not in files:
                     self.broken_images.append(image_file)
                     _LOGGER.error(
                         "BROKEN IMAGE: %s has no manifest or inprogress marker - needs investigation", image_file
@@ -81,23 +117,21 @@ class CEFSState:
                     continue
 
                 self.all_cefs_images[filename_stem] = image_file
-
-                try:
-                    manifest = read_manifest_from_alongside(image_file)
-                except OSError as e:
-                    _LOGGER.warning("Failed to read manifest for %s: %s", image_file, e)
-                    self.image_references[filename_stem] = []
-                    continue
-
-                if manifest and "contents" in manifest:
-                    destinations = [
-                        Path(content["destination"]) for content in manifest["contents"] if "destination" in content
-                    ]
-                    self.image_references[filename_stem] = destinations
-                    _LOGGER.debug("Image %s expects %d symlinks", filename_stem, len(destinations))
-                else:
-                    self.image_references[filename_stem] = []
-                    _LOGGER.warning("Manifest for %s has no contents", filename_stem)
+                to_read.append((filename_stem, image_file))
+        timings.listing = time.perf_counter() - start
+
+        manifests = self._read_manifests([image_file for _, image_file in to_read], timings)
+        for (filename_stem, _), manifest in zip(to_read, manifests, strict=True):
+            if manifest and "contents" in manifest:
+                destinations = [
+                    Path(content["destination"]) for content in manifest["contents"] if "destination" in content
+                ]
+                self.image_references[filename_stem] = destinations
+                _LOGGER.debug("Image %s expects %d symlinks", filename_stem, len(destinations))
+            else:
+                self.image_references[filename_stem] = []
+                _LOGGER.warning("Manifest for %s has no contents", filename_stem)
+        timings.log()
 
     def check_symlink_references(self, include_broken: bool = False) -> None:
         """Check if expected symlinks exist and point to the correct CEFS images.
@@ -160,6 +194,23 @@ class CEFSState:
 
         return False
 
+    def symlink_candidates(self, filename_stem: str) -> Iterable[Path]:
+        """Paths in NFS that might be symlinks to the given CEFS image; callers must check them.
+
+        With an index, these are the symlinks it knows point into the image. Otherwise NFS is walked (down to
+        NFS_MAX_RECURSION_DEPTH) once, on first use, to map every image to its symlinks; symlinks that couldn't be read
+        are candidates for every image.
+        """
+        if self.index is None:
+            if self._symlink_map is None:
+                self._symlink_map = map_symlinks_to_images(self.nfs_dir, self.mount_point, NFS_MAX_RECURSION_DEPTH)
+            by_image, unreadable = self._symlink_map
+            return by_image.get(filename_stem, []) + unreadable
+        if not self._symlinks_indexed:
+            self.index.refresh_symlinks()
+            self._symlinks_indexed = True
+        return self.index.symlinks_to(filename_stem)
+
     def _find_symlinks_to_image(self, filename_stem: str) -> bool:
         """Find any symlinks in NFS that point to a CEFS image.
 
@@ -172,7 +223,7 @@ class CEFSState:
         Returns:
             True if any symlink points to this image
         """
-        for path in glob_with_depth(self.nfs_dir, "*", NFS_MAX_RECURSION_DEPTH):
+        for path in self.symlink_candidates(filename_stem):
             if self._check_single_symlink(path, filename_stem):
                 return True
 
@@ -199,19 +250,8 @@ class CEFSState:
             )
             return True  # When in doubt, keep the image
 
-        if not str(target).startswith(str(self.mount_point) + "/"):
-            return False
-
-        # Extract the hash/filename from the symlink target
         # Format: {mount_point}/XX/HASH_suffix or {mount_point}/XX/HASH_suffix/subdir
-        target_parts = Path(target).parts
-        mount_parts = self.mount_point.parts
-        if len(target_parts) < len(mount_parts) + 2:
-            return False
-
-        # The filename part is at the position after mount_point + XX
-        target_filename = target_parts[len(mount_parts) + 1]
-        if target_filename == filename_stem:
+        if get_image_stem_from_symlink(target, self.mount_point) == filename_stem:
             _LOGGER.debug("Found valid symlink: %s -> %s", symlink_path, target)
             return True
         return False
@@ -259,7 +299,7 @@ class CEFSState:
 
         for image_path in unreferenced_images:
             try:
-                space_to_reclaim += image_path.stat().st_size
+                space_to_reclaim += self._image_size(image_path)
             except OSError:
                 _LOGGER.warning("Could not stat unreferenced image: %s", image_path)
 
@@ -286,7 +326,7 @@ class CEFSState:
 
         for _filename_stem, image_path in self.all_cefs_images.items():
             try:
-                size = image_path.stat().st_size
+                size = self._image_size(image_path)
                 total_space += size
             except OSError:
                 size = 0
@@ -336,7 +376,7 @@ class CEFSState:
         usage = calculate_image_usage(image_path, self.image_references, self.mount_point)
 
         try:
-            size = image_path.stat().st_size
+            size = self._image_size(image_path)
         except OSError:
             return None
 
@@ -428,7 +468,7 @@ class CEFSState:
 
         def _is_small_image(im_path: Path) -> bool:
             try:
-                return im_path.stat().st_size < size_threshold
+                return self._image_size(im_path) < size_threshold
             except OSError:
                 return False
 
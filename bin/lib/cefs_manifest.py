@@ -4,9 +4,14 @@
 from __future__ import annotations
 
 import datetime
+import json
 import logging
+import os
 import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from functools import lru_cache
 from pathlib import Path
 from typing import Any
@@ -276,8 +281,109 @@ def write_manifest_alongside_image(manifest: dict[str, Any], image_path: Path) -
     _LOGGER.debug("Writing manifest alongside image: %s", manifest_path)
     manifest_path.parent.mkdir(parents=True, exist_ok=True)
 
-    with open(manifest_path, "w", encoding="utf-8") as f:
+    # Write and rename, as the manifest may be being replaced while others read it
+    temp_path = manifest_path.with_name(f"{manifest_path.name}.{os.getpid()}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
         yaml.dump(manifest, f, default_flow_style=False, sort_keys=False)
+    # The rename keeps the size and mtime, so the sidecar can be tied to the manifest before anyone else can see it
+    manifest_stat = temp_path.stat()
+    temp_path.replace(manifest_path)
+    _write_sidecar(manifest, image_path, manifest_stat)
+
+
+# The sidecar is a JSON copy of the YAML manifest: it parses an order of magnitude faster, even with libyaml. The YAML
+# is still the source of truth; the sidecar records the size and mtime of the YAML it was made from, and is ignored
+# unless the YAML still matches, so anything rewriting the YAML without updating the sidecar is safe.
+MANIFEST_SIDECAR_SUFFIX = ".manifest.json"
+MANIFEST_SIDECAR_FORMAT = 1
+
+
+def get_sidecar_path(image_path: Path) -> Path:
+    return image_path.with_suffix(MANIFEST_SIDECAR_SUFFIX)
+
+
+def _write_sidecar(manifest: dict[str, Any], image_path: Path, manifest_stat: os.stat_result) -> bool:
+    sidecar_path = get_sidecar_path(image_path)
+    try:
+        content = json.dumps(
+            {
+                "format": MANIFEST_SIDECAR_FORMAT,
+                "yaml_size": manifest_stat.st_size,
+                "yaml_mtime_ns": manifest_stat.st_mtime_ns,
+                "manifest": manifest,
+            },
+            separators=(",", ":"),
+        )
+    except (TypeError, ValueError) as e:
+        # e.g. an old hand-written manifest with an unquoted timestamp, which YAML loads as a datetime
+        _LOGGER.warning("Not writing manifest sidecar for %s: %s", image_path, e)
+        return False
+    temp_path = sidecar_path.with_name(f"{sidecar_path.name}.{os.getpid()}.tmp")
+    try:
+        temp_path.write_text(content, encoding="utf-8")
+        temp_path.replace(sidecar_path)
+    except OSError as e:
+        _LOGGER.warning("Failed to write manifest sidecar %s: %s", sidecar_path, e)
+        temp_path.unlink(missing_ok=True)
+        return False
+    return True
+
+
+def _stat_key(stat: os.stat_result) -> tuple[int, int, int]:
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def write_manifest_sidecar(image_path: Path) -> bool:
+    """Write the JSON sidecar for the .yaml manifest alongside a CEFS image.
+
+    Args:
+        image_path: Path to the .sqfs image file
+
+    Returns:
+        True if the sidecar was written
+    """
+    manifest_path = image_path.with_suffix(".yaml")
+    try:
+        manifest_stat = manifest_path.stat()
+        manifest = yaml.load(manifest_path.read_bytes(), Loader=_SAFE_LOADER)  # noqa: S506 (a safe loader)
+        if _stat_key(manifest_path.stat()) != _stat_key(manifest_stat):
+            _LOGGER.warning("Manifest %s changed while reading it, not writing sidecar", manifest_path)
+            return False
+    except (OSError, yaml.YAMLError) as e:
+        _LOGGER.warning("Cannot write manifest sidecar for %s: %s", image_path, e)
+        return False
+    return _write_sidecar(manifest, image_path, manifest_stat)
+
+
+def _sidecar_manifest(content: bytes, manifest_stat: os.stat_result) -> dict[str, Any] | None:
+    """The manifest from a sidecar's content, or None if it doesn't match the YAML manifest."""
+    try:
+        sidecar = json.loads(content)
+    except ValueError:
+        return None
+    if (
+        not isinstance(sidecar, dict)
+        or sidecar.get("format") != MANIFEST_SIDECAR_FORMAT
+        or sidecar.get("yaml_size") != manifest_stat.st_size
+        or sidecar.get("yaml_mtime_ns") != manifest_stat.st_mtime_ns
+    ):
+        return None
+    return sidecar.get("manifest")
+
+
+def sidecar_is_current(image_path: Path) -> bool:
+    """Whether the image's manifest sidecar exists and matches its .yaml manifest."""
+    try:
+        manifest_stat = image_path.with_suffix(".yaml").stat()
+        content = get_sidecar_path(image_path).read_bytes()
+    except OSError:
+        return False
+    return _sidecar_manifest(content, manifest_stat) is not None
+
+
+def get_inprogress_manifest_path(image_path: Path) -> Path:
+    """The .yaml.inprogress manifest marking an incomplete operation on an image."""
+    return Path(str(image_path.with_suffix(".yaml")) + ".inprogress")
 
 
 def write_manifest_inprogress(manifest: dict[str, Any], image_path: Path) -> None:
@@ -290,7 +396,7 @@ def write_manifest_inprogress(manifest: dict[str, Any], image_path: Path) -> Non
         manifest: Manifest dictionary
         image_path: Path to the .sqfs image file
     """
-    inprogress_path = Path(str(image_path.with_suffix(".yaml")) + ".inprogress")
+    inprogress_path = get_inprogress_manifest_path(image_path)
 
     _LOGGER.debug("Writing in-progress manifest: %s", inprogress_path)
     inprogress_path.parent.mkdir(parents=True, exist_ok=True)
@@ -312,7 +418,7 @@ def finalize_manifest(image_path: Path) -> None:
         FileNotFoundError: If .yaml.inprogress file doesn't exist
         OSError: If rename fails
     """
-    inprogress_path = Path(str(image_path.with_suffix(".yaml")) + ".inprogress")
+    inprogress_path = get_inprogress_manifest_path(image_path)
     final_path = image_path.with_suffix(".yaml")
 
     if not inprogress_path.exists():
@@ -320,6 +426,7 @@ def finalize_manifest(image_path: Path) -> None:
 
     _LOGGER.debug("Finalizing manifest: %s -> %s", inprogress_path, final_path)
     inprogress_path.rename(final_path)
+    write_manifest_sidecar(image_path)
 
 
 def validate_manifest(manifest_dict: dict[str, Any]) -> CEFSManifest:
@@ -344,25 +451,69 @@ def validate_manifest(manifest_dict: dict[str, Any]) -> CEFSManifest:
         raise ValueError(f"Invalid manifest: {e}") from e
 
 
-def read_manifest_from_alongside(image_path: Path) -> dict[str, Any] | None:
-    """Read manifest from the .yaml file alongside a CEFS image.
+# libyaml's loader is several times faster than the pure-Python one, and builds the same objects.
+_SAFE_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+@dataclass
+class ManifestLoadTimings:
+    """Where the time went loading manifests; reading, parsing and validating are summed across threads."""
+
+    manifests: int = 0
+    sidecars: int = 0
+    listing: float = 0.0
+    reading: float = 0.0
+    parsing: float = 0.0
+    validating: float = 0.0
+
+    def add(self, other: ManifestLoadTimings) -> None:
+        self.manifests += other.manifests
+        self.sidecars += other.sidecars
+        self.reading += other.reading
+        self.parsing += other.parsing
+        self.validating += other.validating
+
+    def log(self) -> None:
+        _LOGGER.info(
+            "Loaded %d manifests (%d from sidecars): listing %.2fs, reading %.2fs, parsing %.2fs, validating %.2fs",
+            self.manifests,
+            self.sidecars,
+            self.listing,
+            self.reading,
+            self.parsing,
+            self.validating,
+        )
 
-    Args:
-        image_path: Path to the .sqfs image file
 
-    Returns:
-        Manifest dictionary or None if not found/invalid
-    """
+def _load_manifest(image_path: Path, timings: ManifestLoadTimings) -> dict[str, Any] | None:
     manifest_path = image_path.with_suffix(".yaml")
-
-    if not manifest_path.exists():
-        return None
-
     try:
-        with manifest_path.open(encoding="utf-8") as f:
-            manifest_dict = yaml.safe_load(f)
-
-        validate_manifest(manifest_dict)
+        start = time.perf_counter()
+        try:
+            manifest_stat = manifest_path.stat()
+        except FileNotFoundError:
+            return None
+        timings.manifests += 1
+        try:
+            sidecar = get_sidecar_path(image_path).read_bytes()
+        except FileNotFoundError:
+            sidecar = None
+        read = time.perf_counter()
+        timings.reading += read - start
+        manifest_dict = _sidecar_manifest(sidecar, manifest_stat) if sidecar is not None else None
+        if manifest_dict is not None:
+            timings.sidecars += 1
+        else:
+            text = manifest_path.read_bytes()
+            timings.reading += time.perf_counter() - read
+            read = time.perf_counter()
+            manifest_dict = yaml.load(text, Loader=_SAFE_LOADER)  # noqa: S506 (a safe loader)
+        parsed = time.perf_counter()
+        timings.parsing += parsed - read
+        try:
+            validate_manifest(manifest_dict)
+        finally:
+            timings.validating += time.perf_counter() - parsed
         return manifest_dict
     except ValueError as e:
         _LOGGER.error("Invalid manifest in %s: %s", manifest_path, e)
@@ -375,6 +526,67 @@ def read_manifest_from_alongside(image_path: Path) -> dict[str, Any] | None:
         return None
 
 
+def load_manifest_unvalidated(manifest_path: Path) -> Any:
+    """Load the .yaml manifest at manifest_path, from its sidecar if that's up to date, without validating it.
+
+    Raises:
+        OSError: If the manifest can't be read
+        yaml.YAMLError: If the manifest isn't valid YAML
+    """
+    manifest_stat = manifest_path.stat()
+    try:
+        sidecar = get_sidecar_path(manifest_path).read_bytes()
+    except FileNotFoundError:
+        sidecar = None
+    if sidecar is not None and (manifest_dict := _sidecar_manifest(sidecar, manifest_stat)) is not None:
+        return manifest_dict
+    return yaml.load(manifest_path.read_bytes(), Loader=_SAFE_LOADER)  # noqa: S506 (a safe loader)
+
+
+def read_manifest_from_alongside(image_path: Path) -> dict[str, Any] | None:
+    """Read manifest from the .yaml file alongside a CEFS image, or from its sidecar if that's up to date.
+
+    Args:
+        image_path: Path to the .sqfs image file
+
+    Returns:
+        Manifest dictionary or None if not found/invalid
+    """
+    return _load_manifest(image_path, ManifestLoadTimings())
+
+
+def read_manifests_from_alongside(
+    image_paths: list[Path], max_workers: int | None = None, timings: ManifestLoadTimings | None = None
+) -> list[dict[str, Any] | None]:
+    """As read_manifest_from_alongside for each image, reading up to max_workers manifests at once.
+
+    Manifests are small, so reading them is mostly waiting on NFS round trips: many threads hide that latency, even
+    though parsing and validating are limited by the GIL.
+
+    Args:
+        image_paths: Paths to the .sqfs image files
+        max_workers: Maximum number of manifests to read at once (default 32)
+        timings: If given, the time spent reading, parsing and validating is added to it
+
+    Returns:
+        The manifests, in the same order as image_paths
+    """
+
+    def load(image_path: Path) -> tuple[dict[str, Any] | None, ManifestLoadTimings]:
+        worker_timings = ManifestLoadTimings()
+        return _load_manifest(image_path, worker_timings), worker_timings
+
+    if not image_paths:
+        return []
+    manifests = []
+    with ThreadPoolExecutor(max_workers=max_workers or 32, thread_name_prefix="manifest") as executor:
+        for manifest, worker_timings in executor.map(load, image_paths):
+            manifests.append(manifest)
+            if timings is not None:
+                timings.add(worker_timings)
+    return manifests
+
+
 def create_installable_manifest_entry(installable_name: str, destination_path: Path) -> dict[str, str]:
     """Create manifest entry from installable information.
 
@@ -0,0 +1,114 @@
+"""Persistent cache of successful installation checks.
+
+Checking whether a target is installed usually means running its `check_exe` (possibly via sudo), which is slow to do
+for thousands of targets. Successful checks are remembered along with the checked executable's mtime and size and
+the target of the installation's symlink (if any, as with CEFS), and reused while those are unchanged. Anything that
+changes an installation in place should `invalidate` it.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Any
+
+_LOGGER = logging.getLogger(__name__)
+
+_CACHE_VERSION = 1
+
+
+class CheckResultCache:
+    """Thread-safe store of passed installation checks, keyed by the absolute path of the checked executable."""
+
+    def __init__(self, cache_file: Path | None):
+        self.cache_file = cache_file
+        self.hits = 0
+        self.misses = 0
+        self._entries: dict[str, dict[str, Any]] | None = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict[str, dict[str, Any]]:
+        if self._entries is None:
+            self._entries = {}
+            if self.cache_file is not None:
+                try:
+                    data = json.loads(self.cache_file.read_text(encoding="utf-8"))
+                    if data.get("version") == _CACHE_VERSION:
+                        self._entries = data["entries"]
+                except FileNotFoundError:
+                    pass
+                except (OSError, ValueError, KeyError, AttributeError) as e:
+                    _LOGGER.debug("Ignoring unreadable check cache %s: %s", self.cache_file, e)
+        return self._entries
+
+    @staticmethod
+    def signature(exe: Path, install_dir: Path, check: list[str], env: dict[str, str]) -> dict[str, Any] | None:
+        """What a cached check result is only valid for; None if the executable can't be looked at."""
+        try:
+            exe_stat = exe.stat()
+            link = os.readlink(install_dir) if install_dir.is_symlink() else ""
+        except OSError:
+            return None
+        return {
+            "check": list(check),
+            "env": dict(sorted(env.items())),
+            "mtime_ns": exe_stat.st_mtime_ns,
+            "size": exe_stat.st_size,
+            "link": link,
+        }
+
+    def passed(self, exe: Path, install_dir: Path, check: list[str], env: dict[str, str]) -> bool:
+        """Whether `check` is known to have passed for `exe` as it is now."""
+        if self.cache_file is None:
+            return False
+        signature = self.signature(exe, install_dir, check, env)
+        with self._lock:
+            hit = signature is not None and self._load().get(str(exe)) == signature
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return hit
+
+    def record_pass(self, exe: Path, install_dir: Path, check: list[str], env: dict[str, str]) -> None:
+        if self.cache_file is None:
+            return
+        signature = self.signature(exe, install_dir, check, env)
+        if signature is None:
+            return
+        with self._lock:
+            self._load()[str(exe)] = signature
+            self._dirty = True
+
+    def invalidate(self, path: Path) -> None:
+        """Forget every check result for executables at or under `path`."""
+        prefix = str(path).rstrip("/")
+        with self._lock:
+            entries = self._load()
+            stale = [key for key in entries if key == prefix or key.startswith(prefix + "/")]
+            for key in stale:
+                del entries[key]
+            if stale:
+                _LOGGER.debug("Invalidated %d cached checks under %s", len(stale), path)
+                self._dirty = True
+
+    def save(self) -> None:
+        if self.cache_file is None:
+            return
+        with self._lock:
+            if not self._dirty or self._entries is None:
+                return
+            serialised = json.dumps({"version": _CACHE_VERSION, "entries": self._entries})
+            self._dirty = False
+        try:
+            temp_file = self.cache_file.with_name(f"{self.cache_file.name}.{uuid.uuid4()}.tmp")
+            temp_file.write_text(serialised, encoding="utf-8")
+            temp_file.replace(self.cache_file)
+        except OSError as e:
+            _LOGGER.warning("Unable to save check cache %s: %s", self.cache_file, e)
+        _LOGGER.debug("Check cache: %d hits, %d misses", self.hits, self.misses)
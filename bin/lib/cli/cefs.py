@@ -5,10 +5,14 @@ from __future__ import annotations
 
 import datetime
 import logging
+import multiprocessing
 import shutil
 import subprocess
 import sys
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 
 import click
@@ -16,14 +20,20 @@ import humanfriendly
 
 from lib.ce_install import CliContext, cli
 from lib.cefs.consolidation import (
+    BEST_FIT_DECREASING,
+    PACKING_STRATEGIES,
     ConsolidationCandidate,
+    estimate_extracted_sizes,
+    group_temp_space,
     pack_items_into_groups,
+    plan_packing,
     process_consolidation_group,
+    run_consolidation_groups,
     validate_space_requirements,
 )
 from lib.cefs.constants import DEFAULT_MIN_AGE
-from lib.cefs.conversion import convert_to_cefs
-from lib.cefs.deployment import snapshot_symlink_targets
+from lib.cefs.conversion import ConversionJournal, convert_many_to_cefs, default_journal_path
+from lib.cefs.deployment import get_available_space, snapshot_symlink_targets
 from lib.cefs.formatting import (
     format_image_contents_string,
     format_usage_statistics,
@@ -31,11 +41,11 @@ from lib.cefs.formatting import (
     get_installable_current_locations,
 )
 from lib.cefs.fsck import FSCKResults, run_fsck_validation
-from lib.cefs.gc import delete_image_with_manifest, filter_images_by_age
+from lib.cefs.gc import ImageDeletionResult, delete_image_with_manifest, filter_images_by_age, plan_gc
+from lib.cefs.index import CEFSIndex, default_index_path
 from lib.cefs.paths import (
     FileWithAge,
     get_cefs_mount_path,
-    glob_with_depth,
     parse_cefs_target,
     validate_cefs_mount_point,
 )
@@ -49,13 +59,59 @@ from lib.cefs.repair import (
 )
 from lib.cefs.state import CEFSState
 from lib.cefs.unpack import repack_cefs_item, unpack_cefs_item
+from lib.cefs_manifest import sidecar_is_current, write_manifest_sidecar
 
 _LOGGER = logging.getLogger(__name__)
 
 
 @cli.group()
-def cefs():
+@click.option(
+    "--index-file",
+    default=default_index_path(),
+    metavar="FILE",
+    help="Keep an index of CEFS images, manifests and symlinks in FILE, to avoid rescanning what hasn't changed",
+    show_default=True,
+    type=click.Path(dir_okay=False, path_type=Path),
+)
+@click.option("--no-index", is_flag=True, help="Scan CEFS images and NFS symlinks from scratch, without the index")
+@click.option("--rebuild-index", is_flag=True, help="Discard the index and rebuild it from scratch")
+@click.pass_context
+def cefs(ctx: click.Context, index_file: Path, no_index: bool, rebuild_index: bool):
     """CEFS (Compiler Explorer FileSystem) v2 commands."""
+    ctx.meta[_INDEX_SETTINGS] = (None if no_index else index_file, rebuild_index)
+
+
+_INDEX_SETTINGS = "lib.cli.cefs.index_settings"
+_INDEX = "lib.cli.cefs.index"
+
+
+def _open_cefs_index(context: CliContext) -> CEFSIndex | None:
+    """The index for this command (opened on first use), or None if --no-index was given."""
+    click_context = click.get_current_context()
+    if _INDEX not in click_context.meta:
+        index_file, rebuild_index = click_context.meta.get(_INDEX_SETTINGS, (None, False))
+        index = None
+        if index_file is not None:
+            index = CEFSIndex(
+                index_file,
+                nfs_dir=context.installation_context.destination,
+                cefs_image_dir=context.config.cefs.image_dir,
+                mount_point=context.config.cefs.mount_point,
+                rebuild=rebuild_index,
+            )
+            click_context.call_on_close(index.close)
+        click_context.meta[_INDEX] = index
+    return click_context.meta[_INDEX]
+
+
+def _make_cefs_state(context: CliContext) -> CEFSState:
+    """Create a CEFSState for the configured directories, using the index unless --no-index was given."""
+    return CEFSState(
+        nfs_dir=context.installation_context.destination,
+        cefs_image_dir=context.config.cefs.image_dir,
+        mount_point=context.config.cefs.mount_point,
+        index=_open_cefs_index(context),
+    )
 
 
 def _print_basic_config(context: CliContext) -> None:
@@ -76,7 +132,7 @@ def _find_symlinks_for_broken_image(state: CEFSState, image_stem: str) -> list[t
     result = []
     image_mount_path = get_cefs_mount_path(state.mount_point, image_stem + ".sqfs")
 
-    for path in glob_with_depth(state.nfs_dir, "*", max_depth=3):
+    for path in state.symlink_candidates(image_stem):
         if not path.is_symlink():
             continue
 
@@ -146,11 +202,7 @@ def status(context, show_usage: bool, verbose: bool, show_broken: bool):
     if not show_usage and not show_broken:
         return
 
-    state = CEFSState(
-        nfs_dir=context.installation_context.destination,
-        cefs_image_dir=context.config.cefs.image_dir,
-        mount_point=context.config.cefs.mount_point,
-    )
+    state = _make_cefs_state(context)
 
     state.scan_cefs_images_with_manifests()
 
@@ -178,9 +230,44 @@ def status(context, show_usage: bool, verbose: bool, show_broken: bool):
     is_flag=True,
     help="Rename old .bak directories to .DELETE_ME_<timestamp> instead of deleting them immediately",
 )
+@click.option(
+    "--max-hashes",
+    type=int,
+    default=min(8, multiprocessing.cpu_count()),
+    metavar="N",
+    help="Hash up to N squashfs images at once",
+    show_default=True,
+)
+@click.option(
+    "--max-copies",
+    type=int,
+    default=2,
+    metavar="N",
+    help="Copy up to N images to the CEFS image directory at once",
+    show_default=True,
+)
+@click.option(
+    "--journal",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=default_journal_path,
+    help="Record progress in JOURNAL, so an interrupted conversion can be resumed without rehashing",
+    show_default="~/.cache/ce_install/cefs-convert-journal.jsonl",
+)
 @click.argument("filter_", metavar="FILTER", nargs=-1)
-def convert(context: CliContext, filter_: list[str], force: bool, defer_backup_cleanup: bool):
-    """Convert squashfs images to CEFS format for targets matching FILTER."""
+def convert(
+    context: CliContext,
+    filter_: list[str],
+    force: bool,
+    defer_backup_cleanup: bool,
+    max_hashes: int,
+    max_copies: int,
+    journal: Path,
+):
+    """Convert squashfs images to CEFS format for targets matching FILTER.
+
+    Images are hashed and copied to CEFS concurrently; the NFS directories are only switched over to CEFS symlinks
+    once all the copies are done.
+    """
     if not validate_cefs_mount_point(context.config.cefs.mount_point):
         _LOGGER.error("CEFS mount point validation failed. Run 'ce cefs setup' first.")
         raise click.ClickException("CEFS not properly configured")
@@ -191,31 +278,32 @@ def convert(context: CliContext, filter_: list[str], force: bool, defer_backup_c
         _LOGGER.warning("No installables match filter: %s", " ".join(filter_))
         return
 
-    successful = 0
-    failed = 0
     skipped = 0
-
+    to_convert = []
     for installable in installables:
         if not installable.is_squashable:
             _LOGGER.debug("Skipping non-squashable: %s", installable.name)
             skipped += 1
             continue
-
-        _LOGGER.info("Converting %s...", installable.name)
-        squashfs_image_path = context.config.squashfs.image_dir / f"{installable.install_path}.img"
-        if convert_to_cefs(
-            installable,
-            context.installation_context.destination,
-            squashfs_image_path,
-            context.config.squashfs,
-            context.config.cefs,
-            force,
-            defer_backup_cleanup,
-            context.installation_context.dry_run,
-        ):
-            successful += 1
-        else:
-            failed += 1
+        to_convert.append((installable, context.config.squashfs.image_dir / f"{installable.install_path}.img"))
+
+    dry_run = context.installation_context.dry_run
+    conversion_journal = None if dry_run else ConversionJournal(journal)
+    _LOGGER.info("Converting %d installables...", len(to_convert))
+    successful, failed = convert_many_to_cefs(
+        to_convert,
+        context.installation_context.destination,
+        context.config.squashfs,
+        context.config.cefs,
+        force,
+        defer_backup_cleanup,
+        dry_run,
+        max_hashes,
+        max_copies,
+        conversion_journal,
+    )
+    if conversion_journal is not None and failed == 0:
+        conversion_journal.remove()
 
     _LOGGER.info("Conversion complete: %d successful, %d failed, %d skipped", successful, failed, skipped)
 
@@ -459,6 +547,25 @@ def rollback(context: CliContext, filter_: list[str]):
         raise click.ClickException(f"Failed to rollback {failed} installables")
 
 
+def _report_packing_plans(
+    items: list[ConsolidationCandidate], max_size_bytes: int, min_items: int, locality: bool, stream: bool
+) -> None:
+    click.echo(
+        f"Packing {len(items)} items into images of at most {humanfriendly.format_size(max_size_bytes, binary=True)}"
+        f" (at least {min_items} items each), currently mounted from"
+        f" {len({item.squashfs_path for item in items})} images:"
+    )
+    click.echo(f"  {'Strategy':<22} {'Images':>6} {'Fill':>6} {'Mounts':>6} {'Left out':>8} {'Temp space':>10}")
+    for strategy in PACKING_STRATEGIES:
+        plan = plan_packing(items, max_size_bytes, min_items, strategy, locality, stream)
+        left_out = len(items) - sum(len(group) for group in plan.groups)
+        temp_space = humanfriendly.format_size(plan.temp_space, binary=True)
+        click.echo(
+            f"  {strategy:<22} {plan.image_count:>6} {plan.fill_ratio:>6.1%} {plan.mounts_after:>6} {left_out:>8}"
+            f" {temp_space:>10}"
+        )
+
+
 @cefs.command()
 @click.pass_obj
 @click.option(
@@ -476,6 +583,19 @@ def rollback(context: CliContext, filter_: list[str]):
     default=None,
     help="Maximum parallel extractions (default: CPU count)",
 )
+@click.option(
+    "--max-parallel-groups",
+    type=int,
+    default=2,
+    show_default=True,
+    help="Maximum consolidation groups to process at once, as temp space allows",
+)
+@click.option(
+    "--stream-merge",
+    is_flag=True,
+    help="Stream items from their mounted images straight into the consolidated image, instead of extracting them to"
+    " local disk first (needs squashfs-tools 4.6 or later)",
+)
 @click.option(
     "--reconsolidate/--no-reconsolidate",
     default=False,
@@ -493,6 +613,23 @@ def rollback(context: CliContext, filter_: list[str]):
     type=float,
     help="Consider consolidated images undersized if smaller than max-size * this ratio (default: 0.25)",
 )
+@click.option(
+    "--packing",
+    type=click.Choice(list(PACKING_STRATEGIES)),
+    default=BEST_FIT_DECREASING,
+    show_default=True,
+    help="How to pack items into consolidated images",
+)
+@click.option(
+    "--keep-families-together",
+    is_flag=True,
+    help="Keep items sharing a name prefix (e.g. all versions of a compiler) in the same image where they fit",
+)
+@click.option(
+    "--plan-only",
+    is_flag=True,
+    help="Show how each packing strategy would group the items, then stop before extracting anything",
+)
 @click.argument("filter_", metavar="[FILTER]", nargs=-1, required=False)
 def consolidate(
     context: CliContext,
@@ -500,9 +637,14 @@ def consolidate(
     min_items: int,
     defer_backup_cleanup: bool,
     max_parallel_extractions: int | None,
+    max_parallel_groups: int,
+    stream_merge: bool,
     reconsolidate: bool,
     efficiency_threshold: float,
     undersized_ratio: float,
+    packing: str,
+    keep_families_together: bool,
+    plan_only: bool,
     filter_: list[str],
 ):
     """Consolidate multiple CEFS images into larger consolidated images to reduce mount overhead.
@@ -581,11 +723,7 @@ def consolidate(
     # Add reconsolidation candidates if enabled
     if reconsolidate:
         _LOGGER.info("Gathering reconsolidation candidates...")
-        recon_state = CEFSState(
-            nfs_dir=context.installation_context.destination,
-            cefs_image_dir=context.config.cefs.image_dir,
-            mount_point=context.config.cefs.mount_point,
-        )
+        recon_state = _make_cefs_state(context)
         recon_state.scan_cefs_images_with_manifests()
         recon_state.check_symlink_references()
 
@@ -604,8 +742,21 @@ def consolidate(
 
     _LOGGER.info("Found %d total CEFS items for consolidation", len(cefs_items))
 
+    if not stream_merge:  # nothing is extracted when streaming
+        _LOGGER.info("Estimating extracted sizes...")
+        cefs_items = estimate_extracted_sizes(
+            context.config.squashfs,
+            cefs_items,
+            context.config.cefs.mount_point,
+            _open_cefs_index(context),
+        )
+
+    if plan_only:
+        _report_packing_plans(cefs_items, max_size_bytes, min_items, keep_families_together, stream_merge)
+        return
+
     # Pack items into groups
-    groups = pack_items_into_groups(cefs_items, max_size_bytes, min_items)
+    groups = pack_items_into_groups(cefs_items, max_size_bytes, min_items, packing, keep_families_together)
 
     if not groups:
         _LOGGER.warning("No groups meet consolidation criteria (min %d items, max %s per group)", min_items, max_size)
@@ -615,7 +766,7 @@ def consolidate(
 
     temp_dir = context.config.cefs.local_temp_dir
     try:
-        required_temp_space, largest_group_size = validate_space_requirements(groups, temp_dir)
+        required_temp_space, largest_group_size = validate_space_requirements(groups, temp_dir, stream_merge)
     except RuntimeError as e:
         raise click.ClickException(str(e)) from e
 
@@ -624,7 +775,11 @@ def consolidate(
     for i, group in enumerate(groups):
         group_size = sum(item.size for item in group)
         _LOGGER.info(
-            "Group %d: %d items, %s compressed", i + 1, len(group), humanfriendly.format_size(group_size, binary=True)
+            "Group %d: %d items, %s compressed, needing %s temp space",
+            i + 1,
+            len(group),
+            humanfriendly.format_size(group_size, binary=True),
+            humanfriendly.format_size(group_temp_space(group, stream_merge), binary=True),
         )
         if _LOGGER.isEnabledFor(logging.DEBUG):
             for item in group:
@@ -632,7 +787,7 @@ def consolidate(
 
     _LOGGER.info("Total compressed size: %s", humanfriendly.format_size(total_compressed_size, binary=True))
     _LOGGER.info(
-        "Required temp space: %s (5x largest group: %s)",
+        "Required temp space: %s (largest group: %s compressed)",
         humanfriendly.format_size(required_temp_space, binary=True),
         humanfriendly.format_size(largest_group_size, binary=True),
     )
@@ -649,15 +804,10 @@ def consolidate(
     consolidation_dir = temp_dir / str(uuid.uuid4())
     consolidation_dir.mkdir(parents=True, exist_ok=True)
 
-    successful_groups = 0
-    failed_groups = 0
-    total_updated_symlinks = 0
-    total_skipped_symlinks = 0
-
-    for group_idx, group in enumerate(groups):
-        _LOGGER.info("Processing group %d/%d (%d items)", group_idx + 1, len(groups), len(group))
+    symlink_lock = threading.Lock()
 
-        success, updated, skipped = process_consolidation_group(
+    def process_group(group: list[ConsolidationCandidate], group_idx: int, extractions: int) -> tuple[bool, int, int]:
+        return process_consolidation_group(
             group,
             group_idx,
             context.config.squashfs,
@@ -666,17 +816,25 @@ def consolidate(
             symlink_snapshot,
             consolidation_dir,
             defer_backup_cleanup,
-            max_parallel_extractions,
+            extractions,
             lambda name: context.find_installable_by_exact_name(name),
             context.installation_context.dry_run,
+            symlink_lock,
+            stream_merge,
         )
 
-        if success:
-            successful_groups += 1
-            total_updated_symlinks += updated
-            total_skipped_symlinks += skipped
-        else:
-            failed_groups += 1
+    results = run_consolidation_groups(
+        groups,
+        process_group,
+        get_available_space(temp_dir),
+        max_parallel_groups,
+        max_parallel_extractions,
+        stream_merge,
+    )
+    successful_groups = sum(1 for success, _, _ in results if success)
+    failed_groups = len(results) - successful_groups
+    total_updated_symlinks = sum(updated for success, updated, _ in results if success)
+    total_skipped_symlinks = sum(skipped for success, _, skipped in results if success)
 
     _LOGGER.info("Consolidation complete:")
     _LOGGER.info("  Successful groups: %d", successful_groups)
@@ -699,7 +857,29 @@ def consolidate(
     "--min-age", default=DEFAULT_MIN_AGE, help="Minimum age of images to consider for deletion (e.g., 1h, 30m, 1d)"
 )
 @click.option("--include-broken", is_flag=True, help="Include unreferenced broken images in garbage collection")
-def gc(context: CliContext, force: bool, min_age: str, include_broken: bool):
+@click.option(
+    "--max-bytes",
+    metavar="SIZE",
+    help="Delete at most SIZE of images this run (e.g. 500GiB), biggest first; the rest are left for a later run",
+)
+@click.option("--max-images", type=int, metavar="N", help="Delete at most N images this run, biggest first")
+@click.option(
+    "--max-workers",
+    type=int,
+    default=4,
+    metavar="N",
+    show_default=True,
+    help="Delete up to N images at once",
+)
+def gc(
+    context: CliContext,
+    force: bool,
+    min_age: str,
+    include_broken: bool,
+    max_bytes: str | None,
+    max_images: int | None,
+    max_workers: int,
+):
     """Garbage collect unreferenced CEFS images using manifests.
 
     Reads manifest files from CEFS images to determine expected symlink locations,
@@ -707,9 +887,17 @@ def gc(context: CliContext, force: bool, min_age: str, include_broken: bool):
     Images without valid references are marked for deletion.
 
     Images with .yaml.inprogress manifests are NEVER deleted (incomplete operations).
+
+    Images are deleted biggest first, within any --max-bytes/--max-images budget; with --dry-run, this just shows
+    the ranked plan, what it would reclaim and roughly how long it would take.
     """
     _LOGGER.info("Starting CEFS garbage collection using manifest system...")
 
+    try:
+        max_bytes_limit = humanfriendly.parse_size(max_bytes, binary=True) if max_bytes is not None else None
+    except humanfriendly.InvalidSize as e:
+        raise click.ClickException(f"Invalid max-bytes: {e}") from e
+
     try:
         min_age_seconds = humanfriendly.parse_timespan(min_age)
         min_age_delta = datetime.timedelta(seconds=min_age_seconds)
@@ -720,11 +908,7 @@ def gc(context: CliContext, force: bool, min_age: str, include_broken: bool):
     now = datetime.datetime.now()
     error_count = 0
 
-    state = CEFSState(
-        nfs_dir=context.installation_context.destination,
-        cefs_image_dir=context.config.cefs.image_dir,
-        mount_point=context.config.cefs.mount_point,
-    )
+    state = _make_cefs_state(context)
 
     _LOGGER.info("Scanning CEFS images directory and reading manifests...")
     state.scan_cefs_images_with_manifests()
@@ -771,45 +955,69 @@ def gc(context: CliContext, force: bool, min_age: str, include_broken: bool):
     _LOGGER.info("  Space to reclaim: %s", humanfriendly.format_size(summary.space_to_reclaim, binary=True))
 
     filter_result = filter_images_by_age(state.find_unreferenced_images(), min_age_delta, now)
-    unreferenced = filter_result.old_enough
 
     for image_path, age in filter_result.too_recent:
         _LOGGER.info(
             "Skipping recent image (age %s): %s", humanfriendly.format_timespan(age.total_seconds()), image_path
         )
 
-    if not unreferenced:
+    if not filter_result.old_enough:
         _LOGGER.info("No unreferenced CEFS images found. Nothing to clean up.")
         if error_count > 0:
             raise click.ClickException(f"GC completed with {error_count} errors during analysis")
         return
 
-    _LOGGER.info("Unreferenced CEFS images to delete:")
-    for image_path in unreferenced:
-        try:
-            size_str = humanfriendly.format_size(image_path.stat().st_size, binary=True)
-        except OSError:
-            size_str = "size unknown"
+    plan = plan_gc(filter_result.old_enough, now, max_bytes=max_bytes_limit, max_images=max_images)
+    for candidate in plan.to_delete + plan.deferred:
+        if candidate.size is None:
             error_count += 1
-            _LOGGER.error("Could not stat image: %s", image_path)
+            _LOGGER.error("Could not stat image: %s", candidate.image_path)
+
+    _LOGGER.info("Unreferenced CEFS images to delete, biggest first:")
+    for rank, candidate in enumerate(plan.to_delete, start=1):
         _LOGGER.info(
-            "  %s (%s)%s",
-            image_path,
-            size_str,
-            format_image_contents_string(get_image_description(image_path, context.config.cefs.mount_point), 3)
+            "  %d. %s (%s, age %s)%s",
+            rank,
+            candidate.image_path,
+            "size unknown" if candidate.size is None else humanfriendly.format_size(candidate.size, binary=True),
+            "unknown" if candidate.age is None else humanfriendly.format_timespan(candidate.age.total_seconds()),
+            format_image_contents_string(
+                get_image_description(candidate.image_path, context.config.cefs.mount_point), 3
+            )
             or " [contents unknown]",
         )
 
         # Show where each Installable in this image is currently installed
-        for line in get_installable_current_locations(image_path):
+        for line in get_installable_current_locations(candidate.image_path):
             _LOGGER.info(line)
 
+    if plan.deferred:
+        _LOGGER.info(
+            "Deferring %d images (%s) over the --max-bytes/--max-images budget to a later run",
+            len(plan.deferred),
+            humanfriendly.format_size(plan.bytes_deferred, binary=True),
+        )
+    _LOGGER.info(
+        "Plan: delete %d images, reclaiming %s; estimated %s with %d workers",
+        len(plan.to_delete),
+        humanfriendly.format_size(plan.bytes_to_reclaim, binary=True),
+        humanfriendly.format_timespan(plan.estimated_seconds(max_workers)),
+        max_workers,
+    )
+    unreferenced = [candidate.image_path for candidate in plan.to_delete]
+
     if context.installation_context.dry_run:
         _LOGGER.info("DRY RUN: Would delete %d unreferenced images", len(unreferenced))
         if error_count > 0:
             raise click.ClickException(f"GC completed with {error_count} errors during analysis")
         return
 
+    if not unreferenced:
+        _LOGGER.info("Nothing fits within the budget. Nothing to clean up.")
+        if error_count > 0:
+            raise click.ClickException(f"GC completed with {error_count} errors during analysis")
+        return
+
     if not force and not click.confirm(f"Delete {len(unreferenced)} unreferenced CEFS images?"):
         _LOGGER.info("Garbage collection cancelled by user")
         return
@@ -818,31 +1026,23 @@ def gc(context: CliContext, force: bool, min_age: str, include_broken: bool):
     deleted_size = 0
     _LOGGER.info("Performing double-check before deletion...")
 
-    for image_path in unreferenced:
-        # SAFETY: Double-check - Re-verify the image is still unreferenced immediately before deletion, by
-        # checking no symlinks now point to this image. This guards against race conditions where another
-        # process creates a symlink between our initial scan and the deletion attempt. Since we have no locking,
-        # this is our last line of defense against deleting an image that just became referenced.
-        try:
-            if state.is_image_referenced(image_path.stem):
-                _LOGGER.warning("Double-check: Image %s is now referenced, skipping deletion", image_path)
+    # Biggest first, so if the run is cut short the biggest wins have been had
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="gc") as executor:
+        for image_path, result in zip(
+            unreferenced, executor.map(partial(_gc_delete_image, state), unreferenced), strict=True
+        ):
+            if result is None:
                 continue
-        except ValueError as e:
-            # This shouldn't happen - unreferenced images should all be in image_references
-            _LOGGER.error("Error during double-check for %s: %s", image_path, e)
-            continue  # Skip deletion to be safe
-
-        result = delete_image_with_manifest(image_path)
-        if result.success:
-            deleted_count += 1
-            deleted_size += result.deleted_size
-            _LOGGER.info("Deleted: %s", image_path)
-            for error in result.errors:
-                _LOGGER.warning(error)
-        else:
-            error_count += 1
-            for error in result.errors:
-                _LOGGER.error(error)
+            if result.success:
+                deleted_count += 1
+                deleted_size += result.deleted_size
+                _LOGGER.info("Deleted: %s", image_path)
+                for error in result.errors:
+                    _LOGGER.warning(error)
+            else:
+                error_count += 1
+                for error in result.errors:
+                    _LOGGER.error(error)
 
     _LOGGER.info(
         "Garbage collection complete: deleted %d images, freed %s",
@@ -854,6 +1054,61 @@ def gc(context: CliContext, force: bool, min_age: str, include_broken: bool):
         raise click.ClickException(f"GC completed with {error_count} errors")
 
 
+def _gc_delete_image(state: CEFSState, image_path: Path) -> ImageDeletionResult | None:
+    """Delete an unreferenced image, unless it's become referenced since the scan (returning None)."""
+    # SAFETY: Double-check - Re-verify the image is still unreferenced immediately before deletion, by
+    # checking no symlinks now point to this image. This guards against race conditions where another
+    # process creates a symlink between our initial scan and the deletion attempt. Since we have no locking,
+    # this is our last line of defense against deleting an image that just became referenced.
+    try:
+        if state.is_image_referenced(image_path.stem):
+            _LOGGER.warning("Double-check: Image %s is now referenced, skipping deletion", image_path)
+            return None
+    except ValueError as e:
+        # This shouldn't happen - unreferenced images should all be in image_references
+        _LOGGER.error("Error during double-check for %s: %s", image_path, e)
+        return None  # Skip deletion to be safe
+
+    return delete_image_with_manifest(image_path)
+
+
+@cefs.command(name="backfill-sidecars")
+@click.pass_obj
+@click.option(
+    "--max-workers",
+    type=int,
+    default=32,
+    metavar="N",
+    show_default=True,
+    help="Check and write up to N sidecars at once",
+)
+def backfill_sidecars(context: CliContext, max_workers: int):
+    """Write JSON manifest sidecars for CEFS images that lack an up-to-date one.
+
+    Sidecars let gc, fsck and status load manifests without parsing YAML. New images get one when their manifest
+    is written; this catches up images created before sidecars existed, or whose manifest has since been rewritten.
+    """
+    image_dir = context.config.cefs.image_dir
+    images = sorted(image_dir.glob("*/*.sqfs"))
+    with_manifests = [image for image in images if image.with_suffix(".yaml").exists()]
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="sidecar") as executor:
+        stale = [
+            image
+            for image, current in zip(with_manifests, executor.map(sidecar_is_current, with_manifests), strict=True)
+            if not current
+        ]
+        _LOGGER.info("%d of %d images with manifests need a sidecar", len(stale), len(with_manifests))
+        if context.installation_context.dry_run:
+            for image in stale:
+                _LOGGER.info("DRY RUN: Would write sidecar for %s", image)
+            return
+        written = sum(executor.map(write_manifest_sidecar, stale))
+
+    _LOGGER.info("Wrote %d sidecars", written)
+    if written < len(stale):
+        raise click.ClickException(f"Failed to write {len(stale) - written} sidecars")
+
+
 def display_verbose_fsck_logs(
     state: CEFSState,
     results: FSCKResults,
@@ -991,6 +1246,8 @@ def display_fsck_results(results: FSCKResults, verbose: bool, state: CEFSState)
     click.echo(f"  ❌ Invalid/problematic: {results.total_invalid}")
     click.echo(f"  🔄 In-progress files: {len(results.inprogress_files)}")
     click.echo(f"  🗑️  Pending cleanup: {len(results.pending_backups) + len(results.pending_deletes)}")
+    if results.hash_mismatches:
+        click.echo(f"  ❌ Hash mismatches: {len(results.hash_mismatches)}")
 
     if not results.has_issues:
         click.echo("\n✅ All manifests are valid and symlinks are intact!")
@@ -1060,6 +1317,17 @@ def display_fsck_results(results: FSCKResults, verbose: bool, state: CEFSState)
         if len(results.unreadable_manifests) > 3:
             click.echo(f"    ... and {len(results.unreadable_manifests) - 3} more")
 
+    if results.hash_mismatches:
+        click.echo(
+            f"\n  Hash Mismatches ({len(results.hash_mismatches)} image{'s' if len(results.hash_mismatches) > 1 else ''}):"
+        )
+        click.echo("  These images' content doesn't match the hash in their name (corrupt or truncated).")
+        for image_path, error in results.hash_mismatches[:3]:
+            click.echo(f"    • {image_path}")
+            click.echo(f"      Issue: {error}")
+        if len(results.hash_mismatches) > 3:
+            click.echo(f"    ... and {len(results.hash_mismatches) - 3} more")
+
     if results.inprogress_files:
         click.echo(
             f"\n  In-Progress Files ({len(results.inprogress_files)} file{'s' if len(results.inprogress_files) > 1 else ''}):"
@@ -1168,6 +1436,16 @@ def display_fsck_results(results: FSCKResults, verbose: bool, state: CEFSState)
     help="Minimum age for repairing incomplete transactions (e.g., 1h, 30m, 1d)",
 )
 @click.option("--force", is_flag=True, help="Skip confirmation prompt for repairs")
+@click.option("--full", is_flag=True, help="Validate every manifest, not just those changed since the last fsck")
+@click.option("--verify-hashes", is_flag=True, help="Rehash every image to check its content matches its name")
+@click.option(
+    "--max-hashes",
+    type=int,
+    default=min(8, multiprocessing.cpu_count()),
+    metavar="N",
+    show_default=True,
+    help="Hash up to N images at once with --verify-hashes",
+)
 @click.pass_obj
 def fsck(
     context: CliContext,
@@ -1175,6 +1453,9 @@ def fsck(
     repair: bool,
     min_age: str,
     force: bool,
+    full: bool,
+    verify_hashes: bool,
+    max_hashes: int,
 ) -> None:
     """Check CEFS filesystem integrity and optionally repair issues.
 
@@ -1185,17 +1466,14 @@ def fsck(
     - No broken manifest formats (e.g., old 'target' field)
     - In-progress files indicating incomplete operations
     - Pending cleanup tasks (.bak, .DELETE_ME directories)
+    - With --verify-hashes, that each image's content still matches the hash in its name
 
     With --repair, also fixes incomplete transactions by:
     - Finalizing transactions where symlinks exist (marking as complete)
     - Deleting failed transactions where no symlinks were created
     - Skipping recent or conflicted transactions for safety
     """
-    state = CEFSState(
-        nfs_dir=context.installation_context.destination,
-        cefs_image_dir=context.config.cefs.image_dir,
-        mount_point=context.config.cefs.mount_point,
-    )
+    state = _make_cefs_state(context)
     state.scan_cefs_images_with_manifests()
     state.check_symlink_references()
 
@@ -1205,6 +1483,9 @@ def fsck(
     results = run_fsck_validation(
         state,
         context.config.cefs.mount_point,
+        full=full,
+        verify_hashes=verify_hashes,
+        max_hashes=max_hashes,
     )
 
     if verbose:
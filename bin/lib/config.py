@@ -50,6 +50,8 @@ class CefsConfig(BaseModel):
     mount_point: Path = Path("/cefs")
     image_dir: Path = Path("/efs/cefs-images")
     local_temp_dir: Path = Path("/tmp/ce-cefs-temp")
+    # Maximum size in bytes of the local cache of downloaded artifacts (under local_temp_dir); 0 disables it
+    download_cache_size: int = 0
 
     model_config = ConfigDict(frozen=True, extra="forbid")
 
@@ -101,6 +103,7 @@ class Config(BaseModel):
         force_cefs: bool = False,
         force_traditional: bool = False,
         cefs_temp_dir: Path | None = None,
+        download_cache_size: int | None = None,
     ) -> Config:
         """Create a new Config with CLI overrides applied.
 
@@ -108,6 +111,7 @@ class Config(BaseModel):
             force_cefs: Force CEFS enabled, overriding config
             force_traditional: Force CEFS disabled, overriding config
             cefs_temp_dir: Override local temp directory for CEFS
+            download_cache_size: Override the maximum size of the download cache (0 disables it)
 
         Returns:
             New Config instance with overrides applied
@@ -129,4 +133,8 @@ class Config(BaseModel):
             config_dict["cefs"]["local_temp_dir"] = cefs_temp_dir
             _LOGGER.info("CLI override: CEFS temp dir = %s", cefs_temp_dir)
 
+        if download_cache_size is not None:
+            config_dict["cefs"]["download_cache_size"] = download_cache_size
+            _LOGGER.info("CLI override: download cache size = %d bytes", download_cache_size)
+
         return self.__class__.model_validate(config_dict)
@@ -0,0 +1,122 @@
+"""On-disk cache of fully expanded installation targets.
+
+Parsing all the installation YAML and running the Jinja expansion over every target takes a couple of seconds, which
+every ce_install invocation pays even to list a handful of targets. The expanded targets of each YAML file are cached
+as JSON, keyed on the file's content, the enabled set and the root configuration they were expanded against.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import uuid
+from collections import ChainMap
+from collections.abc import Collection, MutableMapping
+from pathlib import Path
+from typing import Any
+
+import yaml
+
+import lib.config_expand
+import lib.installation
+from lib.config_safe_loader import ConfigSafeLoader
+from lib.installation import targets_from
+
+_LOGGER = logging.getLogger(__name__)
+
+_CACHE_VERSION = 1
+# Targets referring to the current time can't be cached.
+_NOW_TEMPLATE_RE = re.compile(rb"\{[{%][^}]*\bnow\b")
+
+
+def default_cache_dir() -> Path:
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "ce_install" / "targets"
+
+
+def _code_hash() -> str:
+    """Hash of the code doing the expansion, so cached targets are invalidated when it changes."""
+    digest = hashlib.sha256(str(_CACHE_VERSION).encode())
+    for module in (lib.installation, lib.config_expand):
+        assert module.__file__ is not None
+        digest.update(Path(module.__file__).read_bytes())
+    return digest.hexdigest()
+
+
+class ExpandedTargetCache:
+    """Loads the expanded targets of installation YAML files, through a cache directory if one is given."""
+
+    def __init__(self, cache_dir: Path | None):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._code_hash: str | None = None
+
+    def targets_for(
+        self, yaml_path: Path, enabled: Collection[str] | bool, base_config: dict[str, Any]
+    ) -> list[MutableMapping[str, Any]]:
+        """Return the expanded targets of `yaml_path`, as `targets_from` would."""
+        content = yaml_path.read_bytes()
+        if self.cache_dir is None or _NOW_TEMPLATE_RE.search(content):
+            return self._expand(content, enabled, base_config)
+
+        enabled_key = "all" if enabled is True else ",".join(sorted(enabled or ()))
+        cache_file = self.cache_dir / f"{yaml_path.stem}-{hashlib.sha256(enabled_key.encode()).hexdigest()[:16]}.json"
+        source_key = self._source_key(content, enabled_key, base_config)
+        try:
+            cached = json.loads(cache_file.read_text(encoding="utf-8"))
+            if cached["key"] == source_key:
+                self.hits += 1
+                return [ChainMap(target, base_config) for target in cached["targets"]]
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            _LOGGER.debug("Ignoring unreadable target cache %s: %s", cache_file, e)
+
+        self.misses += 1
+        targets = self._expand(content, enabled, base_config)
+        self._store(cache_file, source_key, targets, base_config)
+        return targets
+
+    def _source_key(self, content: bytes, enabled_key: str, base_config: dict[str, Any]) -> str:
+        if self._code_hash is None:
+            self._code_hash = _code_hash()
+        digest = hashlib.sha256(content)
+        digest.update(enabled_key.encode())
+        digest.update(self._code_hash.encode())
+        for key in sorted(base_config):
+            if key != "now":
+                digest.update(f"{key}={base_config[key]}".encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _expand(
+        content: bytes, enabled: Collection[str] | bool, base_config: dict[str, Any]
+    ) -> list[MutableMapping[str, Any]]:
+        return list(targets_from(yaml.load(content, Loader=ConfigSafeLoader), enabled, base_config))
+
+    def _store(
+        self, cache_file: Path, source_key: str, targets: list[MutableMapping[str, Any]], base_config: dict[str, Any]
+    ) -> None:
+        # Only the target's own values are stored; the root configuration is layered back underneath on load.
+        stripped = [
+            {key: value for key, value in target.items() if key not in base_config or value != base_config[key]}
+            for target in targets
+        ]
+        try:
+            serialised = json.dumps({"key": source_key, "targets": stripped})
+        except (TypeError, ValueError):
+            _LOGGER.debug("Targets for %s aren't JSON serialisable; not caching", cache_file)
+            return
+        if json.loads(serialised)["targets"] != stripped:
+            _LOGGER.debug("Targets for %s don't survive a JSON round trip; not caching", cache_file)
+            return
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            temp_file = cache_file.with_name(f"{cache_file.name}.{uuid.uuid4()}.tmp")
+            temp_file.write_text(serialised, encoding="utf-8")
+            temp_file.replace(cache_file)
+        except OSError as e:
+            _LOGGER.debug("Unable to write target cache %s: %s", cache_file, e)
@@ -0,0 +1,137 @@
+"""Minimal in-process ELF header reader.
+
+Reads just enough of an ELF file (the file header and program headers) to answer the questions the installers ask of
+binaries, without running `file` or `readelf` for each one.
+"""
+
+from __future__ import annotations
+
+import struct
+from pathlib import Path
+
+ELF_MAGIC = b"\x7fELF"
+
+_ELFCLASS32 = 1
+_ELFCLASS64 = 2
+_ELFDATA2LSB = 1
+_ELFDATA2MSB = 2
+_PT_DYNAMIC = 2
+_PT_INTERP = 3
+_EI_NIDENT = 16
+# Sanity limits, so a corrupt header can't make us read huge amounts.
+_MAX_PROGRAM_HEADERS = 512
+_MAX_INTERPRETER_LENGTH = 4096
+
+FILE_TYPES = {0: "NONE", 1: "REL", 2: "EXEC", 3: "DYN", 4: "CORE"}
+MACHINES = {
+    2: "sparc",
+    3: "x86",
+    8: "mips",
+    20: "ppc",
+    21: "ppc64",
+    22: "s390",
+    40: "arm",
+    43: "sparcv9",
+    62: "x86_64",
+    183: "aarch64",
+    243: "riscv",
+    258: "loongarch",
+}
+
+
+class ElfHeader:
+    """The interesting parts of an ELF file's headers."""
+
+    __slots__ = ("bits", "big_endian", "osabi", "file_type", "machine", "interpreter", "has_dynamic")
+
+    def __init__(
+        self,
+        bits: int,
+        big_endian: bool,
+        osabi: int,
+        file_type: int,
+        machine: int,
+        interpreter: str | None,
+        has_dynamic: bool,
+    ):
+        self.bits = bits
+        self.big_endian = big_endian
+        self.osabi = osabi
+        self.file_type = file_type
+        self.machine = machine
+        self.interpreter = interpreter
+        self.has_dynamic = has_dynamic
+
+    @property
+    def file_type_name(self) -> str:
+        return FILE_TYPES.get(self.file_type, f"unknown({self.file_type})")
+
+    @property
+    def machine_name(self) -> str:
+        return MACHINES.get(self.machine, f"unknown({self.machine})")
+
+    def __repr__(self) -> str:
+        return (
+            f"ElfHeader(ELF{self.bits} {'MSB' if self.big_endian else 'LSB'} {self.file_type_name} "
+            f"{self.machine_name}, interpreter={self.interpreter!r}, has_dynamic={self.has_dynamic})"
+        )
+
+
+def has_elf_magic(path: Path | str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(ELF_MAGIC)) == ELF_MAGIC
+    except OSError:
+        return False
+
+
+def read_elf_header(path: Path | str) -> ElfHeader | None:
+    """Read the headers of `path`, or return None if it isn't a readable, well-formed ELF file."""
+    try:
+        with open(path, "rb") as f:
+            return _parse(f)
+    except (OSError, struct.error, ValueError):
+        return None
+
+
+def _parse(f) -> ElfHeader | None:
+    ident = f.read(_EI_NIDENT)
+    if len(ident) < _EI_NIDENT or ident[:4] != ELF_MAGIC:
+        return None
+    elf_class, data, osabi = ident[4], ident[5], ident[7]
+    if elf_class not in (_ELFCLASS32, _ELFCLASS64) or data not in (_ELFDATA2LSB, _ELFDATA2MSB):
+        return None
+    endian = "<" if data == _ELFDATA2LSB else ">"
+    if elf_class == _ELFCLASS64:
+        header_format, phdr_format = "HHIQQQIHHH", "IIQQQQ"
+    else:
+        header_format, phdr_format = "HHIIIIIHHH", "IIIII"
+    header = struct.unpack(endian + header_format, f.read(struct.calcsize(endian + header_format)))
+    file_type, machine, phoff, phentsize, phnum = header[0], header[1], header[4], header[8], header[9]
+
+    interpreter = None
+    has_dynamic = False
+    phdr_size = struct.calcsize(endian + phdr_format)
+    if phoff and phentsize >= phdr_size and phnum <= _MAX_PROGRAM_HEADERS:
+        f.seek(phoff)
+        table = f.read(phentsize * phnum)
+        for offset in range(0, len(table) - phdr_size + 1, phentsize):
+            phdr = struct.unpack_from(endian + phdr_format, table, offset)
+            if elf_class == _ELFCLASS64:
+                p_type, p_offset, p_filesz = phdr[0], phdr[2], phdr[5]
+            else:
+                p_type, p_offset, p_filesz = phdr[0], phdr[1], phdr[4]
+            if p_type == _PT_DYNAMIC:
+                has_dynamic = True
+            elif p_type == _PT_INTERP and p_filesz <= _MAX_INTERPRETER_LENGTH:
+                f.seek(p_offset)
+                interpreter = f.read(p_filesz).rstrip(b"\0").decode("utf-8", "replace")
+    return ElfHeader(
+        bits=64 if elf_class == _ELFCLASS64 else 32,
+        big_endian=data == _ELFDATA2MSB,
+        osabi=osabi,
+        file_type=file_type,
+        machine=machine,
+        interpreter=interpreter,
+        has_dynamic=has_dynamic,
+    )
@@ -0,0 +1,157 @@
+"""Dependency-aware parallel scheduling of installations.
+
+Targets are installed concurrently once every installable they depend on has been installed. Dependencies that
+weren't themselves asked for are installed on demand (if missing), exactly as `Installable.install` would do, but
+only once no matter how many targets share them.
+"""
+
+from __future__ import annotations
+
+import logging
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from lib.installable.installable import Installable
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class InstallSummary:
+    """Outcome of a scheduled installation run."""
+
+    installed: list[str] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)
+    failed: list[str] = field(default_factory=list)
+
+
+@dataclass
+class _Node:
+    installable: Installable
+    requested: bool
+    depends: set[str] = field(default_factory=set)
+    dependents: set[str] = field(default_factory=set)
+
+
+def build_install_graph(to_install: list[Installable]) -> dict[str, _Node]:
+    """Build the dependency graph for the given installables, including all their transitive dependencies.
+
+    Dependencies that are not in `to_install` are added as unrequested nodes.
+    """
+    nodes: dict[str, _Node] = {}
+    for installable in to_install:
+        nodes[installable.name] = _Node(installable, requested=True)
+    pending = list(to_install)
+    while pending:
+        installable = pending.pop()
+        for dependee in installable.depends:
+            if dependee.name not in nodes:
+                nodes[dependee.name] = _Node(dependee, requested=False)
+                pending.append(dependee)
+            nodes[installable.name].depends.add(dependee.name)
+            nodes[dependee.name].dependents.add(installable.name)
+    return nodes
+
+
+class InstallScheduler:
+    """Installs a set of installables concurrently, respecting their `depends`."""
+
+    def __init__(self, max_workers: int, dry_run: bool):
+        self.max_workers = max(1, max_workers)
+        self.dry_run = dry_run
+
+    def _install_requested(self, installable: Installable) -> bool:
+        print(f"Installing {installable.name}")
+        installable.install()
+        if self.dry_run:
+            _LOGGER.info("Assuming %s installed OK (dry run)", installable.name)
+            return True
+        if not installable.is_installed():
+            _LOGGER.error("%s installed OK, but doesn't appear as installed after", installable.name)
+            return False
+        _LOGGER.info("%s installed OK", installable.name)
+        return True
+
+    def _install_dependee(self, installable: Installable) -> bool:
+        if not installable.is_installed():
+            _LOGGER.info("Installing required dependee %s", installable)
+            installable.install()
+        return True
+
+    def _run_node(self, node: _Node) -> bool:
+        try:
+            if node.requested:
+                return self._install_requested(node.installable)
+            return self._install_dependee(node.installable)
+        except Exception as e:  # noqa: BLE001
+            _LOGGER.info("%s failed to install: %s\n%s", node.installable.name, e, traceback.format_exc(5))
+            return False
+
+    def run(self, to_do: list[tuple[Installable, bool]]) -> InstallSummary:
+        """Install every installable flagged as needing installation in `to_do`.
+
+        Args:
+            to_do: (installable, should_install) pairs, in the order they should preferably be started
+
+        Returns:
+            Summary of installed, skipped and failed requested installables
+        """
+        summary = InstallSummary()
+        to_install = []
+        for installable, should_install in to_do:
+            if should_install:
+                to_install.append(installable)
+            else:
+                print(f"Installing {installable.name}")
+                _LOGGER.info("%s is already installed, skipping", installable.name)
+                summary.skipped.append(installable.name)
+
+        nodes = build_install_graph(to_install)
+        # Start order: requested installables in the order given, then any extra dependees.
+        order = {name: index for index, name in enumerate(nodes)}
+        waiting_on = {name: set(node.depends) for name, node in nodes.items()}
+        ready = sorted((name for name, deps in waiting_on.items() if not deps), key=order.__getitem__)
+        for name in ready:
+            del waiting_on[name]
+
+        def fail(name: str, reason: str) -> None:
+            node = nodes[name]
+            if node.requested:
+                summary.failed.append(name)
+            for dependent in sorted(node.dependents, key=order.__getitem__):
+                if dependent in waiting_on:
+                    del waiting_on[dependent]
+                    _LOGGER.error("Not installing %s: dependency %s %s", dependent, name, reason)
+                    fail(dependent, "was not installed")
+
+        _LOGGER.info("Installing %d targets with up to %d in parallel", len(nodes), self.max_workers)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            running: dict[Future, str] = {}
+            while ready or running:
+                while ready and len(running) < self.max_workers:
+                    name = ready.pop(0)
+                    running[executor.submit(self._run_node, nodes[name])] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                newly_ready = []
+                for future in done:
+                    name = running.pop(future)
+                    if not future.result():
+                        fail(name, "failed to install")
+                        continue
+                    if nodes[name].requested:
+                        summary.installed.append(name)
+                    for dependent in nodes[name].dependents:
+                        if dependent in waiting_on:
+                            waiting_on[dependent].discard(name)
+                            if not waiting_on[dependent]:
+                                del waiting_on[dependent]
+                                newly_ready.append(dependent)
+                ready = sorted(ready + newly_ready, key=order.__getitem__)
+
+        # Anything left has a dependency cycle and could never start.
+        for name in sorted(waiting_on, key=order.__getitem__):
+            _LOGGER.error("Not installing %s: dependency cycle via %s", name, ", ".join(sorted(waiting_on[name])))
+            if nodes[name].requested:
+                summary.failed.append(name)
+        return summary
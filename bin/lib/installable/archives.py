@@ -15,7 +15,7 @@ from typing import Any
 
 from lib import amazon
 from lib.amazon import list_compilers
-from lib.installable.installable import Installable, command_config
+from lib.installable.installable import Installable, VerifyResult, command_config
 from lib.installation_context import InstallationContext, is_windows
 from lib.nightly_versions import NightlyVersions
 from lib.staging import StagingDir
@@ -72,16 +72,18 @@ class S3TarballInstallable(Installable):
     def stage(self, staging: StagingDir) -> None:
         self.fetch_and_pipe_to(staging, self.s3_path, self.tar_cmd)
         if self.strip:
-            self.install_context.strip_exes(staging, self.strip)
+            self.install_context.strip_exes(staging, self.strip, self.name)
 
         self.install_context.run_script(staging, staging.path, self.after_stage_script)
 
-    def verify(self) -> bool:
-        if not super().verify():
-            return False
+    def verify(self) -> VerifyResult:
+        if not (result := super().verify()).ok:
+            return result
         with self.install_context.new_staging_dir() as staging:
             self.stage(staging)
-            return self.install_context.compare_against_staging(staging, self.untar_dir, self.install_path)
+            return VerifyResult.of(
+                self.install_context.compare_against_staging(staging, self.untar_dir, self.install_path)
+            )
 
     def install(self) -> None:
         super().install()
@@ -120,15 +122,17 @@ class NightlyInstallable(Installable):
     def stage(self, staging: StagingDir) -> None:
         self.install_context.fetch_s3_and_pipe_to(staging, f"{self.s3_path}.tar.xz", ["tar", "Jxf", "-"])
         if self.strip:
-            self.install_context.strip_exes(staging, self.strip)
+            self.install_context.strip_exes(staging, self.strip, self.name)
         self.install_context.run_script(staging, staging.path / self.local_path, self.after_stage_script)
 
-    def verify(self) -> bool:
-        if not super().verify():
-            return False
+    def verify(self) -> VerifyResult:
+        if not (result := super().verify()).ok:
+            return result
         with self.install_context.new_staging_dir() as staging:
             self.stage(staging)
-            return self.install_context.compare_against_staging(staging, self.local_path, self.install_path)
+            return VerifyResult.of(
+                self.install_context.compare_against_staging(staging, self.local_path, self.install_path)
+            )
 
     def should_install(self) -> bool:
         target: Path = self.install_context.get_current_link_target(self.path_name_symlink)
@@ -233,17 +237,19 @@ class TarballInstallable(Installable):
         if self.configure_command:
             self.install_context.stage_command(staging, self.configure_command)
         if self.strip:
-            self.install_context.strip_exes(staging, self.strip)
+            self.install_context.strip_exes(staging, self.strip, self.name)
         if not (staging.path / self.untar_path).is_dir():
             raise RuntimeError(f"After unpacking, {self.untar_path} was not a directory")
         self.install_context.run_script(staging, staging.path / self.untar_to, self.after_stage_script)
 
-    def verify(self) -> bool:
-        if not super().verify():
-            return False
+    def verify(self) -> VerifyResult:
+        if not (result := super().verify()).ok:
+            return result
         with self.install_context.new_staging_dir() as staging:
             self.stage(staging)
-            return self.install_context.compare_against_staging(staging, self.untar_path, self.install_path)
+            return VerifyResult.of(
+                self.install_context.compare_against_staging(staging, self.untar_path, self.install_path)
+            )
 
     def install(self) -> None:
         super().install()
@@ -324,18 +330,18 @@ class ZipArchiveInstallable(Installable):
         if self.configure_command:
             self.install_context.stage_command(staging, self.configure_command)
         if self.strip:
-            self.install_context.strip_exes(staging, self.strip)
+            self.install_context.strip_exes(staging, self.strip, self.name)
         full_install_path = staging.path / self.install_path
         if not full_install_path.is_dir():
             raise RuntimeError(f"After unpacking, {self.install_path} was not a directory")
         self.install_context.run_script(staging, full_install_path, self.after_stage_script)
 
-    def verify(self) -> bool:
-        if not super().verify():
-            return False
+    def verify(self) -> VerifyResult:
+        if not (result := super().verify()).ok:
+            return result
         with self.install_context.new_staging_dir() as staging:
             self.stage(staging)
-            return self.install_context.compare_against_staging(staging, self.install_path)
+            return VerifyResult.of(self.install_context.compare_against_staging(staging, self.install_path))
 
     def install(self) -> None:
         super().install()
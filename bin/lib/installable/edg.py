@@ -11,6 +11,7 @@ from typing import Any
 
 from lib import amazon
 from lib.installable.archives import NonFreeS3TarballInstallable
+from lib.installable.installable import VerifyResult
 from lib.installation_context import InstallationContext
 from lib.staging import StagingDir
 
@@ -231,12 +232,14 @@ class EdgCompilerInstallable(NonFreeS3TarballInstallable):
         backend_compiler_scrape = self._scrape_backend_compiler(staging, backend_compiler_path)
         self._write_compiler_shim(staging, backend_compiler_path, backend_compiler_scrape)
 
-    def verify(self) -> bool:
-        if not super().verify():
-            return False
+    def verify(self) -> VerifyResult:
+        if not (result := super().verify()).ok:
+            return result
         with self.install_context.new_staging_dir() as staging:
             self.stage(staging)
-            return self.install_context.compare_against_staging(staging, self.untar_dir, self.install_path)
+            return VerifyResult.of(
+                self.install_context.compare_against_staging(staging, self.untar_dir, self.install_path)
+            )
 
     def install(self) -> None:
         super().install()
@@ -7,7 +7,7 @@ import shlex
 import subprocess
 from pathlib import Path
 
-from lib.installable.installable import Installable
+from lib.installable.installable import Installable, VerifyResult
 from lib.staging import StagingDir
 
 _CLONE_METHODS = {"clone_branch", "nightlyclone", "nightlybranch"}
@@ -195,16 +195,18 @@ class GitHubInstallable(Installable):
             raise RuntimeError(f"Unknown Github method {self.method}")
 
         if self.strip:
-            self.install_context.strip_exes(staging, self.strip)
+            self.install_context.strip_exes(staging, self.strip, self.name)
 
         self.install_context.run_script(staging, staged_dest, self.after_stage_script)
 
-    def verify(self):
-        if not super().verify():
-            return False
+    def verify(self) -> VerifyResult:
+        if not (result := super().verify()).ok:
+            return result
         with self.install_context.new_staging_dir() as staging:
             self.stage(staging)
-            return self.install_context.compare_against_staging(staging, self.untar_dir, self.install_path)
+            return VerifyResult.of(
+                self.install_context.compare_against_staging(staging, self.untar_dir, self.install_path)
+            )
 
     def install(self) -> None:
         super().install()
@@ -8,6 +8,7 @@ import shutil
 import socket
 import subprocess
 from collections.abc import Callable
+from dataclasses import dataclass
 from functools import partial
 from pathlib import Path
 from typing import Any
@@ -22,6 +23,7 @@ from lib.library_platform import LibraryPlatform
 from lib.nightly_versions import NightlyVersions
 from lib.rust_library_builder import RustLibraryBuilder
 from lib.staging import StagingDir
+from lib.tree_compare import TreeDiff
 
 _LOGGER = logging.getLogger(__name__)
 _DEP_RE = re.compile("%DEP([0-9]+)%")
@@ -33,6 +35,18 @@ nightlies: NightlyVersions = NightlyVersions(_LOGGER)
 SimpleJsonType = (int, float, str, bool)
 
 
+@dataclass(frozen=True)
+class VerifyResult:
+    """Whether an installation is as expected, and how it differs from a fresh install if it was compared with one."""
+
+    ok: bool
+    differences: TreeDiff | None = None
+
+    @classmethod
+    def of(cls, differences: TreeDiff) -> VerifyResult:
+        return cls(differences.identical, differences)
+
+
 class Installable:
     _check_link: Callable[[], bool] | None
     check_env: dict
@@ -123,8 +137,8 @@ class Installable:
                 return i
         raise RuntimeError(f"Missing dependee {name} - did you forget to add it as a dependency?")
 
-    def verify(self) -> bool:
-        return True
+    def verify(self) -> VerifyResult:
+        return VerifyResult(ok=True)
 
     def should_install(self) -> bool:
         if self.install_context.only_nightly and not self.nightly_like:
@@ -232,12 +246,17 @@ class Installable:
                 )
                 return False
 
+        if self.install_context.check_passed_previously(self.install_path, self.check_call, self.check_env):
+            self._logger.debug("Check call previously passed against this installation")
+            return True
+
         try:
             res_call = self.check_output_under_different_user()
 
             self.save_version(self.check_call[0], res_call)
 
             self._logger.debug("Check call returned %s", res_call)
+            self.install_context.record_check_passed(self.install_path, self.check_call, self.check_env)
             return True
         except FileNotFoundError:
             self._logger.debug("File not found for %s", self.check_call)
@@ -335,13 +354,13 @@ class Installable:
     def is_squashable(self) -> bool:
         return True
 
-    def squash_to(self, destination_image: Path, squashfs_config: SquashfsConfig):
+    def squash_to(self, destination_image: Path, squashfs_config: SquashfsConfig, processors: int | None = None):
         destination_image.parent.mkdir(parents=True, exist_ok=True)
         source_folder = self.install_context.destination / self.install_path
         temp_image = destination_image.with_suffix(".tmp")
         temp_image.unlink(missing_ok=True)
         self._logger.info("Squashing %s...", source_folder)
-        self.install_context.check_call([
+        command = [
             squashfs_config.mksquashfs_path,
             str(source_folder),
             str(temp_image),
@@ -351,7 +370,10 @@ class Installable:
             squashfs_config.compression,
             "-Xcompression-level",
             str(squashfs_config.compression_level),
-        ])
+        ]
+        if processors is not None:
+            command += ["-processors", str(processors)]
+        self.install_context.check_call(command)
         temp_image.replace(destination_image)
 
 
@@ -371,12 +393,12 @@ class SingleFileInstallable(Installable):
         out_file_path.chmod(0o755)
         self.install_context.run_script(staging, staging.path, self.after_stage_script)
 
-    def verify(self) -> bool:
-        if not super().verify():
-            return False
+    def verify(self) -> VerifyResult:
+        if not (result := super().verify()).ok:
+            return result
         with self.install_context.new_staging_dir() as staging:
             self.stage(staging)
-            return self.install_context.compare_against_staging(staging, self.install_path)
+            return VerifyResult.of(self.install_context.compare_against_staging(staging, self.install_path))
 
     def install(self) -> None:
         super().install()
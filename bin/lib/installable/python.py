@@ -6,7 +6,7 @@ from collections.abc import Callable
 from pathlib import Path
 from typing import Any
 
-from lib.installable.installable import Installable
+from lib.installable.installable import Installable, VerifyResult
 from lib.installation_context import InstallationContext
 from lib.staging import StagingDir
 
@@ -109,12 +109,12 @@ class PipInstallable(Installable):
             packages = [packages]
         self.install_context.check_output([str(venv / "bin" / "pip"), "--no-cache-dir", "install", *packages])
 
-    def verify(self) -> bool:
-        if not super().verify():
-            return False
+    def verify(self) -> VerifyResult:
+        if not (result := super().verify()).ok:
+            return result
         with self.install_context.new_staging_dir() as staging:
             self.stage(staging)
-            return self.install_context.compare_against_staging(staging, self.install_path)
+            return VerifyResult.of(self.install_context.compare_against_staging(staging, self.install_path))
 
     def install(self) -> None:
         super().install()
@@ -178,12 +178,12 @@ class UvInstallable(Installable):
         if self.after_stage_script:
             self.install_context.run_script(staging, venv, self.after_stage_script)
 
-    def verify(self) -> bool:
-        if not super().verify():
-            return False
+    def verify(self) -> VerifyResult:
+        if not (result := super().verify()).ok:
+            return result
         with self.install_context.new_staging_dir() as staging:
             self.stage(staging)
-            return self.install_context.compare_against_staging(staging, self.install_path)
+            return VerifyResult.of(self.install_context.compare_against_staging(staging, self.install_path))
 
     def install(self) -> None:
         super().install()
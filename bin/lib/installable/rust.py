@@ -9,7 +9,7 @@ from pathlib import Path
 from typing import Any
 
 from lib.amazon import list_s3_artifacts
-from lib.installable.installable import Installable
+from lib.installable.installable import Installable, VerifyResult
 from lib.installation_context import InstallationContext
 from lib.staging import StagingDir
 
@@ -89,12 +89,12 @@ class RustInstallable(Installable):
                     return True
         return super().should_install()
 
-    def verify(self) -> bool:
-        if not super().verify():
-            return False
+    def verify(self) -> VerifyResult:
+        if not (result := super().verify()).ok:
+            return result
         with self.install_context.new_staging_dir() as staging:
             self.stage(staging)
-            return self.install_context.compare_against_staging(staging, self.install_path)
+            return VerifyResult.of(self.install_context.compare_against_staging(staging, self.install_path))
 
     def install(self) -> None:
         super().install()
@@ -6,7 +6,7 @@ from functools import partial
 from pathlib import Path
 from typing import Any
 
-from lib.installable.installable import Installable
+from lib.installable.installable import Installable, VerifyResult
 from lib.installation_context import InstallationContext
 from lib.staging import StagingDir
 
@@ -73,17 +73,17 @@ class ScriptInstallable(Installable):
             cmd = ["bwrap", "--dev-bind", "/", "/", "--tmpfs", str(self.install_context.destination)] + binds + cmd
         self.install_context.stage_command(staging, cmd)
         if self.strip:
-            self.install_context.strip_exes(staging, self.strip)
+            self.install_context.strip_exes(staging, self.strip, self.name)
 
     def resolve_dependencies(self, resolver: Callable[[str], str]) -> None:
         self.script = resolver(self.script)
 
-    def verify(self) -> bool:
-        if not super().verify():
-            return False
+    def verify(self) -> VerifyResult:
+        if not (result := super().verify()).ok:
+            return result
         with self.install_context.new_staging_dir() as staging:
             self.stage(staging)
-            return self.install_context.compare_against_staging(staging, self.install_path)
+            return VerifyResult.of(self.install_context.compare_against_staging(staging, self.install_path))
 
     def install(self) -> None:
         super().install()
@@ -107,17 +107,24 @@ _INSTALLER_TYPES = {
 }
 
 
+def installer_base_config(install_context) -> dict:
+    """The root configuration every target is expanded against."""
+    return dict(
+        destination=install_context.destination,
+        yaml_dir=install_context.yaml_dir,
+        resource_dir=install_context.resource_dir,
+        now=datetime.now(),
+    )
+
+
 def installers_for(install_context, nodes, enabled, validate_only=False):
-    for target in targets_from(
-        nodes,
-        enabled,
-        dict(
-            destination=install_context.destination,
-            yaml_dir=install_context.yaml_dir,
-            resource_dir=install_context.resource_dir,
-            now=datetime.now(),
-        ),
-    ):
+    return installers_for_targets(
+        install_context, targets_from(nodes, enabled, installer_base_config(install_context)), validate_only
+    )
+
+
+def installers_for_targets(install_context, targets, validate_only=False):
+    for target in targets:
         context = "/".join(target.get("context", []))
         name = target.get("name", "<unnamed>")
         assert "type" in target, f"Missing 'type' in {context} {name}"
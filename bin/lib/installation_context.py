@@ -9,50 +9,66 @@ import shutil
 import stat
 import subprocess
 import tempfile
+import threading
 import time
 import uuid
-from collections.abc import Callable, Collection, Iterator, Sequence
+from collections.abc import Callable, Collection, Iterable, Iterator, Sequence
 from pathlib import Path
-from typing import IO
+from typing import Protocol
 
+import humanfriendly
 import requests
 import requests.adapters
 import requests_cache
 import yaml
 
-from lib.cefs.deployment import backup_and_symlink, deploy_to_cefs_transactional
-from lib.cefs.paths import get_cefs_filename_for_image, get_cefs_paths
+from lib.artifact_cache import ArtifactCache
+from lib.cefs.deployment import backup_and_symlink, deploy_to_cefs_by_content
+from lib.cefs.paths import get_cefs_paths
 from lib.cefs_manifest import (
     create_installable_manifest_entry,
     create_manifest,
 )
+from lib.check_cache import CheckResultCache
 from lib.config import Config
 from lib.config_safe_loader import ConfigSafeLoader
+from lib.elf_header import read_elf_header
 from lib.library_platform import LibraryPlatform
+from lib.ranged_fetch import ranged_chunks, supports_ranges
+from lib.spool_buffer import SpoolAborted, SpoolBuffer
 from lib.squashfs import create_squashfs_image
 from lib.staging import StagingDir
+from lib.strip import strip_tree
+from lib.tree_compare import TreeDiff, compare_trees
 
 _LOGGER = logging.getLogger(__name__)
 PathOrString = Path | str
 
+CHECK_CACHE_FILENAME = ".ce_install_check_cache.json"
+# How much of a download to hold in memory while waiting for it to be unpacked, before spooling to disk.
+SPOOL_MEMORY_LIMIT = 64 * 1024 * 1024
+# Downloads smaller than this aren't worth splitting across several connections.
+FETCH_PARTS_MIN_SIZE = 64 * 1024 * 1024
+
 
 def is_windows():
     return os.name == "nt"
 
 
-def fix_single_permission(file_path: Path) -> None:
-    """Fix permissions for a single file or directory.
+def _report_fetch(url: str, fetched: int, elapsed: float, peak_temp: int) -> None:
+    _LOGGER.info(
+        "Fetched and unpacked %s: %s in %.1fs (%s/s), peak temporary disk use %s",
+        url,
+        humanfriendly.format_size(fetched, binary=True),
+        elapsed,
+        humanfriendly.format_size(fetched / max(elapsed, 0.001), binary=True),
+        humanfriendly.format_size(peak_temp, binary=True),
+    )
 
-    Mirrors user permissions to group and other, but never grants write to group/other.
-    Always ensures user has write permission for future editing.
-    """
-    # Skip symlinks - they don't have their own permissions and
-    # chmod would affect the target, which may not exist (broken symlinks)
-    if file_path.is_symlink():
-        return
 
-    current_mode = file_path.stat().st_mode
-    current_perms = stat.S_IMODE(current_mode)
+def fixed_permission_bits(current_perms: int) -> int:
+    """The permission bits fix_single_permission would give a file that has current_perms."""
+    current_perms = stat.S_IMODE(current_perms)
 
     # Build expected permissions:
     # - User always gets write, keeps read/exec
@@ -65,6 +81,23 @@ def fix_single_permission(file_path: Path) -> None:
     if bool(current_perms & stat.S_IXUSR):
         new_perms |= stat.S_IXGRP
         new_perms |= stat.S_IXOTH
+    return new_perms
+
+
+def fix_single_permission(file_path: Path) -> None:
+    """Fix permissions for a single file or directory.
+
+    Mirrors user permissions to group and other, but never grants write to group/other.
+    Always ensures user has write permission for future editing.
+    """
+    # Skip symlinks - they don't have their own permissions and
+    # chmod would affect the target, which may not exist (broken symlinks)
+    if file_path.is_symlink():
+        return
+
+    current_mode = file_path.stat().st_mode
+    current_perms = stat.S_IMODE(current_mode)
+    new_perms = fixed_permission_bits(current_perms)
 
     if current_perms != new_perms:
         _LOGGER.debug("Fixing permissions on %s: %s -> %s", file_path, oct(current_perms), oct(new_perms))
@@ -99,6 +132,14 @@ class PostFailure(RuntimeError):
     pass
 
 
+class ByteSink(Protocol):
+    """Where fetch_to writes a download: a binary file, or anything else with write and flush (e.g. a SpoolBuffer)."""
+
+    def write(self, data: bytes, /) -> int: ...
+
+    def flush(self) -> None: ...
+
+
 class InstallationContext:
     def __init__(
         self,
@@ -116,6 +157,10 @@ class InstallationContext:
         check_user: str,
         platform: LibraryPlatform,
         config: Config,
+        cache_check_results: bool = False,
+        stream_fetches: bool = True,
+        fetch_parts: int = 1,
+        fetch_parts_min_size: int = FETCH_PARTS_MIN_SIZE,
     ):
         self._destination = destination
         self._prior_installation = self.destination
@@ -146,6 +191,53 @@ class InstallationContext:
         self.yaml_dir = yaml_dir
         self.resource_dir = resource_dir
         self.run_checks_as_user = check_user
+        self.stream_fetches = stream_fetches
+        self.fetch_parts = fetch_parts
+        self.fetch_parts_min_size = fetch_parts_min_size
+        self.download_cache = (
+            ArtifactCache(config.cefs.local_temp_dir / "download-cache", config.cefs.download_cache_size)
+            if config.cefs.download_cache_size
+            else None
+        )
+        self._fetch_slots = threading.BoundedSemaphore(1)
+        self._extract_slots = threading.BoundedSemaphore(1)
+        self._move_slots = threading.BoundedSemaphore(1)
+        self._check_results = CheckResultCache(destination / CHECK_CACHE_FILENAME if cache_check_results else None)
+
+    def limit_concurrency(self, fetches: int, extracts: int, moves: int) -> None:
+        """Limit how many downloads, extractions and moves to the destination may run at once.
+
+        Only matters when installing from several threads at once; each phase is limited independently so that
+        (say) a slow download doesn't stop other targets from being untarred.
+        """
+        self._fetch_slots = threading.BoundedSemaphore(max(1, fetches))
+        self._extract_slots = threading.BoundedSemaphore(max(1, extracts))
+        self._move_slots = threading.BoundedSemaphore(max(1, moves))
+
+    def check_passed_previously(self, install_path: str, check_call: list[str], check_env: dict[str, str]) -> bool:
+        """Whether an installation check is known to have passed against the installation as it is now."""
+        return self._check_results.passed(
+            self.destination / check_call[0],
+            self.destination / install_path,
+            [self.run_checks_as_user] + check_call,
+            check_env,
+        )
+
+    def record_check_passed(self, install_path: str, check_call: list[str], check_env: dict[str, str]) -> None:
+        self._check_results.record_pass(
+            self.destination / check_call[0],
+            self.destination / install_path,
+            [self.run_checks_as_user] + check_call,
+            check_env,
+        )
+
+    def save_check_results(self) -> None:
+        if not self.dry_run:
+            self._check_results.save()
+
+    def report_download_cache(self) -> None:
+        if self.download_cache is not None:
+            self.download_cache.report()
 
     @property
     def destination(self) -> Path:
@@ -180,32 +272,70 @@ class InstallationContext:
         _LOGGER.debug("Fetching %s", url)
         return yaml.load(self.fetcher.get(url).text, Loader=ConfigSafeLoader)
 
-    def fetch_to(self, url: str, fd: IO[bytes], agent: str = "") -> None:
-        _LOGGER.debug("Fetching %s", url)
+    def fetch_to(self, url: str, fd: ByteSink, agent: str = "") -> None:
+        with self._fetch_slots:
+            self._fetch_to(url, fd, agent)
 
-        if agent:
-            headers = {"User-Agent": agent}
+    def _fetch_to(self, url: str, fd: ByteSink, agent: str = "") -> None:
+        _LOGGER.debug("Fetching %s", url)
 
-            if self.allow_unsafe_ssl:
-                request = self.fetcher.get(url, stream=True, verify=False, allow_redirects=True, headers=headers)
-            else:
-                request = self.fetcher.get(url, stream=True, allow_redirects=True, headers=headers)
-        else:
-            if self.allow_unsafe_ssl:
-                request = self.fetcher.get(url, stream=True, verify=False, allow_redirects=True)
-            else:
-                request = self.fetcher.get(url, stream=True, allow_redirects=True)
+        headers = {"User-Agent": agent} if agent else {}
+        request_args = (
+            {"allow_redirects": True, "verify": False} if self.allow_unsafe_ssl else {"allow_redirects": True}
+        )
+        request = self.fetcher.get(url, stream=True, headers=headers, **request_args)
 
         if not request.ok:
             _LOGGER.error("Failed to fetch %s: %s", url, request)
             raise FetchFailure(f"Fetch failure for {url}: {request}")
+
+        if self.download_cache is not None:
+            cached = self.download_cache.open_cached(url, request.headers)
+            if cached is not None:
+                request.close()
+                with cached:
+                    shutil.copyfileobj(cached, fd, 4 * 1024 * 1024)
+                fd.flush()
+                return
+
+        length = int(request.headers.get("content-length", 0) or 0)
+        chunks: Iterable[bytes]
+        if self._should_fetch_in_parts(request, length):
+            request.close()
+            _LOGGER.info("Fetching %s (%d bytes) over %d connections", url, length, self.fetch_parts)
+            chunks = ranged_chunks(
+                self.fetcher, url, length, self.fetch_parts, request_args, headers, request.headers.get("etag", "")
+            )
+        else:
+            _LOGGER.info("Fetching %s (%d bytes)", url, length)
+            chunks = request.iter_content(chunk_size=4 * 1024 * 1024)
+
+        if self.download_cache is None:
+            self._write_chunks_to(url, chunks, length, fd, None)
+            return
+        with self.download_cache.storing(url, request.headers) as store:
+            self._write_chunks_to(url, chunks, length, fd, store)
+
+    def _should_fetch_in_parts(self, request: requests.Response, length: int) -> bool:
+        return (
+            self.fetch_parts > 1
+            and length >= self.fetch_parts_min_size
+            and supports_ranges(request)
+            # A caching session would conflate the ranges, which all have the same URL.
+            and not isinstance(self.fetcher, requests_cache.CachedSession)
+        )
+
+    @staticmethod
+    def _write_chunks_to(
+        url: str, chunks: Iterable[bytes], length: int, fd: ByteSink, store: Callable[[bytes], None] | None
+    ) -> None:
         fetched = 0
-        length = int(request.headers.get("content-length", 0))
-        _LOGGER.info("Fetching %s (%d bytes)", url, length)
         report_every_secs = 5
         report_time = time.time() + report_every_secs
-        for chunk in request.iter_content(chunk_size=4 * 1024 * 1024):
+        for chunk in chunks:
             fd.write(chunk)
+            if store is not None:
+                store(chunk)
             fetched += len(chunk)
             now = time.time()
             if now >= report_time:
@@ -238,19 +368,68 @@ class InstallationContext:
                 # the tar file was automatically suffixed with ~ by 7z, extract that tar to the untar_dir
                 script_file.write(f'7z x -ttar -o"{untar_dir}" {temp_file_path}~\n'.encode())
 
-            subprocess.check_call(["pwsh", script_file.name], cwd=str(untar_dir))
+            with self._extract_slots:
+                subprocess.check_call(["pwsh", script_file.name], cwd=str(untar_dir))
 
             os.remove(temp_file_path + "~")
             os.remove(temp_file_path)
             os.remove(script_file.name)
+        elif self.stream_fetches:
+            self._stream_url_to(url, command, untar_dir, agent)
         else:
             # We stream to a temporary file first before then piping this to the command
             # as sometimes the command can take so long the URL endpoint closes the door on us
+            start = time.time()
             with tempfile.TemporaryFile() as fd:
                 self.fetch_to(url, fd, agent)
+                fetched = fd.tell()
                 fd.seek(0)
                 _LOGGER.info("Piping to %s", shlex.join(command))
-                subprocess.check_call(command, stdin=fd, cwd=str(untar_dir))
+                with self._extract_slots:
+                    subprocess.check_call(command, stdin=fd, cwd=str(untar_dir))
+            _report_fetch(url, fetched, time.time() - start, fetched)
+
+    def _stream_url_to(self, url: str, command: Sequence[str], untar_dir: Path, agent: str) -> None:
+        """Pipe `url` to `command` while it downloads, spooling to disk only if the command falls behind."""
+        spool = SpoolBuffer(SPOOL_MEMORY_LIMIT)
+        start = time.time()
+        with self._extract_slots:
+            _LOGGER.info("Streaming to %s", shlex.join(command))
+            process = subprocess.Popen(command, stdin=subprocess.PIPE, cwd=str(untar_dir))
+            stdin = process.stdin
+            assert stdin is not None
+
+            def feed() -> None:
+                try:
+                    while chunk := spool.read():
+                        stdin.write(chunk)
+                except (OSError, SpoolAborted) as e:
+                    spool.abort(e)
+                finally:
+                    with contextlib.suppress(OSError):
+                        stdin.close()
+
+            feeder = threading.Thread(target=feed, name=f"feed-{command[0]}", daemon=True)
+            feeder.start()
+            try:
+                self.fetch_to(url, spool, agent)
+                spool.close()
+            except SpoolAborted:
+                # The command stopped reading: its exit status below says why.
+                pass
+            except BaseException as e:
+                spool.abort(e)
+                feeder.join()
+                process.kill()
+                process.wait()
+                spool.discard()
+                raise
+            feeder.join()
+            returncode = process.wait()
+            spool.discard()
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, list(command))
+        _report_fetch(url, spool.bytes_written, time.time() - start, spool.peak_spilled)
 
     def stage_command(self, staging: StagingDir, command: Sequence[str], cwd: Path | None = None) -> None:
         _LOGGER.info("Staging with %s", shlex.join(command))
@@ -291,6 +470,7 @@ class InstallationContext:
         relative_source = full_source.relative_to(Path(os.path.commonpath([full_source, full_dest])))
         _LOGGER.info("Symlinking %s to %s", relative_source, full_dest)
         full_dest.symlink_to(relative_source)
+        self._check_results.invalidate(full_dest)
 
     def glob(self, pattern: str) -> Collection[str]:
         return [os.path.relpath(x, str(self.destination)) for x in glob.glob(str(self.destination / pattern))]
@@ -300,6 +480,7 @@ class InstallationContext:
             _LOGGER.info("Would remove directory %s but in dry-run mode", directory)
         else:
             shutil.rmtree(str(self.destination / directory), ignore_errors=True)
+            self._check_results.invalidate(self.destination / directory)
             _LOGGER.info("Removing %s", directory)
 
     def check_link(self, source: str, link: str) -> bool:
@@ -327,6 +508,20 @@ class InstallationContext:
             _LOGGER.info("Would install %s to %s but in dry-run mode", source, dest)
             return
 
+        try:
+            with self._move_slots:
+                self._move_from_staging(staging, installable_name, source, dest, relocate)
+        finally:
+            self._check_results.invalidate(self.destination / dest)
+
+    def _move_from_staging(
+        self,
+        staging: StagingDir,
+        installable_name: str,
+        source: PathOrString,
+        dest: PathOrString,
+        relocate: Callable[[Path, Path], None] | None,
+    ) -> None:
         # Check if CEFS is enabled and should be used for this installation
         if self.cefs_enabled:
             _LOGGER.info("Installing via CEFS: %s -> %s", source, dest)
@@ -376,17 +571,24 @@ class InstallationContext:
                 _LOGGER.warning("Moving old destination back")
                 existing_dir_rename.replace(dest_path)
 
-    def compare_against_staging(self, staging: StagingDir, source_str: str, dest_str: str | None = None) -> bool:
+    def compare_against_staging(self, staging: StagingDir, source_str: str, dest_str: str | None = None) -> TreeDiff:
         dest_str = dest_str or source_str
         source = staging.path / source_str
         dest = self.destination / dest_str
         _LOGGER.info("Comparing %s vs %s...", source, dest)
-        result = subprocess.call(["diff", "-r", source, dest])
-        if result == 0:
-            _LOGGER.info("Contents match")
+        diff = compare_trees(source, dest)
+        if diff.identical:
+            _LOGGER.info(
+                "Contents match (%d files, %s hashed)",
+                diff.files_hashed,
+                humanfriendly.format_size(diff.bytes_hashed, binary=True),
+            )
         else:
-            _LOGGER.warning("Contents differ")
-        return result == 0
+            _LOGGER.warning("Contents differ: %s", diff.summary())
+            for what, paths in diff.to_json().items():
+                if isinstance(paths, list) and paths:
+                    _LOGGER.info("  %s: %s%s", what, ", ".join(paths[:10]), "..." if len(paths) > 10 else "")
+        return diff
 
     def check_output(self, args: list[str], env: dict | None = None, stderr_on_stdout=False) -> str:
         args = args[:]
@@ -426,25 +628,12 @@ class InstallationContext:
         _LOGGER.debug("Executing %s in %s", args, self.destination)
         subprocess.check_call(args, cwd=str(self.destination), env=env, stdin=subprocess.DEVNULL)
 
-    def strip_exes(self, staging: StagingDir, paths: bool | list[str]) -> None:
+    def strip_exes(self, staging: StagingDir, paths: bool | list[str], description: str = "") -> None:
         if isinstance(paths, bool):
             if not paths:
                 return
             paths = ["."]
-        to_strip = []
-        for path_part in paths:
-            path = staging.path / path_part
-            _LOGGER.debug("Looking for executables to strip in %s", path)
-            if not path.is_dir():
-                raise RuntimeError(f"While looking for files to strip, {path} was not a directory")
-            for dirpath, _, filenames in os.walk(str(path)):
-                for filename in filenames:
-                    full_path = os.path.join(dirpath, filename)
-                    if os.access(full_path, os.X_OK):
-                        to_strip.append(full_path)
-
-        # Deliberately ignore errors
-        subprocess.call(["strip"] + to_strip)
+        strip_tree([staging.path / path_part for path_part in paths], description or str(staging.path))
 
     def run_script(self, staging: StagingDir, from_path: str | Path, lines: list[str]) -> None:
         from_path = Path(from_path)
@@ -470,8 +659,8 @@ class InstallationContext:
                 if not self.dry_run:
                     script_file.unlink()
 
-    def is_elf(self, maybe_elf_file: Path):
-        return b"ELF" in subprocess.check_output(["file", maybe_elf_file])
+    def is_elf(self, maybe_elf_file: Path) -> bool:
+        return read_elf_header(maybe_elf_file) is not None
 
     def _deploy_to_cefs(
         self,
@@ -512,17 +701,12 @@ class InstallationContext:
         try:
             create_squashfs_image(self.config.squashfs, source_path, temp_squash_file)
 
-            filename = get_cefs_filename_for_image(temp_squash_file, "install", Path(dest))
-            cefs_paths = get_cefs_paths(self.config.cefs.image_dir, self.config.cefs.mount_point, filename)
-
-            if cefs_paths.image_path.exists():
-                _LOGGER.info("CEFS image already exists: %s", cefs_paths.image_path)
+            with deploy_to_cefs_by_content(
+                temp_squash_file, self.config.cefs.image_dir, "install", Path(dest), manifest, self.dry_run
+            ) as (filename, _):
+                cefs_paths = get_cefs_paths(self.config.cefs.image_dir, self.config.cefs.mount_point, filename)
+                # TODO: Add defer_cleanup parameter to install command to speed up bulk installations
                 backup_and_symlink(nfs_path, cefs_paths.mount_path, self.dry_run, defer_cleanup=False)
-            else:
-                _LOGGER.info("Copying squashfs to CEFS storage: %s", cefs_paths.image_path)
-                with deploy_to_cefs_transactional(temp_squash_file, cefs_paths.image_path, manifest, self.dry_run):
-                    # TODO: Add defer_cleanup parameter to install command to speed up bulk installations
-                    backup_and_symlink(nfs_path, cefs_paths.mount_path, self.dry_run, defer_cleanup=False)
         finally:
             if temp_squash_file.exists():
                 temp_squash_file.unlink()
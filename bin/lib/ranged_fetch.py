@@ -0,0 +1,127 @@
+"""Download a URL over several connections at once using HTTP Range requests.
+
+Single-stream throughput from S3 is limited per connection, so for large archives we fetch several byte ranges
+concurrently. The archive is split into ranges of at most PART_SIZE, fetched in order over a window of connections that
+only moves on as the caller consumes them, so each range fits in memory while it waits its turn and nothing is spilled
+to disk. The ranges are handed back in order, so the caller still sees one sequential stream it can pipe to `tar`.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Iterator, Mapping
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from lib.spool_buffer import SpoolAborted, SpoolBuffer
+
+_LOGGER = logging.getLogger(__name__)
+
+# Largest byte range to fetch in one request. Each is held in memory until the caller gets to it.
+PART_SIZE = 16 * 1024 * 1024
+_CHUNK_SIZE = 1024 * 1024
+
+
+class RangeFetchFailure(RuntimeError):
+    pass
+
+
+def supports_ranges(response: requests.Response) -> bool:
+    """Whether the server says it can serve byte ranges of the (unencoded) content of `response`."""
+    headers = response.headers
+    return headers.get("accept-ranges", "").lower() == "bytes" and not headers.get("content-encoding")
+
+
+def part_bounds(length: int, parts: int) -> list[tuple[int, int]]:
+    """Split `length` bytes into `parts` contiguous, inclusive (first, last) byte ranges."""
+    parts = max(1, min(parts, length))
+    return [(length * i // parts, length * (i + 1) // parts - 1) for i in range(parts)]
+
+
+def _fetch_part(
+    session: requests.Session,
+    url: str,
+    first: int,
+    last: int,
+    length: int,
+    spool: SpoolBuffer,
+    request_args: Mapping,
+    headers: Mapping[str, str],
+) -> None:
+    try:
+        headers = {**headers, "Range": f"bytes={first}-{last}"}
+        with session.get(url, stream=True, headers=headers, **request_args) as response:
+            content_range = response.headers.get("content-range", "")
+            # A 200 here means the server ignored the range, or (with If-Range) that the content changed under us.
+            if response.status_code != 206 or content_range != f"bytes {first}-{last}/{length}":
+                raise RangeFetchFailure(
+                    f"Bad response fetching bytes {first}-{last} of {url}: {response.status_code} {content_range!r}"
+                )
+            received = 0
+            for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+                spool.write(chunk)
+                received += len(chunk)
+        if received != last - first + 1:
+            raise RangeFetchFailure(f"Got {received} bytes of {url} for range {first}-{last}")
+        spool.close()
+    except BaseException as e:
+        spool.abort(e)
+        raise
+
+
+def ranged_chunks(
+    session: requests.Session,
+    url: str,
+    length: int,
+    parts: int,
+    request_args: Mapping | None = None,
+    headers: Mapping[str, str] | None = None,
+    etag: str = "",
+) -> Iterator[bytes]:
+    """Yield the `length` bytes of `url` in order, fetched with up to `parts` concurrent Range requests.
+
+    At most `parts` ranges (of at most PART_SIZE each) are held at once: the one being yielded and those being fetched
+    ahead of it. If `etag` is given, it's sent as If-Range so a change to the content part way through fails rather than
+    giving a mix of old and new. Any failure of any part is raised from the iterator; closing the iterator early stops
+    all the downloads.
+    """
+    headers = dict(headers or {})
+    if etag:
+        headers["If-Range"] = etag
+    bounds = part_bounds(length, max(parts, -(-length // PART_SIZE)))
+    window = max(1, min(parts, len(bounds)))
+    spools: list[SpoolBuffer] = []
+    _LOGGER.debug("Fetching %s in %d parts, %d at a time", url, len(bounds), window)
+    try:
+        with ThreadPoolExecutor(max_workers=window, thread_name_prefix="fetch-part") as executor:
+
+            def fetch_next_part() -> None:
+                first, last = bounds[len(spools)]
+                spool = SpoolBuffer(PART_SIZE)
+                spools.append(spool)
+                executor.submit(_fetch_part, session, url, first, last, length, spool, request_args or {}, headers)
+
+            try:
+                for _ in range(window):
+                    fetch_next_part()
+                for position in range(len(bounds)):
+                    spool = spools[position]
+                    while chunk := spool.read(_CHUNK_SIZE):
+                        yield chunk
+                    spool.discard()
+                    if len(spools) < len(bounds):
+                        fetch_next_part()
+            except SpoolAborted as e:
+                # Report why the part failed, rather than that it did.
+                if isinstance(e.__cause__, Exception):
+                    raise e.__cause__ from None
+                raise
+            finally:
+                # Stops any parts still downloading (a no-op if they all finished).
+                stopped = RangeFetchFailure(f"Fetch of {url} was abandoned")
+                for spool in spools:
+                    spool.abort(stopped)
+    finally:
+        for spool in spools:
+            spool.discard()
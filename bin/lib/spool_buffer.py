@@ -0,0 +1,118 @@
+"""A bounded in-memory FIFO that spills to disk when its consumer falls behind.
+
+Used to overlap downloading an archive with extracting it. The downloader is never blocked by a slow consumer (which
+would risk the remote end closing a slow connection on us); anything beyond the memory limit goes to a temporary
+file, which is read back and discarded once the consumer catches up.
+"""
+
+from __future__ import annotations
+
+import collections
+import tempfile
+import threading
+from pathlib import Path
+from typing import IO
+
+
+class SpoolAborted(RuntimeError):
+    pass
+
+
+class SpoolBuffer:
+    """Thread-safe FIFO of bytes with one writer and one reader.
+
+    The writer calls `write` (and `flush`, so this can be used as a file object by `fetch_to`) then `close`; the
+    reader calls `read` until it returns an empty bytes object. Either side may `abort` to make the other one stop.
+    """
+
+    def __init__(self, memory_limit: int, spill_dir: Path | None = None):
+        self.memory_limit = memory_limit
+        self.spill_dir = spill_dir
+        self.bytes_written = 0
+        self.peak_memory = 0
+        self.peak_spilled = 0
+        self.total_spilled = 0
+        self._chunks: collections.deque[bytes] = collections.deque()
+        self._memory = 0
+        self._spill: IO[bytes] | None = None
+        self._spill_write_pos = 0
+        self._spill_read_pos = 0
+        self._closed = False
+        self._aborted: BaseException | None = None
+        self._cond = threading.Condition()
+
+    def write(self, data: bytes) -> int:
+        if not data:
+            return 0
+        with self._cond:
+            if self._aborted:
+                raise SpoolAborted("Spool reader went away") from self._aborted
+            if self._closed:
+                raise ValueError("write to closed SpoolBuffer")
+            # Only use memory while nothing is waiting on disk, so data comes back out in order.
+            if self._spill_write_pos == self._spill_read_pos and self._memory + len(data) <= self.memory_limit:
+                self._chunks.append(bytes(data))
+                self._memory += len(data)
+                self.peak_memory = max(self.peak_memory, self._memory)
+            else:
+                if self._spill is None:
+                    self._spill = tempfile.TemporaryFile(dir=self.spill_dir)
+                self._spill.seek(self._spill_write_pos)
+                self._spill.write(data)
+                self._spill_write_pos += len(data)
+                self.total_spilled += len(data)
+                self.peak_spilled = max(self.peak_spilled, self._spill_write_pos - self._spill_read_pos)
+            self.bytes_written += len(data)
+            self._cond.notify_all()
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        """Mark the end of the data."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def abort(self, reason: BaseException) -> None:
+        """Stop both sides; subsequent writes and reads raise SpoolAborted."""
+        with self._cond:
+            self._aborted = reason
+            self._cond.notify_all()
+
+    def read(self, size: int = 4 * 1024 * 1024) -> bytes:
+        """Return up to `size` bytes, blocking until some are available. Returns b"" once closed and drained."""
+        with self._cond:
+            while True:
+                if self._aborted:
+                    raise SpoolAborted("Spool writer went away") from self._aborted
+                if self._chunks:
+                    chunk = self._chunks.popleft()
+                    if len(chunk) > size:
+                        self._chunks.appendleft(chunk[size:])
+                        chunk = chunk[:size]
+                    self._memory -= len(chunk)
+                    return chunk
+                if self._spill is not None and self._spill_read_pos < self._spill_write_pos:
+                    self._spill.seek(self._spill_read_pos)
+                    chunk = self._spill.read(min(size, self._spill_write_pos - self._spill_read_pos))
+                    self._spill_read_pos += len(chunk)
+                    if self._spill_read_pos == self._spill_write_pos:
+                        # Caught up: give the disk space back and go back to memory.
+                        self._spill.seek(0)
+                        self._spill.truncate()
+                        self._spill_read_pos = self._spill_write_pos = 0
+                    return chunk
+                if self._closed:
+                    return b""
+                self._cond.wait()
+
+    def discard(self) -> None:
+        """Release any temporary file; call once both sides are finished."""
+        with self._cond:
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+            self._chunks.clear()
+            self._memory = 0
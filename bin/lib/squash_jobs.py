@@ -0,0 +1,103 @@
+"""Parallel building and checking of squashfs images.
+
+Jobs are weighted by size (of the tree being squashed, or of the image being checked): progress and ETA are reported
+by bytes done rather than by job count, and the biggest jobs are started first so a long one isn't left running
+alone at the end. Results come back in the order the jobs were given, whatever order they finished in.
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import threading
+import time
+import traceback
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import humanfriendly
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SizedJob[T]:
+    name: str
+    size: int  # Bytes, only used for progress
+    run: Callable[[], T]
+
+
+@dataclass(frozen=True)
+class JobResult[T]:
+    name: str
+    result: T | None = None
+    error: str | None = None  # Set if the job raised
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def processors_per_job(workers: int, cores: int | None = None) -> int:
+    """How many processors each of `workers` concurrent mksquashfs runs can have without exceeding the core count."""
+    return max(1, (cores or multiprocessing.cpu_count()) // max(1, workers))
+
+
+class _Progress:
+    def __init__(self, what: str, total_jobs: int, total_bytes: int):
+        self.what = what
+        self.total_jobs = total_jobs
+        self.total_bytes = total_bytes
+        self.done_jobs = 0
+        self.done_bytes = 0
+        self.start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def job_done(self, job: SizedJob) -> None:
+        with self._lock:
+            self.done_jobs += 1
+            self.done_bytes += job.size
+            elapsed = time.monotonic() - self.start
+            remaining = self.total_bytes - self.done_bytes
+            if not remaining:
+                eta = "now"
+            elif self.done_bytes:
+                eta = humanfriendly.format_timespan(elapsed / self.done_bytes * remaining)
+            else:
+                eta = "unknown"
+            _LOGGER.info(
+                "%s %d/%d (%s of %s), ETA %s: finished %s",
+                self.what,
+                self.done_jobs,
+                self.total_jobs,
+                humanfriendly.format_size(self.done_bytes, binary=True),
+                humanfriendly.format_size(self.total_bytes, binary=True),
+                eta,
+                job.name,
+            )
+
+
+def run_sized_jobs[T](jobs: list[SizedJob[T]], max_workers: int, what: str) -> list[JobResult[T]]:
+    """Run the jobs on up to max_workers threads, largest first, logging progress as `what` (e.g. "Squashed").
+
+    A job raising doesn't stop the others: its result records the error instead.
+    """
+    progress = _Progress(what, len(jobs), sum(job.size for job in jobs))
+
+    def run(job: SizedJob[T]) -> JobResult[T]:
+        try:
+            result = JobResult(job.name, result=job.run())
+        except Exception as e:  # noqa: BLE001
+            _LOGGER.error("%s failed: %s\n%s", job.name, e, traceback.format_exc(5))
+            result = JobResult(job.name, error=str(e))
+        progress.job_done(job)
+        return result
+
+    start_order = sorted(range(len(jobs)), key=lambda index: -jobs[index].size)
+    results: list[JobResult[T] | None] = [None] * len(jobs)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="squash") as executor:
+        futures = {index: executor.submit(run, jobs[index]) for index in start_order}
+        for index, future in futures.items():
+            results[index] = future.result()
+    return [result for result in results if result is not None]
@@ -3,13 +3,25 @@
 
 from __future__ import annotations
 
+import dataclasses
+import hashlib
+import io
 import logging
+import multiprocessing
+import os
 import re
 import shutil
+import stat
 import subprocess
+import tarfile
+import tempfile
 import uuid
+import zlib
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
+from typing import cast
 
 from lib.config import SquashfsConfig
 
@@ -82,111 +94,208 @@ def parse_unsquashfs_line(line: str) -> SquashfsEntry | None:
     )
 
 
-def verify_squashfs_contents(img_path: Path, nfs_path: Path) -> int:
-    """Verify squashfs image contents match NFS directory. Returns error count."""
-    error_count = 0
-
-    try:
-        # Extract squashfs metadata without mounting
-        # TODO make unsquashfs path configurable like all other uses of it.
-        result = subprocess.run(
-            ["unsquashfs", "-ll", "-d", "", str(img_path)], capture_output=True, text=True, check=True
-        )
-        sqfs_output = result.stdout
-    except subprocess.CalledProcessError as e:
-        _LOGGER.error("Failed to read squashfs image %s: %s", img_path, e)
-        return 1
-    except FileNotFoundError:
-        _LOGGER.error("unsquashfs command not found - install squashfs-tools")
-        return 1
+CONTENT_CHECK_SAMPLE = "sample"
+CONTENT_CHECK_FULL = "full"
+# Proportion of the files that CONTENT_CHECK_SAMPLE hashes, chosen by a hash of their paths so reruns pick the same.
+CONTENT_SAMPLE_FRACTION = 1 / 16
+# How many differences verify_squashfs_contents logs individually before just counting them.
+_MAX_REPORTED_DIFFERENCES = 20
 
-    # Parse squashfs output to get file list
-    sqfs_files: dict[str, tuple[str, str]] = {}
-    for line in sqfs_output.split("\n"):
-        if not line.strip():
-            continue
 
-        # Skip known header lines from unsquashfs
-        if line.startswith("Parallel unsquashfs:") or line.startswith("Filesystem on"):
-            continue
-
-        try:
+@dataclass(frozen=True)
+class SquashfsDifference:
+    """A path that differs between a squashfs image and a directory, and why."""
+
+    path: str  # Relative to the compared roots
+    reason: str
+
+
+def _iter_image_entries(unsquashfs_path: str, img_path: Path, path_in_image: Path | None) -> Iterator[SquashfsEntry]:
+    """Stream the entries of a squashfs image (or those under path_in_image, relative to it) from `unsquashfs -ll`."""
+    command = [unsquashfs_path, "-ll", "-d", "", str(img_path)]
+    prefix = ""
+    if path_in_image is not None:
+        command.append(str(path_in_image))
+        prefix = f"{path_in_image.as_posix().strip('/')}/"
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) as process:
+        assert process.stdout is not None and process.stderr is not None
+        for line in process.stdout:
+            # Skip known header lines from unsquashfs
+            if line.startswith("Parallel unsquashfs:") or line.startswith("Filesystem on"):
+                continue
             parsed = parse_unsquashfs_line(line)
             if parsed is None:
                 # None means intentionally skipped (e.g., root directory, empty lines)
                 continue
-            sqfs_files[parsed.path] = (parsed.file_type, str(parsed.size))
-        except ValueError as e:
-            _LOGGER.error("Failed to parse unsquashfs output: %s", e)
-            raise
-
-    # Build equivalent from directory filesystem
-    dir_files: dict[str, tuple[str, str]] = {}
-    if not nfs_path.exists():
-        _LOGGER.error("Directory does not exist: %s", nfs_path)
-        return 1
-
-    for item in nfs_path.rglob("*"):
-        rel_path = str(item.relative_to(nfs_path))
-
-        stat_result = item.lstat()
-
-        if item.is_symlink():
-            file_type = "l"
-            size = "0"
-        elif item.is_dir():
-            file_type = "d"
-            size = "0"
-        elif item.is_file():
-            file_type = "-"
-            size = str(stat_result.st_size)
+            if prefix:
+                # Make paths relative to path_in_image, skipping it (and its parents) themselves
+                if not parsed.path.startswith(prefix):
+                    continue
+                parsed = dataclasses.replace(parsed, path=parsed.path[len(prefix) :])
+            yield parsed
+        stderr = process.stderr.read()
+    if process.returncode != 0:
+        raise SquashfsError(f"Failed to read squashfs image {img_path}: {stderr.strip()}")
+
+
+def _iter_directory_entries(root: Path, relative_dir: str = "") -> Iterator[SquashfsEntry]:
+    """Stream the entries under root in the order `unsquashfs -ll` lists an image: depth first, sorted by name."""
+    with os.scandir(root / relative_dir) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    for entry in entries:
+        relative = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+        if entry.is_symlink():
+            yield SquashfsEntry(file_type="l", size=0, path=relative, target=os.readlink(entry.path))
+        elif entry.is_dir(follow_symlinks=False):
+            yield SquashfsEntry(file_type="d", size=0, path=relative)
+            yield from _iter_directory_entries(root, relative)
         else:
-            raise ValueError(f"Unknown file type for {item}")
+            stat_result = entry.stat(follow_symlinks=False)
+            file_type = stat.filemode(stat_result.st_mode)[0]
+            yield SquashfsEntry(file_type=file_type, size=stat_result.st_size if file_type == "-" else 0, path=relative)
 
-        dir_files[rel_path] = (file_type, size)
 
-    # Compare file sets
-    only_in_sqfs = set(sqfs_files.keys()) - set(dir_files.keys())
-    only_in_dir = set(dir_files.keys()) - set(sqfs_files.keys())
+def _in_listing_order(
+    entries: Iterator[SquashfsEntry], what: object
+) -> Iterator[tuple[tuple[str, ...], SquashfsEntry]]:
+    """Pair each entry with its sort key, checking the entries really are in listing order.
 
-    # Report files only in one location
-    if only_in_sqfs:
-        error_count += len(only_in_sqfs)
-        _LOGGER.error(
-            "Files only in squashfs (%d): %s",
-            len(only_in_sqfs),
-            ", ".join(sorted(list(only_in_sqfs)[:5])) + ("..." if len(only_in_sqfs) > 5 else ""),
-        )
+    A depth-first listing with each directory sorted by name is ordered by path components, not by path string:
+    "a/b" comes before "a-b" in a listing, though "-" sorts before "/".
+    """
+    previous: tuple[str, ...] = ()
+    for entry in entries:
+        key = tuple(entry.path.split("/"))
+        if key <= previous:
+            raise SquashfsError(f"Listing of {what} is out of order at {entry.path}")
+        previous = key
+        yield key, entry
+
+
+def _compare_entries(image_entry: SquashfsEntry, dir_entry: SquashfsEntry) -> str | None:
+    if image_entry.file_type != dir_entry.file_type:
+        return f"type differs: squashfs={image_entry.file_type}, directory={dir_entry.file_type}"
+    if image_entry.size != dir_entry.size:
+        return f"size differs: squashfs={image_entry.size}, directory={dir_entry.size}"
+    if image_entry.file_type == "l" and image_entry.target != dir_entry.target:
+        return f"symlink target differs: squashfs={image_entry.target}, directory={dir_entry.target}"
+    return None
+
+
+def _is_sampled(path: str) -> bool:
+    return zlib.crc32(path.encode()) < CONTENT_SAMPLE_FRACTION * 2**32
+
+
+def _contents_match(unsquashfs_path: str, img_path: Path, path_in_image: str, nfs_file: Path) -> bool:
+    with nfs_file.open("rb") as f:
+        expected = hashlib.file_digest(f, "sha256").digest()
+    with subprocess.Popen(
+        [unsquashfs_path, "-cat", str(img_path), path_in_image], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    ) as process:
+        assert process.stdout is not None and process.stderr is not None
+        # With the default buffering, Popen's stdout is a BufferedReader, which has the readinto file_digest needs
+        actual = hashlib.file_digest(cast(io.BufferedReader, process.stdout), "sha256").digest()
+        stderr = process.stderr.read()
+    if process.returncode != 0:
+        raise SquashfsError(f"Failed to read {path_in_image} from {img_path}: {stderr.decode(errors='replace')}")
+    return actual == expected
+
+
+def compare_squashfs_contents(
+    img_path: Path,
+    nfs_path: Path,
+    path_in_image: Path | None = None,
+    content_check: str | None = None,
+    unsquashfs_path: str = "unsquashfs",
+    max_workers: int | None = None,
+) -> Iterator[SquashfsDifference]:
+    """Yield every difference between a squashfs image (or what's under path_in_image in it) and a directory.
+
+    The image listing and the directory walk are both streamed, in the same order, and merged, so memory use doesn't
+    grow with the number of files. Entries are compared on type, size and symlink target, and with content_check
+    (CONTENT_CHECK_SAMPLE or CONTENT_CHECK_FULL) some or all of the regular files that match on those also have their
+    contents hashed, reading them out of the image with `unsquashfs -cat` on up to max_workers threads.
 
-    if only_in_dir:
-        error_count += len(only_in_dir)
-        _LOGGER.error(
-            "Files only in directory (%d): %s",
-            len(only_in_dir),
-            ", ".join(sorted(list(only_in_dir)[:5])) + ("..." if len(only_in_dir) > 5 else ""),
+    Raises:
+        SquashfsError: If either listing can't be read
+    """
+    prefix = f"{path_in_image.as_posix().strip('/')}/" if path_in_image is not None else ""
+    image_entries = _in_listing_order(_iter_image_entries(unsquashfs_path, img_path, path_in_image), img_path)
+    dir_entries = _in_listing_order(_iter_directory_entries(nfs_path), nfs_path)
+    to_hash: list[str] = []
+
+    image_next = next(image_entries, None)
+    dir_next = next(dir_entries, None)
+    while image_next is not None or dir_next is not None:
+        if dir_next is None or (image_next is not None and image_next[0] < dir_next[0]):
+            assert image_next is not None
+            yield SquashfsDifference(image_next[1].path, "only in squashfs")
+            image_next = next(image_entries, None)
+        elif image_next is None or dir_next[0] < image_next[0]:
+            yield SquashfsDifference(dir_next[1].path, "only in directory")
+            dir_next = next(dir_entries, None)
+        else:
+            image_entry, dir_entry = image_next[1], dir_next[1]
+            reason = _compare_entries(image_entry, dir_entry)
+            if reason is not None:
+                yield SquashfsDifference(image_entry.path, reason)
+            elif (
+                image_entry.file_type == "-"
+                and image_entry.size
+                and (content_check == CONTENT_CHECK_FULL or (content_check and _is_sampled(image_entry.path)))
+            ):
+                to_hash.append(image_entry.path)
+            image_next = next(image_entries, None)
+            dir_next = next(dir_entries, None)
+
+    if not to_hash:
+        return
+    _LOGGER.info("Hashing the contents of %d files in %s", len(to_hash), img_path)
+    workers = max_workers or min(8, multiprocessing.cpu_count())
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="verify") as executor:
+        matches = executor.map(
+            lambda path: _contents_match(unsquashfs_path, img_path, f"{prefix}{path}", nfs_path / path), to_hash
         )
+        for path, match in zip(to_hash, matches, strict=True):
+            if not match:
+                yield SquashfsDifference(path, "contents differ")
 
-    # Check common files for mismatches
-    mismatches = 0
-    for path in set(sqfs_files.keys()) & set(dir_files.keys()):
-        sqfs_meta = sqfs_files[path]
-        dir_meta = dir_files[path]
 
-        # Compare type and size
-        if sqfs_meta[0] != dir_meta[0]:
-            _LOGGER.error("Type mismatch for %s: squashfs=%s, directory=%s", path, sqfs_meta[0], dir_meta[0])
-            mismatches += 1
-        elif sqfs_meta[0] == "-" and sqfs_meta[1] != dir_meta[1]:
-            _LOGGER.error("Size mismatch for %s: squashfs=%s, directory=%s", path, sqfs_meta[1], dir_meta[1])
-            mismatches += 1
+def verify_squashfs_contents(
+    img_path: Path,
+    nfs_path: Path,
+    path_in_image: Path | None = None,
+    content_check: str | None = None,
+    max_workers: int | None = None,
+) -> int:
+    """Verify squashfs image contents (or those under path_in_image) match NFS directory. Returns error count.
 
-    error_count += mismatches
+    See compare_squashfs_contents for what's compared; each difference found is logged.
+    """
+    if not nfs_path.exists():
+        _LOGGER.error("Directory does not exist: %s", nfs_path)
+        return 1
 
-    # Debug info
-    _LOGGER.info("Found %d files in squashfs, %d files in directory", len(sqfs_files), len(dir_files))
+    error_count = 0
+    try:
+        # TODO make unsquashfs path configurable like all other uses of it.
+        for difference in compare_squashfs_contents(
+            img_path, nfs_path, path_in_image, content_check, max_workers=max_workers
+        ):
+            error_count += 1
+            if error_count <= _MAX_REPORTED_DIFFERENCES:
+                _LOGGER.error("%s: %s", difference.path, difference.reason)
+    except FileNotFoundError:
+        _LOGGER.error("unsquashfs command not found - install squashfs-tools")
+        return 1
+    except SquashfsError as e:
+        _LOGGER.error("%s", e)
+        return error_count + 1
 
+    if error_count > _MAX_REPORTED_DIFFERENCES:
+        _LOGGER.error("...and %d more differences", error_count - _MAX_REPORTED_DIFFERENCES)
     if error_count == 0:
-        _LOGGER.info("✓ Contents match: %d files verified", len(sqfs_files))
+        _LOGGER.info("✓ Contents match: %s", img_path)
     else:
         _LOGGER.error("✗ Contents mismatch: %d errors found", error_count)
 
@@ -197,6 +306,56 @@ class SquashfsError(RuntimeError):
     pass
 
 
+def get_uncompressed_size(config: SquashfsConfig, squashfs_path: Path, path_in_image: Path | None = None) -> int:
+    """Get the total size of the regular files in a squashfs image, without extracting it.
+
+    Reads the sizes from the image's inode table by listing it with `unsquashfs -ll`.
+
+    Args:
+        config: SquashfsConfig with the unsquashfs path
+        squashfs_path: The squashfs image
+        path_in_image: Only count the files under this path within the image
+
+    Returns:
+        Total size in bytes, as get_directory_size would report once extracted
+
+    Raises:
+        SquashfsError: If unsquashfs fails
+    """
+    command = [config.unsquashfs_path, "-ll", "-d", "", str(squashfs_path)]
+    if path_in_image is not None:
+        command.append(str(path_in_image))
+    result = subprocess.run(command, capture_output=True, text=True, check=False)
+    if result.returncode != 0:
+        raise SquashfsError(f"unsquashfs listing of {squashfs_path} failed: {result.stderr.strip()}")
+
+    total_size = 0
+    for line in result.stdout.splitlines():
+        if line.startswith("Parallel unsquashfs:") or line.startswith("Filesystem on"):
+            continue
+        try:
+            entry = parse_unsquashfs_line(line)
+        except ValueError as e:
+            raise SquashfsError(f"Unexpected unsquashfs listing of {squashfs_path}: {e}") from e
+        if entry is not None:
+            total_size += entry.size
+    return total_size
+
+
+def _mksquashfs_options(
+    config_squashfs: SquashfsConfig, compression: str | None, compression_level: int | None
+) -> list[str]:
+    return [
+        "-all-root",
+        "-progress",
+        "-comp",
+        compression or config_squashfs.compression,
+        "-Xcompression-level",
+        str(compression_level or config_squashfs.compression_level),
+        "-noappend",  # Don't append, create new
+    ]
+
+
 def create_squashfs_image(
     config_squashfs: SquashfsConfig,
     source_path: Path,
@@ -222,13 +381,7 @@ def create_squashfs_image(
         config_squashfs.mksquashfs_path,
         str(source_path),
         str(output_path),
-        "-all-root",
-        "-progress",
-        "-comp",
-        compression or config_squashfs.compression,
-        "-Xcompression-level",
-        str(compression_level or config_squashfs.compression_level),
-        "-noappend",  # Don't append, create new
+        *_mksquashfs_options(config_squashfs, compression, compression_level),
     ]
 
     if additional_args:
@@ -240,6 +393,61 @@ def create_squashfs_image(
         raise SquashfsError(f"mksquashfs of {source_path} failed: {result.stdout.strip()}")
 
 
+def create_squashfs_image_from_trees(
+    config_squashfs: SquashfsConfig,
+    trees: list[tuple[Path, str]],
+    output_path: Path,
+    filter_: Callable[[tarfile.TarInfo], tarfile.TarInfo | None] | None = None,
+) -> None:
+    """Create a squashfs image with each source tree at the given path within it, without copying them anywhere first.
+
+    The trees are streamed as a tar archive into `mksquashfs -tar` (squashfs-tools 4.6 or later), so nothing is
+    written to disk but the image itself. Symlinks are kept as symlinks, and hard links within the trees as hard links.
+
+    Args:
+        config_squashfs: SquashFsConfig object with tool paths and settings
+        trees: (source directory, path within the image) pairs
+        output_path: Output squashfs file path
+        filter_: Called on each entry as it's added, as for TarFile.add
+
+    Raises:
+        SquashfsError: If mksquashfs fails, or a source tree can't be read
+    """
+    cmd = [
+        config_squashfs.mksquashfs_path,
+        "-",
+        str(output_path),
+        "-tar",
+        *_mksquashfs_options(config_squashfs, None, None),
+    ]
+    _LOGGER.debug("Running mksquashfs command: %s", " ".join(cmd))
+    with tempfile.TemporaryFile() as output:
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=output, stderr=subprocess.STDOUT)
+        assert process.stdin is not None
+        read_error = None
+        try:
+            with tarfile.open(fileobj=process.stdin, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+                for source_path, path_in_image in trees:
+                    tar.add(source_path, arcname=path_in_image, filter=filter_)
+        except BrokenPipeError:
+            pass  # mksquashfs gave up: its output says why
+        except OSError as e:
+            read_error = e
+            process.kill()
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+        returncode = process.wait()
+        if read_error is not None:
+            raise SquashfsError(f"Unable to read source trees for {output_path}: {read_error}") from read_error
+        if returncode != 0:
+            output.seek(0)
+            message = output.read().decode(errors="replace").strip()
+            raise SquashfsError(f"mksquashfs of {output_path} from tar stream failed: {message}")
+
+
 def extract_squashfs_image(
     config_squashfs: SquashfsConfig,
     squashfs_path: Path,
@@ -0,0 +1,118 @@
+"""Strip debug information from the ELF executables in a directory tree.
+
+Only files starting with the ELF magic are passed to `strip` (scripts and other executables are skipped without
+running anything), in batches small enough to stay well clear of the kernel's argument size limit, and the batches run
+concurrently.
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import subprocess
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import humanfriendly
+
+from lib.elf_header import has_elf_magic
+
+_LOGGER = logging.getLogger(__name__)
+
+# Keep each strip command line well under ARG_MAX (typically 2MiB, shared with the environment).
+MAX_BATCH_ARG_BYTES = 128 * 1024
+MAX_BATCH_FILES = 256
+
+
+@dataclass(frozen=True)
+class StripResult:
+    files: int
+    bytes_before: int
+    bytes_after: int
+    elapsed: float
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+
+def find_elf_executables(root: Path) -> list[Path]:
+    """All regular, executable ELF files under `root` (not following symlinks, so nothing is found twice)."""
+    found = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            full_path = os.path.join(dirpath, filename)
+            if os.path.islink(full_path) or not os.access(full_path, os.X_OK):
+                continue
+            if has_elf_magic(full_path):
+                found.append(Path(full_path))
+    return found
+
+
+def batched_by_arg_size(
+    paths: Iterable[Path], max_bytes: int = MAX_BATCH_ARG_BYTES, max_files: int = MAX_BATCH_FILES
+) -> Iterator[list[Path]]:
+    batch: list[Path] = []
+    batch_bytes = 0
+    for path in paths:
+        path_bytes = len(os.fsencode(path)) + 1
+        if batch and (batch_bytes + path_bytes > max_bytes or len(batch) >= max_files):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(path)
+        batch_bytes += path_bytes
+    if batch:
+        yield batch
+
+
+def _total_size(paths: Iterable[Path]) -> int:
+    total = 0
+    for path in paths:
+        try:
+            total += path.stat().st_size
+        except OSError:
+            pass
+    return total
+
+
+def _strip_batch(batch: list[Path]) -> tuple[int, int]:
+    before = _total_size(batch)
+    # Deliberately ignore errors: some ELF files (e.g. for other architectures) can't be stripped by the host strip.
+    subprocess.call(["strip", *map(str, batch)])
+    return before, _total_size(batch)
+
+
+def strip_files(paths: list[Path], max_workers: int | None = None) -> StripResult:
+    """Strip `paths` in bounded batches, each its own `strip` process, with up to `max_workers` running at once."""
+    start = time.time()
+    bytes_before = bytes_after = 0
+    batches = list(batched_by_arg_size(paths))
+    workers = max(1, min(max_workers or min(8, multiprocessing.cpu_count()), len(batches)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="strip") as executor:
+        for before, after in executor.map(_strip_batch, batches):
+            bytes_before += before
+            bytes_after += after
+    return StripResult(len(paths), bytes_before, bytes_after, time.time() - start)
+
+
+def strip_tree(roots: Iterable[Path], description: str, max_workers: int | None = None) -> StripResult:
+    """Find and strip the ELF executables under each of `roots`, logging what it achieved."""
+    to_strip = []
+    for root in roots:
+        _LOGGER.debug("Looking for executables to strip in %s", root)
+        if not root.is_dir():
+            raise RuntimeError(f"While looking for files to strip, {root} was not a directory")
+        to_strip.extend(find_elf_executables(root))
+    result = strip_files(to_strip, max_workers)
+    _LOGGER.info(
+        "Stripped %d ELF files for %s in %.1fs, saving %s",
+        result.files,
+        description,
+        result.elapsed,
+        humanfriendly.format_size(result.bytes_saved, binary=True),
+    )
+    return result
@@ -0,0 +1,162 @@
+"""Compare two directory trees, as a faster and quieter `diff -r`.
+
+Both trees are walked once with `os.scandir` and compared on structure, file type, size and symlink target. Only
+regular files that match on all of those have their contents hashed, in parallel, so a tree with any structural
+difference is reported without reading any file contents at all. Anything that can't be read (including a missing
+root) is reported as a difference rather than raised.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+_LOGGER = logging.getLogger(__name__)
+
+_FILE = "file"
+_DIR = "dir"
+_SYMLINK = "symlink"
+_OTHER = "other"
+
+
+@dataclass(frozen=True)
+class _Entry:
+    kind: str
+    size: int = 0
+    link_target: str = ""
+
+
+@dataclass
+class TreeDiff:
+    """Differences between a source and a destination tree, as paths relative to their roots."""
+
+    only_in_source: list[str] = field(default_factory=list)
+    only_in_dest: list[str] = field(default_factory=list)
+    type_differs: list[str] = field(default_factory=list)
+    size_differs: list[str] = field(default_factory=list)
+    symlink_differs: list[str] = field(default_factory=list)
+    content_differs: list[str] = field(default_factory=list)
+    unreadable_in_source: list[str] = field(default_factory=list)
+    unreadable_in_dest: list[str] = field(default_factory=list)
+    files_hashed: int = 0
+    bytes_hashed: int = 0
+
+    @property
+    def identical(self) -> bool:
+        return not (
+            self.only_in_source
+            or self.only_in_dest
+            or self.type_differs
+            or self.size_differs
+            or self.symlink_differs
+            or self.content_differs
+            or self.unreadable_in_source
+            or self.unreadable_in_dest
+        )
+
+    def to_json(self) -> dict:
+        return {"identical": self.identical, **dataclasses.asdict(self)}
+
+    def summary(self) -> str:
+        counts = [
+            (len(self.only_in_source), "only in source"),
+            (len(self.only_in_dest), "only in destination"),
+            (len(self.type_differs), "of different type"),
+            (len(self.size_differs), "of different size"),
+            (len(self.symlink_differs), "with different symlink target"),
+            (len(self.content_differs), "with different content"),
+            (len(self.unreadable_in_source), "unreadable in source"),
+            (len(self.unreadable_in_dest), "unreadable in destination"),
+        ]
+        return ", ".join(f"{count} {what}" for count, what in counts if count) or "identical"
+
+
+def _scan(root: Path, unreadable: list[str]) -> dict[str, _Entry]:
+    """Map every path under `root` (relative, with / separators) to what's there, without following symlinks.
+
+    Paths that can't be read ("." for `root` itself) are added to `unreadable` instead.
+    """
+    entries: dict[str, _Entry] = {}
+    pending = [""]
+    while pending:
+        relative_dir = pending.pop()
+        try:
+            with os.scandir(root / relative_dir) as it:
+                for entry in it:
+                    relative = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+                    try:
+                        if entry.is_symlink():
+                            entries[relative] = _Entry(_SYMLINK, link_target=os.readlink(entry.path))
+                        elif entry.is_dir(follow_symlinks=False):
+                            entries[relative] = _Entry(_DIR)
+                            pending.append(relative)
+                        elif entry.is_file(follow_symlinks=False):
+                            entries[relative] = _Entry(_FILE, size=entry.stat(follow_symlinks=False).st_size)
+                        else:
+                            entries[relative] = _Entry(_OTHER)
+                    except OSError as e:
+                        _LOGGER.warning("Unable to read %s: %s", entry.path, e)
+                        unreadable.append(relative)
+        except OSError as e:
+            _LOGGER.warning("Unable to list %s: %s", root / relative_dir, e)
+            unreadable.append(relative_dir or ".")
+    return entries
+
+
+def _digest(path: Path) -> bytes | None:
+    try:
+        with path.open("rb") as f:
+            return hashlib.file_digest(f, "sha256").digest()
+    except OSError as e:
+        _LOGGER.warning("Unable to read %s: %s", path, e)
+        return None
+
+
+def _digests(paths: tuple[Path, Path]) -> tuple[bytes | None, bytes | None]:
+    return _digest(paths[0]), _digest(paths[1])
+
+
+def compare_trees(source: Path, dest: Path, max_workers: int | None = None) -> TreeDiff:
+    """Compare the trees at `source` and `dest`, hashing same-sized files with up to `max_workers` threads."""
+    diff = TreeDiff()
+    source_entries = _scan(source, diff.unreadable_in_source)
+    dest_entries = _scan(dest, diff.unreadable_in_dest)
+
+    to_hash: list[str] = []
+    for relative, source_entry in sorted(source_entries.items()):
+        dest_entry = dest_entries.get(relative)
+        if dest_entry is None:
+            diff.only_in_source.append(relative)
+        elif source_entry.kind != dest_entry.kind:
+            diff.type_differs.append(relative)
+        elif source_entry.kind == _SYMLINK:
+            if source_entry.link_target != dest_entry.link_target:
+                diff.symlink_differs.append(relative)
+        elif source_entry.kind == _FILE:
+            if source_entry.size != dest_entry.size:
+                diff.size_differs.append(relative)
+            elif source_entry.size:
+                to_hash.append(relative)
+    diff.only_in_dest = sorted(relative for relative in dest_entries if relative not in source_entries)
+
+    workers = max_workers or min(8, multiprocessing.cpu_count())
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compare") as executor:
+        pairs = [(source / relative, dest / relative) for relative in to_hash]
+        for relative, (source_digest, dest_digest) in zip(to_hash, executor.map(_digests, pairs), strict=True):
+            if source_digest is None:
+                diff.unreadable_in_source.append(relative)
+            if dest_digest is None:
+                diff.unreadable_in_dest.append(relative)
+            if source_digest is not None and dest_digest is not None and source_digest != dest_digest:
+                diff.content_differs.append(relative)
+    diff.unreadable_in_source.sort()
+    diff.unreadable_in_dest.sort()
+    diff.files_hashed = len(to_hash)
+    diff.bytes_hashed = 2 * sum(source_entries[relative].size for relative in to_hash)
+    return diff
@@ -0,0 +1,102 @@
+import io
+import os
+
+import pytest
+from lib.artifact_cache import ArtifactCache
+from lib.config import CefsConfig, Config
+from lib.installation_context import InstallationContext
+from lib.library_platform import LibraryPlatform
+
+
+def _store(cache: ArtifactCache, url: str, content: bytes, headers: dict[str, str]) -> None:
+    with cache.storing(url, headers) as store:
+        assert store is not None
+        store(content)
+
+
+def test_hit_requires_matching_etag(tmp_path):
+    cache = ArtifactCache(tmp_path, max_bytes=1024)
+    _store(cache, "https://x/a", b"hello", {"etag": '"v1"', "content-length": "5"})
+    with cache.open_cached("https://x/a", {"etag": '"v1"', "content-length": "5"}) as fd:
+        assert fd.read() == b"hello"
+    assert cache.open_cached("https://x/a", {"etag": '"v2"', "content-length": "5"}) is None
+    assert cache.open_cached("https://x/b", {"etag": '"v1"', "content-length": "5"}) is None
+    assert (cache.hits, cache.bytes_saved) == (1, 5)
+
+
+def test_content_length_is_used_without_etag(tmp_path):
+    cache = ArtifactCache(tmp_path, max_bytes=1024)
+    _store(cache, "https://x/a", b"hello", {"content-length": "5"})
+    assert cache.open_cached("https://x/a", {"content-length": "6"}) is None
+    with cache.open_cached("https://x/a", {"content-length": "5"}) as fd:
+        assert fd.read() == b"hello"
+
+
+def test_uncacheable_without_validators(tmp_path):
+    cache = ArtifactCache(tmp_path, max_bytes=1024)
+    with cache.storing("https://x/a", {}) as store:
+        assert store is None
+    assert cache.open_cached("https://x/a", {}) is None
+
+
+def test_truncated_download_is_not_cached(tmp_path):
+    cache = ArtifactCache(tmp_path, max_bytes=1024)
+    _store(cache, "https://x/a", b"hel", {"content-length": "5"})
+    assert cache.open_cached("https://x/a", {"content-length": "5"}) is None
+
+
+def test_failed_download_is_not_cached(tmp_path):
+    cache = ArtifactCache(tmp_path, max_bytes=1024)
+    with pytest.raises(RuntimeError), cache.storing("https://x/a", {"etag": "e"}) as store:
+        store(b"partial")
+        raise RuntimeError("connection reset")
+    assert cache.open_cached("https://x/a", {"etag": "e"}) is None
+    assert list((tmp_path / "blobs").iterdir()) == []
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    cache = ArtifactCache(tmp_path, max_bytes=1024)
+    _store(cache, "https://x/a", b"same", {"etag": "a"})
+    _store(cache, "https://mirror/a", b"same", {"etag": "b"})
+    assert len(list((tmp_path / "blobs").iterdir())) == 1
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = ArtifactCache(tmp_path, max_bytes=10)
+    _store(cache, "https://x/old", b"aaaa", {"etag": "old"})
+    _store(cache, "https://x/used", b"bbbb", {"etag": "used"})
+    old_blob, used_blob = sorted((tmp_path / "blobs").iterdir(), key=lambda p: p.read_bytes())
+    os.utime(old_blob, (1000, 1000))
+    os.utime(used_blob, (1000, 1000))
+    cache.open_cached("https://x/used", {"etag": "used"}).close()  # makes it most recently used
+    _store(cache, "https://x/new", b"cccc", {"etag": "new"})
+    assert cache.open_cached("https://x/old", {"etag": "old"}) is None
+    assert cache.open_cached("https://x/used", {"etag": "used"}) is not None
+    assert cache.open_cached("https://x/new", {"etag": "new"}) is not None
+
+
+def test_fetch_to_uses_the_cache(tmp_path, requests_mock):
+    context = InstallationContext(
+        destination=tmp_path / "dest",
+        staging_root=tmp_path / "staging",
+        s3_url="https://example.com",
+        dry_run=False,
+        is_nightly_enabled=False,
+        only_nightly=False,
+        cache=None,
+        yaml_dir=tmp_path,
+        allow_unsafe_ssl=False,
+        resource_dir=tmp_path,
+        keep_staging=False,
+        check_user="",
+        platform=LibraryPlatform.Linux,
+        config=Config(cefs=CefsConfig(local_temp_dir=tmp_path / "temp", download_cache_size=1024 * 1024)),
+    )
+    requests_mock.get("https://example.com/a.tar", content=b"archive", headers={"ETag": '"abc"'})
+    for _ in range(2):
+        fd = io.BytesIO()
+        context.fetch_to("https://example.com/a.tar", fd)
+        assert fd.getvalue() == b"archive"
+    assert context.download_cache is not None
+    assert (context.download_cache.hits, context.download_cache.misses) == (1, 1)
+    assert context.download_cache.bytes_saved == len(b"archive")
@@ -1,6 +1,11 @@
-from unittest.mock import Mock
+import json
+from pathlib import Path
+from unittest.mock import Mock, patch
 
-from lib.ce_install import filter_aggregate, filter_match
+from click.testing import CliRunner
+from lib.ce_install import CliContext, filter_aggregate, filter_match, verify
+from lib.installable.installable import Installable, VerifyResult
+from lib.tree_compare import TreeDiff
 
 
 def fake(context, target_name):
@@ -281,3 +286,73 @@ def test_backwards_compatibility():
     # Ensure non-pattern strings don't get treated as patterns
     assert not filter_match("14.1.0", fake("compilers/c++/gcc", "14.1.1"))
     assert not filter_match("gcc", fake("compilers/c++/clang", "14.1.0"))
+
+
+LAZY_YAML = """
+compilers:
+  gcc:
+    type: recording
+    targets:
+      - "13.2.0"
+      - "14.1.0"
+  nightly:
+    type: recording
+    targets:
+      - trunk
+  needs-gcc:
+    type: recording
+    depends:
+      - compilers/gcc 13.2.0
+    targets:
+      - "1.0"
+"""
+
+
+def test_get_installables_only_constructs_matching_targets_and_dependencies(tmp_path):
+    (tmp_path / "compilers.yaml").write_text(LAZY_YAML, encoding="utf-8")
+    constructed = []
+
+    class RecordingInstallable(Installable):
+        def __init__(self, install_context, config):
+            super().__init__(install_context, config)
+            constructed.append(self.name)
+
+    install_context = Mock(destination=Path("/opt"), yaml_dir=tmp_path, resource_dir=tmp_path)
+    context = CliContext(
+        installation_context=install_context, enabled=[], filter_match_all=True, parallel=1, config=Mock()
+    )
+    with patch.dict("lib.installation._INSTALLER_TYPES", {"recording": RecordingInstallable}):
+        assert [i.name for i in context.get_installables(["gcc 14.1.0"])] == ["compilers/gcc 14.1.0"]
+        assert constructed == ["compilers/gcc 14.1.0"]
+
+        constructed.clear()
+        [needs_gcc] = context.get_installables(["needs-gcc"])
+        assert sorted(constructed) == ["compilers/gcc 13.2.0", "compilers/needs-gcc 1.0"]
+        assert [dep.name for dep in needs_gcc.depends] == ["compilers/gcc 13.2.0"]
+
+
+def test_verify_reports_each_targets_own_differences():
+    differences = TreeDiff(only_in_dest=["stray"])
+    installables = [
+        Mock(is_installed=Mock(return_value=True), verify=Mock(return_value=VerifyResult(ok=True))),
+        Mock(is_installed=Mock(return_value=True), verify=Mock(return_value=VerifyResult.of(differences))),
+        Mock(is_installed=Mock(return_value=False)),
+    ]
+    for number, installable in enumerate(installables):
+        installable.name = f"compilers/weasel {number}"
+    context = CliContext(installation_context=Mock(), enabled=[], filter_match_all=True, parallel=3, config=Mock())
+
+    with patch.object(CliContext, "get_installables", return_value=installables):
+        result = CliRunner().invoke(verify, ["--json"], obj=context)
+
+    assert result.exit_code == 1
+    report = json.loads(result.output)
+    assert (report["ok"], report["not_ok"]) == (1, 2)
+    assert [(target["installed"], target["ok"]) for target in report["targets"]] == [
+        (True, True),
+        (True, False),
+        (False, False),
+    ]
+    assert report["targets"][0]["differences"] is None
+    assert report["targets"][1]["differences"]["only_in_dest"] == ["stray"]
+    installables[2].verify.assert_not_called()
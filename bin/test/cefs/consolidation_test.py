@@ -3,28 +3,45 @@
 
 from __future__ import annotations
 
+import dataclasses
+import tarfile
+import threading
+import time
 from pathlib import Path
 from unittest.mock import Mock, patch
 
 import pytest
 from lib.cefs.consolidation import (
+    BEST_FIT_DECREASING,
+    FIRST_FIT_DECREASING,
     calculate_image_usage,
     create_group_manifest,
     determine_extraction_path,
+    estimate_extracted_sizes,
     extract_candidates_from_manifest,
     get_consolidated_item_status,
     group_images_by_usage,
+    group_temp_space,
     is_consolidated_image,
     is_item_still_using_image,
     pack_items_into_groups,
+    plan_packing,
     prepare_consolidation_items,
+    run_consolidation_groups,
     should_include_manifest_item,
     should_reconsolidate_image,
+    stream_consolidated_image,
     validate_space_requirements,
 )
+from lib.cefs.index import CEFSIndex
 from lib.cefs.models import ConsolidationCandidate
 from lib.cefs.state import CEFSState
-from lib.cefs_manifest import sanitize_path_for_filename, write_manifest_alongside_image
+from lib.cefs_manifest import (
+    read_manifest_from_alongside,
+    sanitize_path_for_filename,
+    write_manifest_alongside_image,
+)
+from lib.squashfs import SquashfsError
 
 from test.cefs.test_helpers import make_test_manifest
 
@@ -678,6 +695,57 @@ def test_pack_items_into_groups():
     assert len(groups) >= 3
 
 
+def _candidates(**sizes: int) -> list[ConsolidationCandidate]:
+    return [
+        ConsolidationCandidate(
+            name=name.replace("_", " "),
+            nfs_path=Path(f"/opt/{name}"),
+            squashfs_path=Path(f"/efs/{name}.sqfs"),
+            size=size,
+        )
+        for name, size in sizes.items()
+    ]
+
+
+def _names(groups: list[list[ConsolidationCandidate]]) -> list[list[str]]:
+    return [[item.name for item in group] for group in groups]
+
+
+def test_pack_items_decreasing_strategies():
+    candidates = _candidates(a=7, b=4, c=4, d=2)
+
+    assert _names(pack_items_into_groups(candidates, 10, 1)) == [["a"], ["b", "c", "d"]]
+    # d fits alongside either a or b+c: first fit takes the first group, best fit the fullest
+    assert _names(pack_items_into_groups(candidates, 10, 1, FIRST_FIT_DECREASING)) == [["a", "d"], ["b", "c"]]
+    assert _names(pack_items_into_groups(candidates, 10, 1, BEST_FIT_DECREASING)) == [["a"], ["b", "c", "d"]]
+    assert _names(pack_items_into_groups(candidates, 10, 2, BEST_FIT_DECREASING)) == [["b", "c", "d"]]
+
+
+def test_pack_items_keeping_families_together():
+    candidates = _candidates(gcc_1=5, gcc_2=2, clang_1=4, clang_2=3, clang_3=9)
+
+    mixed = pack_items_into_groups(candidates, 9, 1, FIRST_FIT_DECREASING)
+    assert ["clang 1", "gcc 1"] in _names(mixed)
+
+    together = pack_items_into_groups(candidates, 9, 1, FIRST_FIT_DECREASING, locality=True)
+    # clang 3 doesn't fit with its family, so is split off
+    assert sorted(_names(together)) == [["clang 1", "clang 2"], ["clang 3"], ["gcc 1", "gcc 2"]]
+
+
+def test_plan_packing():
+    candidates = _candidates(a=7, b=4, c=4, d=2)
+
+    plan = plan_packing(candidates, 10, 2, BEST_FIT_DECREASING)
+    assert plan.image_count == 1
+    assert plan.fill_ratio == pytest.approx(1.0)
+    assert (plan.mounts_before, plan.mounts_after) == (4, 2)
+
+    plan = plan_packing(candidates, 10, 1, FIRST_FIT_DECREASING)
+    assert plan.image_count == 2
+    assert plan.fill_ratio == pytest.approx(17 / 20)
+    assert plan.mounts_after == 2
+
+
 def test_validate_space_requirements(tmp_path):
     """Test validate_space_requirements function."""
     # Create test groups
@@ -862,3 +930,154 @@ def test_gather_reconsolidation_candidates(tmp_path):
     assert len(candidates_filtered) == 2
     filtered_names = {c.name for c in candidates_filtered}
     assert filtered_names == {"tools/small 1.0.0", "tools/small 2.0.0"}
+
+
+def _concurrency_recorder():
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0}
+
+    def process_group(group, group_idx, extractions):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        time.sleep(0.05)
+        with lock:
+            state["running"] -= 1
+        if group[0].name == "boom":
+            raise RuntimeError("extraction exploded")
+        return True, len(group), extractions
+
+    return process_group, state
+
+
+def test_run_consolidation_groups_concurrently():
+    groups = [_candidates(a=1, b=1), _candidates(c=1), _candidates(d=1), _candidates(e=1)]
+    process_group, state = _concurrency_recorder()
+
+    results = run_consolidation_groups(groups, process_group, 1000, max_parallel_groups=2, max_parallel_extractions=8)
+
+    assert state["peak"] == 2
+    # results in group order; extraction workers are split between the groups running at once
+    assert results == [(True, 2, 4), (True, 1, 4), (True, 1, 4), (True, 1, 4)]
+
+
+def test_run_consolidation_groups_respects_temp_space_budget():
+    groups = [_candidates(a=10), _candidates(b=10), _candidates(c=10)]
+    process_group, state = _concurrency_recorder()
+
+    # Each group needs 50 bytes of temp space, so only one fits in the budget at a time
+    run_consolidation_groups(groups, process_group, 99, max_parallel_groups=3)
+    assert state["peak"] == 1
+
+    process_group, state = _concurrency_recorder()
+    run_consolidation_groups(groups, process_group, 100, max_parallel_groups=3)
+    assert state["peak"] == 2
+
+
+def test_run_consolidation_groups_isolates_failures():
+    groups = [_candidates(a=1), _candidates(boom=1), _candidates(c=1)]
+    process_group, _ = _concurrency_recorder()
+
+    results = run_consolidation_groups(groups, process_group, 1000, max_parallel_groups=2)
+
+    assert [success for success, _, _ in results] == [True, False, True]
+
+
+def test_group_temp_space():
+    unknown, known = _candidates(a=100, b=100)
+    known = dataclasses.replace(known, extracted_size=300)
+    assert group_temp_space([unknown]) == 500
+    assert group_temp_space([known]) == 440
+    assert group_temp_space([unknown, known]) == 940
+    assert group_temp_space([unknown, known], stream=True) == 220
+
+
+def test_estimate_extracted_sizes_caches_in_index(tmp_path):
+    mount_point = tmp_path / "cefs"
+    image = tmp_path / "images" / "ab" / "abc123_consolidated.sqfs"
+    image.parent.mkdir(parents=True)
+    image.touch()
+    manifest = make_test_manifest()
+    write_manifest_alongside_image(manifest, image)
+    (tmp_path / "clang").symlink_to(mount_point / "ab" / "abc123_consolidated" / "clang")
+    candidates = [
+        ConsolidationCandidate(
+            "gcc", tmp_path / "gcc", image, 10, extraction_path=Path("gcc"), from_reconsolidation=True
+        ),
+        ConsolidationCandidate("clang", tmp_path / "clang", image, 10),
+    ]
+    config = Mock(unsquashfs_path="unsquashfs")
+    index = CEFSIndex(tmp_path / "index.sqlite", tmp_path, tmp_path / "images", mount_point)
+
+    with patch("lib.cefs.consolidation.get_uncompressed_size", side_effect=[1000, 2000, 3000]) as listing:
+        estimated = estimate_extracted_sizes(config, candidates, mount_point, index)
+        assert listing.call_count == 2
+    assert sorted(item.extracted_size for item in estimated) == [1000, 2000]
+
+    with patch("lib.cefs.consolidation.get_uncompressed_size", side_effect=SquashfsError("corrupt")) as listing:
+        assert estimate_extracted_sizes(config, candidates, mount_point, index) == estimated
+        listing.assert_not_called()
+    assert read_manifest_from_alongside(image) == manifest
+
+    image.write_bytes(b"changed")
+    with patch("lib.cefs.consolidation.get_uncompressed_size", return_value=3000) as listing:
+        estimated = estimate_extracted_sizes(config, candidates, mount_point, index)
+        assert listing.call_count == 2
+    assert [item.extracted_size for item in estimated] == [3000, 3000]
+    index.close()
+
+
+def test_estimate_extracted_sizes_tolerates_unreadable_images(tmp_path):
+    candidates = _candidates(a=10)
+    index = CEFSIndex(tmp_path / "index.sqlite", tmp_path, tmp_path, tmp_path)
+    for _ in range(2):
+        with patch("lib.cefs.consolidation.get_uncompressed_size", side_effect=SquashfsError("corrupt")) as listing:
+            estimated = estimate_extracted_sizes(Mock(), candidates, tmp_path, index)
+            listing.assert_called_once()
+        assert estimated[0].extracted_size is None
+    index.close()
+
+
+def test_stream_consolidated_image_reads_from_mounts(tmp_path):
+    mount_point = tmp_path / "cefs"
+    gcc = mount_point / "ab" / "abc123_gcc" / "gcc-12"
+    (gcc / "bin").mkdir(parents=True)
+    (gcc / "bin" / "gcc").write_bytes(b"gcc")
+    (gcc / "bin" / "gcc").chmod(0o700)
+    clang = mount_point / "de" / "def456_clang"
+    clang.mkdir(parents=True)
+    (clang / "clang").write_bytes(b"clang!")
+    items = [
+        (tmp_path / "gcc", Path("/images/ab/abc123_gcc.sqfs"), "gcc", Path("gcc-12")),
+        (tmp_path / "clang", Path("/images/de/def456_clang.sqfs"), "clang", None),
+    ]
+    output = tmp_path / "out.sqfs"
+    streamed = {}
+
+    def fake_create(config, trees, output_path, filter_):
+        assert trees == [(gcc, "gcc"), (clang, "clang")]
+        for source, name in trees:
+            for path in sorted(source.rglob("*")):
+                info = tarfile.TarInfo(f"{name}/{path.relative_to(source)}")
+                info.type = tarfile.DIRTYPE if path.is_dir() else tarfile.REGTYPE
+                info.size = 0 if path.is_dir() else path.stat().st_size
+                info.mode = path.stat().st_mode & 0o777
+                info = filter_(info)
+                streamed[info.name] = info.mode
+        output_path.write_bytes(b"x" * 3)
+
+    with (
+        patch("lib.cefs.consolidation.create_squashfs_image_from_trees", side_effect=fake_create),
+        patch("lib.cefs.consolidation.verify_squashfs_contents", return_value=0) as verify,
+    ):
+        stream_consolidated_image(Mock(), items, mount_point, output)
+    assert streamed["gcc/bin/gcc"] == 0o755
+    verify.assert_any_call(output, gcc, Path("gcc"))
+    verify.assert_any_call(output, clang, Path("clang"))
+
+    with (
+        patch("lib.cefs.consolidation.create_squashfs_image_from_trees", side_effect=fake_create),
+        patch("lib.cefs.consolidation.verify_squashfs_contents", return_value=1),
+        pytest.raises(RuntimeError, match="doesn't match"),
+    ):
+        stream_consolidated_image(Mock(), items, mount_point, output)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Tests for squashfs to CEFS conversion."""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+from lib.cefs.conversion import ConversionJournal, convert_many_to_cefs
+
+
+def _setup(tmp_path: Path, *names: str) -> tuple[list[tuple[Mock, Path]], Mock, Mock]:
+    config_squashfs = Mock(image_dir=tmp_path / "squash")
+    config_cefs = Mock(image_dir=tmp_path / "cefs-images", mount_point=tmp_path / "cefs")
+    items = []
+    for name in names:
+        (tmp_path / "nfs" / name).mkdir(parents=True)
+        image = config_squashfs.image_dir / f"{name}.img"
+        image.parent.mkdir(parents=True, exist_ok=True)
+        image.write_bytes(f"image of {name}".encode())
+        installable = Mock(install_path=name, is_installed=Mock(return_value=True))
+        installable.name = f"compilers/{name}"
+        items.append((installable, image))
+    return items, config_squashfs, config_cefs
+
+
+def _convert(tmp_path, items, config_squashfs, config_cefs, journal=None):
+    return convert_many_to_cefs(
+        items, tmp_path / "nfs", config_squashfs, config_cefs, False, False, False, 2, 1, journal
+    )
+
+
+def test_converts_everything_then_swaps_symlinks(tmp_path):
+    items, config_squashfs, config_cefs = _setup(tmp_path, "gcc", "clang", "missing-image")
+    items[2][1].unlink()
+
+    assert _convert(tmp_path, items, config_squashfs, config_cefs) == (2, 1)
+
+    for name in ("gcc", "clang"):
+        link = tmp_path / "nfs" / name
+        assert link.is_symlink()
+        image = config_cefs.image_dir / Path(os.readlink(link)).relative_to(config_cefs.mount_point)
+        image = image.with_suffix(".sqfs")
+        assert image.read_bytes() == f"image of {name}".encode()
+        assert image.with_suffix(".yaml").exists()
+
+    # Already converted: nothing to do, and no rehashing
+    with patch("lib.cefs.conversion.get_cefs_filename_for_image") as hashing:
+        assert _convert(tmp_path, items[:2], config_squashfs, config_cefs) == (2, 0)
+        hashing.assert_not_called()
+
+
+def test_no_symlinks_swapped_until_all_copies_done(tmp_path):
+    items, config_squashfs, config_cefs = _setup(tmp_path, "gcc", "clang")
+    copies = []
+
+    def copy(source, dest):
+        assert not any((tmp_path / "nfs" / name).is_symlink() for name in ("gcc", "clang"))
+        copies.append(source)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.write_bytes(source.read_bytes())
+
+    with patch("lib.cefs.conversion.copy_to_cefs_atomically", side_effect=copy):
+        assert _convert(tmp_path, items, config_squashfs, config_cefs) == (2, 0)
+    assert sorted(copies) == sorted(image for _, image in items)
+
+
+def test_journal_skips_rehashing_unchanged_images(tmp_path):
+    items, config_squashfs, config_cefs = _setup(tmp_path, "gcc", "clang")
+    journal_path = tmp_path / "journal.jsonl"
+
+    # Interrupted after hashing: nothing deployed or swapped over yet
+    with patch("lib.cefs.conversion.deploy_conversion", side_effect=KeyboardInterrupt):
+        try:
+            _convert(tmp_path, items, config_squashfs, config_cefs, ConversionJournal(journal_path))
+        except KeyboardInterrupt:
+            pass
+    assert not any((tmp_path / "nfs" / name).is_symlink() for name in ("gcc", "clang"))
+
+    items[1][1].write_bytes(b"a rebuilt clang image")
+    with journal_path.open("a", encoding="utf-8") as f:
+        f.write('{"image": "torn')
+    with patch("lib.cefs.conversion.get_cefs_filename_for_image", return_value="abc_rehashed") as hashing:
+        assert _convert(tmp_path, items, config_squashfs, config_cefs, ConversionJournal(journal_path)) == (2, 0)
+        hashing.assert_called_once()
+        assert hashing.call_args.args[0] == items[1][1]
@@ -3,11 +3,13 @@
 
 from __future__ import annotations
 
+import hashlib
 from pathlib import Path
 from unittest.mock import Mock, patch
 
 from lib.cefs.deployment import (
     check_temp_space_available,
+    deploy_to_cefs_by_content,
     deploy_to_cefs_transactional,
     has_enough_space,
     snapshot_symlink_targets,
@@ -210,3 +212,59 @@ def test_deploy_to_cefs_transactional_dry_run(tmp_path):
     assert not target_path.exists()
     assert not target_path.with_suffix(".yaml").exists()
     assert not Path(str(target_path.with_suffix(".yaml")) + ".inprogress").exists()
+
+
+def test_deploy_to_cefs_by_content_names_image_by_hash(tmp_path):
+    """Test that the image is copied once, named by its hash, with its manifest finalized."""
+    source_path = tmp_path / "source.sqfs"
+    source_path.write_bytes(b"test content")
+    image_dir = tmp_path / "cefs-images"
+    expected_hash = hashlib.sha256(b"test content").hexdigest()[:24]
+
+    with deploy_to_cefs_by_content(
+        source_path, image_dir, "install", Path("gcc-4.5"), make_test_manifest(), dry_run=False
+    ) as (filename, newly_deployed):
+        assert newly_deployed
+        image_path = image_dir / filename[:2] / filename
+        # The manifest is in progress until the block completes
+        assert Path(str(image_path.with_suffix(".yaml")) + ".inprogress").exists()
+
+    assert filename.startswith(expected_hash)
+    assert image_path.read_bytes() == b"test content"
+    assert image_path.with_suffix(".yaml").exists()
+    assert list(image_dir.glob("*.tmp")) == []
+
+
+def test_deploy_to_cefs_by_content_keeps_existing_image(tmp_path):
+    """Test that deploying identical content leaves the existing image and manifest alone."""
+    source_path = tmp_path / "source.sqfs"
+    source_path.write_bytes(b"test content")
+    image_dir = tmp_path / "cefs-images"
+    with deploy_to_cefs_by_content(source_path, image_dir, "install", None, make_test_manifest()) as (filename, _):
+        pass
+    image_path = image_dir / filename[:2] / filename
+    manifest_before = image_path.with_suffix(".yaml").read_text(encoding="utf-8")
+
+    with deploy_to_cefs_by_content(source_path, image_dir, "install", None, {"other": "manifest"}) as (
+        second_filename,
+        newly_deployed,
+    ):
+        assert not newly_deployed
+    assert second_filename == filename
+    assert image_path.with_suffix(".yaml").read_text(encoding="utf-8") == manifest_before
+    assert list(image_dir.glob("*.tmp")) == []
+
+
+def test_deploy_to_cefs_by_content_dry_run(tmp_path):
+    """Test that dry run works out the filename without creating any files."""
+    source_path = tmp_path / "source.sqfs"
+    source_path.write_bytes(b"test content")
+    image_dir = tmp_path / "cefs-images"
+
+    with deploy_to_cefs_by_content(source_path, image_dir, "install", None, make_test_manifest(), dry_run=True) as (
+        filename,
+        newly_deployed,
+    ):
+        assert newly_deployed
+    assert filename.startswith(hashlib.sha256(b"test content").hexdigest()[:24])
+    assert not image_dir.exists()
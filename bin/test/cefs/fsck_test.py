@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Tests for CEFS fsck validation."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import yaml
+from lib.cefs import fsck
+from lib.cefs.fsck import find_pending_cleanups, run_fsck_validation, verify_image_hashes
+from lib.cefs.index import CEFSIndex
+from lib.cefs.state import CEFSState
+from lib.cefs_manifest import write_manifest_sidecar
+
+from test.cefs.test_helpers import make_test_manifest
+
+_AN_HOUR_AGO = time.time() - 3600
+
+
+def _image(cefs_dir: Path, stem: str, manifest: dict) -> None:
+    image = cefs_dir / stem[:2] / f"{stem}.sqfs"
+    image.parent.mkdir(parents=True, exist_ok=True)
+    image.write_bytes(b"image")
+    manifest_path = image.with_suffix(".yaml")
+    manifest_path.write_text(yaml.dump(manifest), encoding="utf-8")
+    os.utime(manifest_path, (_AN_HOUR_AGO, _AN_HOUR_AGO))
+
+
+def _setup(tmp_path: Path) -> None:
+    cefs_dir = tmp_path / "cefs-images"
+    (tmp_path / "nfs").mkdir()
+    valid = make_test_manifest(contents=[{"name": "compilers/c++/x86/gcc 12.1.0", "destination": "/opt/gcc"}])
+    _image(cefs_dir, "abc123_valid", valid)
+    _image(cefs_dir, "abd456_old", make_test_manifest(contents=[{"name": "gcc 12", "target": "/opt/gcc"}]))
+    _image(cefs_dir, "cde000_invalid", make_test_manifest(contents=[{"name": "not-a-valid-name", "destination": "/x"}]))
+
+
+def _fsck(tmp_path: Path, full: bool = False) -> tuple[fsck.FSCKResults, int]:
+    nfs_dir, cefs_dir, mount_point = tmp_path / "nfs", tmp_path / "cefs-images", tmp_path / "cefs"
+    index = CEFSIndex(tmp_path / "index.sqlite", nfs_dir, cefs_dir, mount_point)
+    state = CEFSState(nfs_dir, cefs_dir, mount_point, index=index)
+    state.scan_cefs_images_with_manifests()
+    with patch("lib.cefs.fsck.check_manifest", wraps=fsck.check_manifest) as check:
+        results = run_fsck_validation(state, mount_point, full=full)
+    index.close()
+    return results, check.call_count
+
+
+def test_fsck_only_revalidates_changed_manifests(tmp_path):
+    _setup(tmp_path)
+    first, checked = _fsck(tmp_path)
+    assert checked == 3
+    assert first.valid_manifests == 1
+    assert len(first.old_format_manifests) == len(first.invalid_name_manifests) == 1
+
+    second, checked = _fsck(tmp_path)
+    assert checked == 0
+    assert second == first
+
+    manifest = tmp_path / "cefs-images" / "ab" / "abc123_valid.yaml"
+    manifest.write_text("not: [valid", encoding="utf-8")
+    os.utime(manifest, (_AN_HOUR_AGO + 60, _AN_HOUR_AGO + 60))
+    third, checked = _fsck(tmp_path)
+    assert checked == 1
+    assert third.valid_manifests == 0
+    assert third.unreadable_manifests == [(manifest, "Cannot read manifest file")]
+
+    _, checked = _fsck(tmp_path, full=True)
+    assert checked == 3
+
+
+def test_fsck_revalidates_everything_when_validation_changes(tmp_path):
+    _setup(tmp_path)
+    _fsck(tmp_path)
+    assert _fsck(tmp_path)[1] == 0
+
+    with patch("lib.cefs.fsck._validator_version", return_value="a newer validator"):
+        assert _fsck(tmp_path)[1] == 3
+        assert _fsck(tmp_path)[1] == 0
+
+
+def test_fsck_doesnt_store_unreadable_manifests(tmp_path):
+    _setup(tmp_path)
+    manifest = tmp_path / "cefs-images" / "ab" / "abc123_valid.yaml"
+    real_open = Path.open
+
+    def failing_open(path, *args, **kwargs):
+        if path == manifest:
+            raise OSError(5, "Input/output error")
+        return real_open(path, *args, **kwargs)
+
+    with patch.object(Path, "open", failing_open):
+        first, checked = _fsck(tmp_path)
+    assert checked == 3
+    assert first.unreadable_manifests == [(manifest, "Cannot read manifest file")]
+
+    second, checked = _fsck(tmp_path)
+    assert checked == 1
+    assert second.unreadable_manifests == []
+    assert second.valid_manifests == 1
+
+
+def test_fsck_reads_manifests_from_current_sidecars(tmp_path):
+    _setup(tmp_path)
+    for image in sorted((tmp_path / "cefs-images").glob("*/*.sqfs")):
+        assert write_manifest_sidecar(image)
+    with patch("lib.cefs_manifest.yaml.load", side_effect=AssertionError("parsed YAML")):
+        results, checked = _fsck(tmp_path)
+    assert checked == 3
+    assert results.valid_manifests == 1
+    assert len(results.old_format_manifests) == len(results.invalid_name_manifests) == 1
+
+
+def test_find_pending_cleanups_in_one_walk(tmp_path):
+    (tmp_path / "gcc.bak").mkdir()
+    (tmp_path / "deep" / "er").mkdir(parents=True)
+    (tmp_path / "deep" / "er" / "clang.DELETE_ME_20240101_000000").mkdir()
+    (tmp_path / "deep" / "er" / "too-deep").mkdir()
+    (tmp_path / "deep" / "er" / "too-deep" / "x.bak").mkdir()
+    (tmp_path / "mounted").symlink_to(tmp_path / "deep")
+    (tmp_path / "link.bak").symlink_to("/cefs/ab/abc")
+
+    backups, deletes = find_pending_cleanups(tmp_path, time.time(), max_depth=2)
+
+    assert sorted(item.path for item in backups) == [tmp_path / "gcc.bak", tmp_path / "link.bak"]
+    assert [item.path for item in deletes] == [tmp_path / "deep" / "er" / "clang.DELETE_ME_20240101_000000"]
+    assert sorted(item.path for item in backups) == sorted(
+        item.path for item in fsck.find_files_by_pattern(tmp_path, "*.bak", time.time(), max_depth=2)
+    )
+
+
+def test_verify_image_hashes(tmp_path):
+    images = []
+    for content in (b"gcc", b"clang"):
+        image = tmp_path / f"{hashlib.sha256(content).hexdigest()[:24]}_opt_{content.decode()}.sqfs"
+        image.write_bytes(content)
+        images.append(image)
+    images[1].write_bytes(b"truncated")
+    missing = tmp_path / "missing.sqfs"
+
+    mismatches = verify_image_hashes([*images, missing], max_workers=2)
+
+    assert [(path, error.split(":")[0]) for path, error in mismatches] == [
+        (images[1], f"Content hashes to {hashlib.sha256(b'truncated').hexdigest()[:24]}"),
+        (missing, "Cannot hash image"),
+    ]
@@ -13,6 +13,7 @@ from lib.cefs.gc import (
     check_if_symlink_references_image,
     delete_image_with_manifest,
     filter_images_by_age,
+    plan_gc,
 )
 from lib.cefs.state import CEFSState
 from pytest import approx
@@ -353,6 +354,8 @@ def test_delete_image_with_manifest(tmp_path):
     # Test successful deletion with manifest
     image_path.write_bytes(b"image content")
     manifest_path.write_text("manifest content")
+    sidecar_path = image_path.with_suffix(".manifest.json")
+    sidecar_path.write_text("{}")
 
     result = delete_image_with_manifest(image_path)
     assert result.success
@@ -360,6 +363,7 @@ def test_delete_image_with_manifest(tmp_path):
     assert not result.errors
     assert not image_path.exists()
     assert not manifest_path.exists()
+    assert not sidecar_path.exists()
 
     # Test deletion without manifest
     image_path.write_bytes(b"image")
@@ -414,3 +418,31 @@ def test_filter_images_by_age_with_specific_times(tmp_path):
     assert result.too_recent[0][0] == image3
     # Check the age is approximately 30 minutes
     assert result.too_recent[0][1].total_seconds() / 60 == approx(30, abs=1)
+
+
+def test_plan_gc_ranks_biggest_first_within_budgets(tmp_path):
+    now = datetime.datetime.now()
+    images = {}
+    for name, size, hours_old in (("small", 10, 5), ("big", 1000, 2), ("medium", 100, 3), ("medium_older", 100, 4)):
+        images[name] = tmp_path / f"{name}.sqfs"
+        images[name].write_bytes(b"x" * size)
+        then = time.time() - hours_old * 3600
+        os.utime(images[name], (then, then))
+    images["vanished"] = tmp_path / "vanished.sqfs"
+
+    plan = plan_gc(list(images.values()), now)
+    assert [c.image_path.stem for c in plan.to_delete] == ["big", "medium_older", "medium", "small", "vanished"]
+    assert plan.bytes_to_reclaim == 1210
+    assert plan.to_delete[0].age.total_seconds() == approx(2 * 3600, abs=5)
+    assert plan.to_delete[-1].size is None
+    assert not plan.deferred
+
+    # big doesn't fit, but smaller ones after it still can
+    plan = plan_gc(list(images.values()), now, max_bytes=150)
+    assert [c.image_path.stem for c in plan.to_delete] == ["medium_older", "small", "vanished"]
+    assert [c.image_path.stem for c in plan.deferred] == ["big", "medium"]
+    assert plan.bytes_deferred == 1100
+
+    plan = plan_gc(list(images.values()), now, max_images=2)
+    assert [c.image_path.stem for c in plan.to_delete] == ["big", "medium_older"]
+    assert plan.estimated_seconds(max_workers=2) == approx(plan.estimated_seconds(max_workers=1) / 2)
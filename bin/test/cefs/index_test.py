@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Tests for the persistent CEFS state index."""
+
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+
+import yaml
+from lib.cefs.index import CEFSIndex
+from lib.cefs.state import CEFSState
+
+from test.cefs.test_helpers import make_test_manifest
+
+_AN_HOUR_AGO = time.time() - 3600
+
+
+def _age(*paths: Path, when: float = _AN_HOUR_AGO) -> None:
+    """Backdate paths so the index trusts their mtimes."""
+    for path in paths:
+        os.utime(path, (when, when))
+
+
+def _setup(tmp_path: Path) -> tuple[Path, Path, Path]:
+    nfs_dir = tmp_path / "nfs"
+    cefs_dir = tmp_path / "cefs-images"
+    mount_point = tmp_path / "cefs"
+    (nfs_dir / "tools").mkdir(parents=True)
+    (cefs_dir / "ab").mkdir(parents=True)
+    image = cefs_dir / "ab" / "abc123_weasel.sqfs"
+    image.write_bytes(b"x" * 100)
+    (cefs_dir / "ab" / "abc123_weasel.yaml").write_text(
+        yaml.dump(make_test_manifest(contents=[{"name": "tools/weasel 1.0", "destination": str(nfs_dir / "weasel")}]))
+    )
+    (nfs_dir / "weasel").symlink_to(mount_point / "ab" / "abc123_weasel")
+    (nfs_dir / "tools" / "stoat").symlink_to(mount_point / "de" / "def456_stoat" / "stoat")
+    (nfs_dir / "tools" / "ferret").symlink_to("/somewhere/else")
+    _age(
+        nfs_dir,
+        nfs_dir / "tools",
+        cefs_dir,
+        cefs_dir / "ab",
+        cefs_dir / "ab" / "abc123_weasel.yaml",
+    )
+    return nfs_dir, cefs_dir, mount_point
+
+
+def _index(tmp_path: Path, nfs_dir: Path, cefs_dir: Path, mount_point: Path, **kwargs) -> CEFSIndex:
+    return CEFSIndex(tmp_path / "index.sqlite", nfs_dir, cefs_dir, mount_point, **kwargs)
+
+
+def test_reuses_unchanged_listings_and_manifests(tmp_path):
+    nfs_dir, cefs_dir, mount_point = _setup(tmp_path)
+    image = cefs_dir / "ab" / "abc123_weasel.sqfs"
+
+    index = _index(tmp_path, nfs_dir, cefs_dir, mount_point)
+    assert index.image_subdirs() == {cefs_dir / "ab": {"abc123_weasel.sqfs": 100, "abc123_weasel.yaml": None}}
+    assert index.read_manifest(image)["contents"][0]["name"] == "tools/weasel 1.0"
+    index.refresh_symlinks()
+    assert (index.dirs_listed, index.manifests_parsed) == (4, 1)
+    index.close()
+
+    index = _index(tmp_path, nfs_dir, cefs_dir, mount_point)
+    assert index.image_subdirs() == {cefs_dir / "ab": {"abc123_weasel.sqfs": 100, "abc123_weasel.yaml": None}}
+    assert index.read_manifest(image)["contents"][0]["name"] == "tools/weasel 1.0"
+    index.refresh_symlinks()
+    assert (index.dirs_listed, index.dirs_reused) == (0, 4)
+    assert (index.manifests_parsed, index.manifests_reused) == (0, 1)
+    index.close()
+
+
+def test_notices_changed_directories_and_manifests(tmp_path):
+    nfs_dir, cefs_dir, mount_point = _setup(tmp_path)
+    image = cefs_dir / "ab" / "abc123_weasel.sqfs"
+    _index(tmp_path, nfs_dir, cefs_dir, mount_point).read_manifest(image)
+    index = _index(tmp_path, nfs_dir, cefs_dir, mount_point)
+    index.refresh_symlinks()
+    assert index.symlinks_to("def456_stoat") == [nfs_dir / "tools" / "stoat"]
+    index.close()
+
+    (nfs_dir / "tools" / "stoat").unlink()
+    (nfs_dir / "tools" / "stoat").symlink_to(mount_point / "de" / "def789_stoat" / "stoat")
+    (cefs_dir / "ab" / "abc123_weasel.yaml").write_text(yaml.dump(make_test_manifest(description="changed")))
+    # Changed, but not recently: only the mtime can tell the index to look again.
+    _age(nfs_dir / "tools", cefs_dir / "ab" / "abc123_weasel.yaml", when=_AN_HOUR_AGO + 60)
+
+    index = _index(tmp_path, nfs_dir, cefs_dir, mount_point)
+    index.refresh_symlinks()
+    assert index.symlinks_to("def456_stoat") == []
+    assert index.symlinks_to("def789_stoat") == [nfs_dir / "tools" / "stoat"]
+    assert index.read_manifest(image)["description"] == "changed"
+    index.close()
+
+
+def test_recent_changes_are_always_rescanned(tmp_path):
+    nfs_dir, cefs_dir, mount_point = _setup(tmp_path)
+    _age(nfs_dir / "tools", when=time.time())
+    _index(tmp_path, nfs_dir, cefs_dir, mount_point).refresh_symlinks()
+    index = _index(tmp_path, nfs_dir, cefs_dir, mount_point)
+    index.refresh_symlinks()
+    assert (index.dirs_listed, index.dirs_reused) == (1, 1)
+
+
+def test_rebuild_and_changed_roots_reset_the_index(tmp_path):
+    nfs_dir, cefs_dir, mount_point = _setup(tmp_path)
+    _index(tmp_path, nfs_dir, cefs_dir, mount_point).refresh_symlinks()
+
+    index = _index(tmp_path, nfs_dir, cefs_dir, mount_point, rebuild=True)
+    index.refresh_symlinks()
+    assert index.dirs_reused == 0
+
+    index = _index(tmp_path, nfs_dir, cefs_dir, tmp_path / "elsewhere")
+    assert index.symlinks_to("abc123_weasel") == []
+    index.refresh_symlinks()
+    assert index.dirs_reused == 0
+    assert index.symlinks_to("abc123_weasel") == []
+
+
+def test_state_with_index_matches_state_without(tmp_path):
+    nfs_dir, cefs_dir, mount_point = _setup(tmp_path)
+    (cefs_dir / "ab" / "abd000_orphan.sqfs").write_bytes(b"y" * 10)
+    _age(cefs_dir / "ab")
+
+    def scan(index: CEFSIndex | None) -> CEFSState:
+        state = CEFSState(nfs_dir, cefs_dir, mount_point, index=index)
+        state.scan_cefs_images_with_manifests()
+        state.check_symlink_references(include_broken=True)
+        return state
+
+    for index in (_index(tmp_path, nfs_dir, cefs_dir, mount_point), _index(tmp_path, nfs_dir, cefs_dir, mount_point)):
+        with_index = scan(index)
+        without_index = scan(None)
+        assert with_index.all_cefs_images == without_index.all_cefs_images
+        assert with_index.broken_images == without_index.broken_images == [cefs_dir / "ab" / "abd000_orphan.sqfs"]
+        assert with_index.referenced_images == without_index.referenced_images
+        assert with_index.get_usage_stats() == without_index.get_usage_stats()
+        assert list(with_index.symlink_candidates("def456_stoat")) == [nfs_dir / "tools" / "stoat"]
+        index.close()
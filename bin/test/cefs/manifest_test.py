@@ -10,15 +10,20 @@ from unittest.mock import Mock, patch
 import pytest
 import yaml
 from lib.cefs_manifest import (
+    ManifestLoadTimings,
     create_installable_manifest_entry,
     create_manifest,
     finalize_manifest,
     generate_cefs_filename,
     get_git_sha,
+    get_sidecar_path,
     read_manifest_from_alongside,
+    read_manifests_from_alongside,
     sanitize_path_for_filename,
+    sidecar_is_current,
     write_manifest_alongside_image,
     write_manifest_inprogress,
+    write_manifest_sidecar,
 )
 
 from test.cefs.test_helpers import make_test_manifest
@@ -166,6 +171,12 @@ def test_write_and_read_manifest_alongside_image(tmp_path):
     loaded_manifest = read_manifest_from_alongside(image_path)
 
     assert loaded_manifest == manifest
+    # Written via a temp file, which mustn't be left behind
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "test_image.manifest.json",
+        "test_image.sqfs",
+        "test_image.yaml",
+    ]
 
 
 def test_read_manifest_from_alongside_nonexistent():
@@ -196,3 +207,62 @@ def test_read_manifest_from_alongside_invalid_manifest(tmp_path):
     manifest_path.write_text(yaml.dump(invalid_manifest))
 
     assert read_manifest_from_alongside(image_path) is None
+
+
+def test_read_manifests_from_alongside_matches_one_at_a_time(tmp_path):
+    images = []
+    for i in range(20):
+        image_path = tmp_path / f"image{i}.sqfs"
+        if i % 5 == 1:
+            image_path.with_suffix(".yaml").write_text("invalid: yaml: content: [")
+        elif i % 5 != 2:
+            write_manifest_alongside_image(make_test_manifest(description=f"image {i}"), image_path)
+        images.append(image_path)
+    timings = ManifestLoadTimings()
+
+    manifests = read_manifests_from_alongside(images, max_workers=4, timings=timings)
+
+    assert manifests == [read_manifest_from_alongside(image_path) for image_path in images]
+    assert [manifest["description"] for manifest in manifests if manifest] == [
+        f"image {i}" for i in range(20) if i % 5 not in (1, 2)
+    ]
+    assert timings.manifests == 16
+    assert timings.reading > 0 and timings.parsing > 0
+
+
+def test_manifest_read_from_sidecar_only_while_it_matches_yaml(tmp_path):
+    image_path = tmp_path / "test_image.sqfs"
+    manifest = make_test_manifest()
+    write_manifest_alongside_image(manifest, image_path)
+    assert sidecar_is_current(image_path)
+
+    with patch("lib.cefs_manifest.yaml.load") as load_yaml:
+        timings = ManifestLoadTimings()
+        assert read_manifests_from_alongside([image_path], timings=timings) == [manifest]
+        load_yaml.assert_not_called()
+    assert timings.sidecars == 1
+
+    # Rewritten without updating the sidecar, e.g. by an older ce_install
+    manifest["description"] = "Rewritten"
+    image_path.with_suffix(".yaml").write_text(yaml.dump(manifest), encoding="utf-8")
+    assert not sidecar_is_current(image_path)
+    assert read_manifest_from_alongside(image_path) == manifest
+
+    assert write_manifest_sidecar(image_path)
+    assert sidecar_is_current(image_path)
+    get_sidecar_path(image_path).write_text("{not json", encoding="utf-8")
+    assert read_manifest_from_alongside(image_path) == manifest
+
+    # The YAML is the source of truth: a sidecar on its own is no manifest
+    image_path.with_suffix(".yaml").unlink()
+    assert read_manifest_from_alongside(image_path) is None
+
+
+def test_finalize_manifest_writes_sidecar(tmp_path):
+    image_path = tmp_path / "test_image.sqfs"
+    write_manifest_inprogress(make_test_manifest(), image_path)
+    assert not get_sidecar_path(image_path).exists()
+
+    finalize_manifest(image_path)
+
+    assert sidecar_is_current(image_path)
@@ -3,19 +3,24 @@
 
 from __future__ import annotations
 
+import hashlib
+import os
 from pathlib import Path
 from unittest.mock import patch
 
 import pytest
 from lib.cefs.paths import (
     CEFSPaths,
+    calculate_squashfs_hash,
     describe_cefs_image,
     get_cefs_image_path,
     get_cefs_mount_path,
     get_cefs_paths,
     get_current_symlink_targets,
     get_extraction_path_from_symlink,
+    get_image_stem_from_symlink,
     glob_with_depth,
+    map_symlinks_to_images,
     parse_cefs_target,
 )
 
@@ -441,3 +446,52 @@ def test_glob_with_depth_does_not_follow_symlink_dirs(tmp_path):
     assert len(results2) == 2
     assert root_bak in results2
     assert symlink_bak_dir in results2
+
+
+def test_get_image_stem_from_symlink():
+    mount = Path("/cefs")
+    assert get_image_stem_from_symlink(Path("/cefs/ab/abc123_gcc"), mount) == "abc123_gcc"
+    assert get_image_stem_from_symlink(Path("/cefs/ab/abc123_libs/libs/boost"), mount) == "abc123_libs"
+    assert get_image_stem_from_symlink(Path("/cefs/ab"), mount) is None
+    assert get_image_stem_from_symlink(Path("/cefsy/ab/abc123_gcc"), mount) is None
+    assert get_image_stem_from_symlink(Path("gcc-4.5"), mount) is None
+
+
+def test_map_symlinks_to_images_matches_glob_with_depth(tmp_path):
+    mount = Path("/cefs")
+    (tmp_path / "arm" / "deep" / "deeper").mkdir(parents=True)
+    (tmp_path / "gcc-15").symlink_to("/cefs/ab/abc123_gcc/gcc-15")
+    (tmp_path / "gcc-15.bak").symlink_to("/cefs/de/def456_gcc")
+    (tmp_path / "arm" / "gcc-14").symlink_to("/cefs/ab/abc123_gcc/gcc-14")
+    (tmp_path / "arm" / "other").symlink_to("/opt/elsewhere")
+    (tmp_path / "arm" / "deep" / "deeper" / "too-deep").symlink_to("/cefs/ab/abc123_gcc")
+    (tmp_path / "linked-dir").symlink_to(tmp_path / "arm")
+
+    by_image, unreadable = map_symlinks_to_images(tmp_path, mount, max_depth=2)
+
+    assert {stem: sorted(paths) for stem, paths in by_image.items()} == {
+        "abc123_gcc": [tmp_path / "arm" / "gcc-14", tmp_path / "gcc-15"],
+        "def456_gcc": [tmp_path / "gcc-15.bak"],
+    }
+    assert not unreadable
+    expected = {
+        path
+        for path in glob_with_depth(tmp_path, "*", max_depth=2)
+        if path.is_symlink() and get_image_stem_from_symlink(path.readlink(), mount) is not None
+    }
+    assert {path for paths in by_image.values() for path in paths} == expected
+
+
+def test_calculate_squashfs_hash_remembers_unchanged_images(tmp_path):
+    image = tmp_path / "image.sqfs"
+    image.write_bytes(b"squashfs image")
+    assert calculate_squashfs_hash(image) == hashlib.sha256(b"squashfs image").hexdigest()[:24]
+
+    with patch("lib.cefs.paths.hashlib.file_digest") as file_digest:
+        assert calculate_squashfs_hash(image) == hashlib.sha256(b"squashfs image").hexdigest()[:24]
+        file_digest.assert_not_called()
+
+    # Same size, but a new mtime
+    image.write_bytes(b"SQUASHFS IMAGE")
+    os.utime(image, ns=(0, 1_000_000_000))
+    assert calculate_squashfs_hash(image) == hashlib.sha256(b"SQUASHFS IMAGE").hexdigest()[:24]
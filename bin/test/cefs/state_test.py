@@ -9,6 +9,7 @@ from unittest.mock import Mock, patch
 import pytest
 import yaml
 from lib.cefs.gc import check_if_symlink_references_image
+from lib.cefs.paths import map_symlinks_to_images
 from lib.cefs.state import CEFSState
 from lib.cefs_manifest import write_manifest_alongside_image
 
@@ -365,3 +366,22 @@ def test_find_small_consolidated_images(tmp_path):
     # Find images smaller than 100KB
     small_images = state.find_small_consolidated_images(1024 * 100)
     assert set(small_images) == {small_image, medium_image}
+
+
+def test_broken_images_share_one_nfs_walk(tmp_path):
+    nfs_dir = tmp_path / "nfs"
+    cefs_dir = tmp_path / "cefs-images"
+    (nfs_dir / "arm").mkdir(parents=True)
+    (cefs_dir / "ab").mkdir(parents=True)
+    for stem in ("abc1_broken", "abc2_broken", "abc3_broken"):
+        (cefs_dir / "ab" / f"{stem}.sqfs").touch()
+        (cefs_dir / "ab" / f"{stem}.yaml").write_text(yaml.dump(make_test_manifest(contents=[])))
+    (nfs_dir / "arm" / "gcc").symlink_to("/cefs/ab/abc2_broken/gcc")
+    (nfs_dir / "gcc.bak").symlink_to("/cefs/ab/abc3_broken")
+
+    state = CEFSState(nfs_dir, cefs_dir, Path("/cefs"))
+    state.scan_cefs_images_with_manifests()
+    with patch("lib.cefs.state.map_symlinks_to_images", wraps=map_symlinks_to_images) as walk:
+        state.check_symlink_references(include_broken=True)
+    walk.assert_called_once()
+    assert state.referenced_images == {"abc2_broken", "abc3_broken"}
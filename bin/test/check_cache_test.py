@@ -0,0 +1,120 @@
+import os
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+from lib.check_cache import CheckResultCache
+from lib.config import Config
+from lib.installable.installable import Installable
+from lib.installation_context import CHECK_CACHE_FILENAME, InstallationContext
+from lib.library_platform import LibraryPlatform
+
+
+def _make_exe(path: Path) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("#!/bin/sh\necho weasel 1.0\n", encoding="utf-8")
+    path.chmod(0o755)
+    return path
+
+
+def test_records_and_reloads_passes(tmp_path):
+    exe = _make_exe(tmp_path / "weasel-1.0" / "bin" / "weasel")
+    cache_file = tmp_path / "cache.json"
+    cache = CheckResultCache(cache_file)
+    assert not cache.passed(exe, tmp_path / "weasel-1.0", ["--version"], {})
+    cache.record_pass(exe, tmp_path / "weasel-1.0", ["--version"], {})
+    cache.save()
+
+    reloaded = CheckResultCache(cache_file)
+    assert reloaded.passed(exe, tmp_path / "weasel-1.0", ["--version"], {})
+    assert not reloaded.passed(exe, tmp_path / "weasel-1.0", ["--help"], {})
+    assert not reloaded.passed(exe, tmp_path / "weasel-1.0", ["--version"], {"A": "B"})
+
+
+def test_changed_executable_is_a_miss(tmp_path):
+    exe = _make_exe(tmp_path / "weasel-1.0" / "bin" / "weasel")
+    cache = CheckResultCache(tmp_path / "cache.json")
+    cache.record_pass(exe, tmp_path / "weasel-1.0", [], {})
+    later = time.time() + 10
+    os.utime(exe, (later, later))
+    assert not cache.passed(exe, tmp_path / "weasel-1.0", [], {})
+    exe.unlink()
+    assert not cache.passed(exe, tmp_path / "weasel-1.0", [], {})
+
+
+def test_changed_symlink_target_is_a_miss(tmp_path):
+    for version in ("a", "b"):
+        _make_exe(tmp_path / version / "bin" / "weasel")
+    link = tmp_path / "weasel"
+    link.symlink_to(tmp_path / "a")
+    cache = CheckResultCache(tmp_path / "cache.json")
+    cache.record_pass(link / "bin" / "weasel", link, [], {})
+    assert cache.passed(link / "bin" / "weasel", link, [], {})
+    link.unlink()
+    link.symlink_to(tmp_path / "b")
+    assert not cache.passed(link / "bin" / "weasel", link, [], {})
+
+
+def test_invalidate_only_forgets_paths_under_prefix(tmp_path):
+    first = _make_exe(tmp_path / "weasel" / "bin" / "weasel")
+    second = _make_exe(tmp_path / "weasel2" / "bin" / "weasel")
+    cache = CheckResultCache(tmp_path / "cache.json")
+    cache.record_pass(first, first.parent.parent, [], {})
+    cache.record_pass(second, second.parent.parent, [], {})
+    cache.invalidate(tmp_path / "weasel")
+    assert not cache.passed(first, first.parent.parent, [], {})
+    assert cache.passed(second, second.parent.parent, [], {})
+
+
+def test_disabled_cache_never_hits(tmp_path):
+    exe = _make_exe(tmp_path / "weasel")
+    cache = CheckResultCache(None)
+    cache.record_pass(exe, tmp_path, [], {})
+    assert not cache.passed(exe, tmp_path, [], {})
+    cache.save()
+
+
+def _context(destination: Path) -> InstallationContext:
+    return InstallationContext(
+        destination=destination,
+        staging_root=destination / "staging",
+        s3_url="https://example.com",
+        dry_run=False,
+        is_nightly_enabled=False,
+        only_nightly=False,
+        cache=None,
+        yaml_dir=destination,
+        allow_unsafe_ssl=False,
+        resource_dir=destination,
+        keep_staging=False,
+        check_user="",
+        platform=LibraryPlatform.Linux,
+        config=Config(),
+        cache_check_results=True,
+    )
+
+
+def test_is_installed_skips_check_call_once_passed(tmp_path):
+    _make_exe(tmp_path / "weasel-1.0" / "bin" / "weasel")
+    config = dict(context=["tools"], name="weasel", check_exe="bin/weasel")
+
+    context = _context(tmp_path)
+    installable = Installable(context, config)
+    installable.install_path = "weasel-1.0"
+    Installable.resolve([installable])
+    assert installable.is_installed()
+    context.save_check_results()
+    assert (tmp_path / CHECK_CACHE_FILENAME).exists()
+
+    context = _context(tmp_path)
+    installable = Installable(context, config)
+    installable.install_path = "weasel-1.0"
+    Installable.resolve([installable])
+    with patch.object(context, "check_output") as check_output:
+        assert installable.is_installed()
+        check_output.assert_not_called()
+
+        context.remove_dir("weasel-1.0")
+        check_output.side_effect = FileNotFoundError
+        assert not installable.is_installed()
+        check_output.assert_called_once()
@@ -0,0 +1,85 @@
+from pathlib import Path
+
+import pytest
+from lib.config_cache import ExpandedTargetCache
+
+YAML = """
+compilers:
+  weasel:
+    type: tarballs
+    dir: weasel-{{name}}
+    check_exe: "{{destination}}/weasel-{{name}}/bin/weasel"
+    targets:
+      - "1.0"
+      - name: nightly
+        if: nightly
+"""
+
+
+@pytest.fixture(name="base_config")
+def base_config_fixture():
+    return dict(destination=Path("/opt/ce"), yaml_dir=Path("/yaml"), resource_dir=Path("/res"), now=None)
+
+
+def _write(tmp_path: Path, content: str) -> Path:
+    yaml_path = tmp_path / "weasel.yaml"
+    yaml_path.write_text(content, encoding="utf-8")
+    return yaml_path
+
+
+def _as_dicts(targets):
+    return [dict(target) for target in targets]
+
+
+def test_warm_cache_matches_cold_expansion(tmp_path, base_config):
+    yaml_path = _write(tmp_path, YAML)
+    uncached = ExpandedTargetCache(None).targets_for(yaml_path, ["nightly"], base_config)
+    cache = ExpandedTargetCache(tmp_path / "cache")
+    cold = cache.targets_for(yaml_path, ["nightly"], base_config)
+    warm = cache.targets_for(yaml_path, ["nightly"], base_config)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert _as_dicts(cold) == _as_dicts(uncached)
+    assert _as_dicts(warm) == _as_dicts(uncached)
+    assert warm[0]["check_exe"] == "/opt/ce/weasel-1.0/bin/weasel"
+    assert warm[0]["destination"] == Path("/opt/ce")
+
+
+def test_cache_is_keyed_on_enabled_set(tmp_path, base_config):
+    yaml_path = _write(tmp_path, YAML)
+    cache = ExpandedTargetCache(tmp_path / "cache")
+    assert len(cache.targets_for(yaml_path, ["nightly"], base_config)) == 2
+    assert len(cache.targets_for(yaml_path, [], base_config)) == 1
+    assert len(cache.targets_for(yaml_path, True, base_config)) == 2
+    assert cache.misses == 3
+
+
+def test_cache_is_invalidated_by_content_and_base_config(tmp_path, base_config):
+    yaml_path = _write(tmp_path, YAML)
+    cache = ExpandedTargetCache(tmp_path / "cache")
+    cache.targets_for(yaml_path, [], base_config)
+    _write(tmp_path, YAML.replace('"1.0"', '"2.0"'))
+    [target] = cache.targets_for(yaml_path, [], base_config)
+    assert target["name"] == "2.0"
+    [target] = cache.targets_for(yaml_path, [], dict(base_config, destination=Path("/elsewhere")))
+    assert target["check_exe"] == "/elsewhere/weasel-2.0/bin/weasel"
+    assert cache.hits == 0
+
+
+def test_targets_using_now_are_not_cached(tmp_path, base_config):
+    yaml_path = _write(tmp_path, YAML.replace("dir: weasel-{{name}}", "dir: weasel-{{now.year}}"))
+    cache = ExpandedTargetCache(tmp_path / "cache")
+    cache.targets_for(yaml_path, [], base_config)
+    cache.targets_for(yaml_path, [], base_config)
+    assert cache.hits == 0
+    assert not (tmp_path / "cache").exists()
+
+
+def test_corrupt_cache_is_ignored(tmp_path, base_config):
+    yaml_path = _write(tmp_path, YAML)
+    cache = ExpandedTargetCache(tmp_path / "cache")
+    cache.targets_for(yaml_path, [], base_config)
+    for cache_file in (tmp_path / "cache").iterdir():
+        cache_file.write_text("{not json", encoding="utf-8")
+    [target] = cache.targets_for(yaml_path, [], base_config)
+    assert target["name"] == "1.0"
+    assert cache.hits == 0
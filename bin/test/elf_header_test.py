@@ -0,0 +1,73 @@
+import logging
+import shutil
+import struct
+import subprocess
+import sys
+
+import pytest
+from lib.binary_info import BinaryInfo
+from lib.elf_header import has_elf_magic, read_elf_header
+from lib.library_platform import LibraryPlatform
+
+
+def _elf32_big_endian_exec(interpreter: bytes) -> bytes:
+    ident = b"\x7fELF" + bytes([1, 2, 1, 0]) + bytes(8)
+    phoff = 52
+    header = struct.pack(">HHIIIIIHHHHHH", 2, 8, 1, 0, phoff, 0, 0, 52, 32, 2, 0, 0, 0)
+    interp_offset = phoff + 2 * 32
+    phdrs = struct.pack(">IIIIIIII", 3, interp_offset, 0, 0, len(interpreter), 0, 0, 0)
+    phdrs += struct.pack(">IIIIIIII", 2, 0, 0, 0, 0, 0, 0, 0)
+    return ident + header + phdrs + interpreter
+
+
+def test_reads_synthetic_header(tmp_path):
+    path = tmp_path / "weasel"
+    path.write_bytes(_elf32_big_endian_exec(b"/lib/ld.so.1\0"))
+    header = read_elf_header(path)
+    assert header is not None
+    assert (header.bits, header.big_endian, header.file_type_name, header.machine_name) == (32, True, "EXEC", "mips")
+    assert header.interpreter == "/lib/ld.so.1"
+    assert header.has_dynamic
+
+
+@pytest.mark.parametrize(
+    "content",
+    [b"", b"#!/bin/sh\n", b"\x7fELF", b"\x7fELF" + bytes([3, 1, 1]) + bytes(60), b"\x7fELF\x02\x01\x01" + bytes(20)],
+)
+def test_rejects_non_elf_and_truncated(tmp_path, content):
+    path = tmp_path / "weasel"
+    path.write_bytes(content)
+    assert read_elf_header(path) is None
+    assert read_elf_header(tmp_path / "missing") is None
+
+
+def test_reads_running_interpreter():
+    header = read_elf_header(sys.executable)
+    if header is None:
+        pytest.skip("python is not an ELF binary here")
+    assert header.bits in (32, 64)
+    assert has_elf_magic(sys.executable)
+
+
+@pytest.mark.skipif(not shutil.which("cc"), reason="needs a C compiler")
+def test_distinguishes_executables_and_objects(tmp_path):
+    source = tmp_path / "weasel.c"
+    source.write_text("int main(void) { return 0; }\n", encoding="utf-8")
+    subprocess.check_call(["cc", "-o", str(tmp_path / "dynamic"), str(source)])
+    subprocess.check_call(["cc", "-c", "-o", str(tmp_path / "weasel.o"), str(source)])
+    dynamic = read_elf_header(tmp_path / "dynamic")
+    assert dynamic is not None
+    assert dynamic.has_dynamic
+    assert dynamic.interpreter
+    obj = read_elf_header(tmp_path / "weasel.o")
+    assert obj is not None
+    assert (obj.file_type_name, obj.has_dynamic, obj.interpreter) == ("REL", False, None)
+
+
+def test_binary_info_follows_linker_script_without_readelf(tmp_path):
+    (tmp_path / "libweasel.so").write_text("INPUT (libweasel.so.1)\n", encoding="utf-8")
+    (tmp_path / "libweasel.so.1").write_text("not a library either", encoding="utf-8")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(BinaryInfo, "_debug_check_output", lambda *_: pytest.fail("should not need readelf"))
+        info = BinaryInfo(logging.getLogger(), str(tmp_path), str(tmp_path / "libweasel.so"), LibraryPlatform.Linux)
+    assert info.filepath == tmp_path / "libweasel.so.1"
@@ -0,0 +1,121 @@
+import threading
+import time
+from unittest.mock import Mock
+
+from lib.install_scheduler import InstallScheduler, build_install_graph
+
+
+def fake(name, depends=None, installed_after=True, log=None, fail=False, delay=0.0):
+    installable = Mock()
+    installable.name = name
+    installable.depends = depends or []
+    state = {"installed": False}
+
+    def install():
+        if log is not None:
+            log.append(("start", name))
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError(f"{name} exploded")
+        state["installed"] = installed_after
+        if log is not None:
+            log.append(("end", name))
+
+    installable.install.side_effect = install
+    installable.is_installed.side_effect = lambda: state["installed"]
+    return installable
+
+
+def test_graph_includes_transitive_dependees():
+    base = fake("base")
+    mid = fake("mid", [base])
+    top = fake("top", [mid])
+    nodes = build_install_graph([top])
+    assert set(nodes) == {"top", "mid", "base"}
+    assert nodes["top"].requested
+    assert not nodes["mid"].requested
+    assert nodes["mid"].depends == {"base"}
+    assert nodes["base"].dependents == {"mid"}
+
+
+def test_dependencies_install_before_dependents():
+    log = []
+    base = fake("base", log=log, delay=0.01)
+    a = fake("a", [base], log=log)
+    b = fake("b", [base], log=log)
+    summary = InstallScheduler(max_workers=4, dry_run=False).run([(a, True), (b, True), (base, True)])
+    assert sorted(summary.installed) == ["a", "b", "base"]
+    assert summary.failed == []
+    assert log.index(("end", "base")) < log.index(("start", "a"))
+    assert log.index(("end", "base")) < log.index(("start", "b"))
+
+
+def test_shared_unrequested_dependee_is_installed_once():
+    base = fake("base")
+    a = fake("a", [base])
+    b = fake("b", [base])
+    summary = InstallScheduler(max_workers=4, dry_run=False).run([(a, True), (b, True)])
+    assert sorted(summary.installed) == ["a", "b"]
+    assert base.install.call_count == 1
+
+
+def test_independent_targets_run_concurrently():
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def make(name):
+        installable = fake(name)
+        original = installable.install.side_effect
+
+        def install():
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.05)
+            with lock:
+                running -= 1
+            original()
+
+        installable.install.side_effect = install
+        return installable
+
+    to_do = [(make(f"t{i}"), True) for i in range(4)]
+    summary = InstallScheduler(max_workers=4, dry_run=False).run(to_do)
+    assert len(summary.installed) == 4
+    assert peak > 1
+
+
+def test_failure_propagates_to_dependents_only():
+    base = fake("base", fail=True)
+    dependent = fake("dependent", [base])
+    other = fake("other")
+    summary = InstallScheduler(max_workers=2, dry_run=False).run([
+        (base, True),
+        (dependent, True),
+        (other, True),
+        (fake("skipped"), False),
+    ])
+    assert summary.installed == ["other"]
+    assert sorted(summary.failed) == ["base", "dependent"]
+    assert summary.skipped == ["skipped"]
+    dependent.install.assert_not_called()
+
+
+def test_not_installed_after_install_is_a_failure():
+    summary = InstallScheduler(max_workers=1, dry_run=False).run([(fake("broken", installed_after=False), True)])
+    assert summary.failed == ["broken"]
+
+
+def test_dry_run_assumes_success():
+    summary = InstallScheduler(max_workers=1, dry_run=True).run([(fake("broken", installed_after=False), True)])
+    assert summary.installed == ["broken"]
+
+
+def test_dependency_cycles_fail():
+    a = fake("a")
+    b = fake("b", [a])
+    a.depends = [b]
+    summary = InstallScheduler(max_workers=2, dry_run=False).run([(a, True), (b, True)])
+    assert sorted(summary.failed) == ["a", "b"]
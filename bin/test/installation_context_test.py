@@ -4,7 +4,7 @@ import stat
 import tempfile
 from pathlib import Path
 
-from lib.installation_context import fix_permissions
+from lib.installation_context import fix_permissions, fixed_permission_bits
 
 
 def test_fix_permissions_skips_broken_symlinks():
@@ -100,3 +100,10 @@ def test_fix_permissions_fixes_root_directory():
         # Verify file permissions are fixed (should be 644)
         file_mode = stat.S_IMODE(test_file.stat().st_mode)
         assert file_mode == 0o644, f"Expected 0o644, got {oct(file_mode)}"
+
+
+def test_fixed_permission_bits():
+    assert fixed_permission_bits(0o700) == 0o755
+    assert fixed_permission_bits(0o400) == 0o644
+    assert fixed_permission_bits(0o777) == 0o755
+    assert fixed_permission_bits(stat.S_IFREG | 0o100) == 0o311
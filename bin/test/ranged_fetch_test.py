@@ -0,0 +1,136 @@
+import contextlib
+import io
+import re
+import threading
+import time
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from lib.config import Config
+from lib.installation_context import InstallationContext
+from lib.library_platform import LibraryPlatform
+from lib.ranged_fetch import RangeFetchFailure, part_bounds, ranged_chunks
+
+CONTENT = bytes(range(256)) * 4099
+
+
+class _Handler(BaseHTTPRequestHandler):
+    accept_ranges = True
+    honour_ranges = True
+    ranges_seen: list[str] = []
+
+    def do_GET(self):  # noqa: N802
+        content = CONTENT
+        range_header = self.headers.get("Range")
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", range_header or "")
+        if match and self.honour_ranges:
+            self.ranges_seen.append(range_header)
+            first, last = int(match[1]), int(match[2])
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {first}-{last}/{len(content)}")
+            content = content[first : last + 1]
+        else:
+            self.send_response(200)
+        if self.accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        # The client hangs up on the initial request once it decides to fetch in parts.
+        with contextlib.suppress(ConnectionError):
+            self.wfile.write(content)
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+
+@contextlib.contextmanager
+def _server(accept_ranges: bool = True, honour_ranges: bool = True) -> Iterator[tuple[str, list[str]]]:
+    accept, honour = accept_ranges, honour_ranges
+    seen: list[str] = []
+
+    class Handler(_Handler):
+        accept_ranges = accept
+        honour_ranges = honour
+        ranges_seen = seen
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/archive.tar", seen
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _context(tmp_path: Path, fetch_parts: int) -> InstallationContext:
+    return InstallationContext(
+        destination=tmp_path / "dest",
+        staging_root=tmp_path / "staging",
+        s3_url="https://example.com",
+        dry_run=False,
+        is_nightly_enabled=False,
+        only_nightly=False,
+        cache=None,
+        yaml_dir=tmp_path,
+        allow_unsafe_ssl=False,
+        resource_dir=tmp_path,
+        keep_staging=False,
+        check_user="",
+        platform=LibraryPlatform.Linux,
+        config=Config(),
+        fetch_parts=fetch_parts,
+        fetch_parts_min_size=1024,
+    )
+
+
+def test_part_bounds_cover_everything_once():
+    assert part_bounds(10, 3) == [(0, 2), (3, 5), (6, 9)]
+    assert part_bounds(2, 4) == [(0, 0), (1, 1)]
+    assert part_bounds(7, 1) == [(0, 6)]
+
+
+def test_fetches_in_parts_and_reassembles_in_order(tmp_path):
+    with _server() as (url, ranges_seen):
+        fd = io.BytesIO()
+        _context(tmp_path, fetch_parts=4).fetch_to(url, fd)
+    assert fd.getvalue() == CONTENT
+    assert len(ranges_seen) == 4
+
+
+def test_only_fetches_a_window_of_parts_ahead(tmp_path):
+    with _server() as (url, ranges_seen), patch("lib.ranged_fetch.PART_SIZE", 65536):
+        context = _context(tmp_path, fetch_parts=4)
+        chunks = ranged_chunks(context.fetcher, url, len(CONTENT), 4)
+        received = [next(chunks)]
+        time.sleep(0.2)
+        assert len(ranges_seen) == 4
+        received.extend(chunks)
+    assert b"".join(received) == CONTENT
+    assert len(ranges_seen) == -(-len(CONTENT) // 65536)
+
+
+def test_single_stream_without_range_support(tmp_path):
+    with _server(accept_ranges=False) as (url, ranges_seen):
+        fd = io.BytesIO()
+        _context(tmp_path, fetch_parts=4).fetch_to(url, fd)
+    assert fd.getvalue() == CONTENT
+    assert ranges_seen == []
+
+
+def test_small_downloads_use_one_connection(tmp_path):
+    with _server() as (url, ranges_seen):
+        context = _context(tmp_path, fetch_parts=4)
+        context.fetch_parts_min_size = len(CONTENT) + 1
+        fd = io.BytesIO()
+        context.fetch_to(url, fd)
+    assert fd.getvalue() == CONTENT
+    assert ranges_seen == []
+
+
+def test_server_ignoring_ranges_fails(tmp_path):
+    with _server(honour_ranges=False) as (url, _), pytest.raises(RangeFetchFailure):
+        _context(tmp_path, fetch_parts=4).fetch_to(url, io.BytesIO())
@@ -0,0 +1,127 @@
+import io
+import subprocess
+import tarfile
+import threading
+from pathlib import Path
+
+import pytest
+from lib.config import Config
+from lib.installation_context import InstallationContext
+from lib.library_platform import LibraryPlatform
+from lib.spool_buffer import SpoolAborted, SpoolBuffer
+from lib.staging import StagingDir
+
+
+def _drain(spool: SpoolBuffer, size: int = 7) -> bytes:
+    result = b""
+    while chunk := spool.read(size):
+        result += chunk
+    return result
+
+
+def test_small_data_stays_in_memory():
+    spool = SpoolBuffer(memory_limit=1024)
+    spool.write(b"hello ")
+    spool.write(b"world")
+    spool.close()
+    assert _drain(spool) == b"hello world"
+    assert spool.peak_spilled == 0
+    assert spool.peak_memory == 11
+
+
+def test_spills_to_disk_and_preserves_order():
+    spool = SpoolBuffer(memory_limit=10)
+    data = [bytes([65 + i]) * 4 for i in range(20)]
+    for chunk in data:
+        spool.write(chunk)
+    spool.close()
+    assert spool.total_spilled > 0
+    assert spool.peak_memory <= 10
+    assert _drain(spool) == b"".join(data)
+    spool.discard()
+
+
+def test_returns_to_memory_once_reader_catches_up():
+    spool = SpoolBuffer(memory_limit=4)
+    spool.write(b"abcd")
+    spool.write(b"efgh")  # spilled
+    assert spool.read(100) == b"abcd"
+    assert spool.read(100) == b"efgh"
+    spilled = spool.total_spilled
+    spool.write(b"ijkl")
+    assert spool.total_spilled == spilled
+    spool.close()
+    assert _drain(spool) == b"ijkl"
+
+
+def test_concurrent_reader_and_writer():
+    spool = SpoolBuffer(memory_limit=64)
+    expected = b"".join(i.to_bytes(4, "little") for i in range(10000))
+    result = []
+
+    def reader():
+        result.append(_drain(spool, 33))
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    for offset in range(0, len(expected), 50):
+        spool.write(expected[offset : offset + 50])
+    spool.close()
+    thread.join()
+    assert result == [expected]
+
+
+def test_abort_stops_the_other_side():
+    spool = SpoolBuffer(memory_limit=64)
+    spool.abort(RuntimeError("boom"))
+    with pytest.raises(SpoolAborted):
+        spool.write(b"data")
+    with pytest.raises(SpoolAborted):
+        spool.read()
+
+
+def _tarball(files: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def _context(tmp_path: Path, stream_fetches: bool = True) -> InstallationContext:
+    return InstallationContext(
+        destination=tmp_path / "dest",
+        staging_root=tmp_path / "staging",
+        s3_url="https://example.com",
+        dry_run=False,
+        is_nightly_enabled=False,
+        only_nightly=False,
+        cache=None,
+        yaml_dir=tmp_path,
+        allow_unsafe_ssl=False,
+        resource_dir=tmp_path,
+        keep_staging=False,
+        check_user="",
+        platform=LibraryPlatform.Linux,
+        config=Config(),
+        stream_fetches=stream_fetches,
+    )
+
+
+@pytest.mark.parametrize("stream_fetches", [True, False])
+def test_fetch_url_and_pipe_to_unpacks(tmp_path, requests_mock, stream_fetches):
+    requests_mock.get("https://example.com/weasel.tar.gz", content=_tarball({"weasel/bin/weasel": b"#!/bin/sh\n"}))
+    staging = StagingDir(tmp_path / "staging" / "x", False)
+    _context(tmp_path, stream_fetches).fetch_url_and_pipe_to(
+        staging, "https://example.com/weasel.tar.gz", ["tar", "zxf", "-"]
+    )
+    assert (staging.path / "weasel" / "bin" / "weasel").read_bytes() == b"#!/bin/sh\n"
+
+
+def test_streaming_reports_failing_command(tmp_path, requests_mock):
+    requests_mock.get("https://example.com/junk.tar.gz", content=b"not a tarball" * 1000)
+    staging = StagingDir(tmp_path / "staging" / "x", False)
+    with pytest.raises(subprocess.CalledProcessError):
+        _context(tmp_path).fetch_url_and_pipe_to(staging, "https://example.com/junk.tar.gz", ["tar", "zxf", "-"])
@@ -0,0 +1,44 @@
+import threading
+import time
+
+from lib.squash_jobs import SizedJob, processors_per_job, run_sized_jobs
+
+
+def test_processors_per_job():
+    assert processors_per_job(1, cores=16) == 16
+    assert processors_per_job(3, cores=16) == 5
+    assert processors_per_job(32, cores=16) == 1
+
+
+def test_results_in_job_order_whatever_finishes_first():
+    jobs = [
+        SizedJob("slow", 1, lambda: time.sleep(0.1) or "slow done"),
+        SizedJob("fast", 1, lambda: "fast done"),
+    ]
+    results = run_sized_jobs(jobs, 2, "Ran")
+    assert [(result.name, result.result) for result in results] == [("slow", "slow done"), ("fast", "fast done")]
+
+
+def test_largest_jobs_start_first():
+    started = []
+    lock = threading.Lock()
+
+    def job(name: str):
+        def run():
+            with lock:
+                started.append(name)
+
+        return run
+
+    jobs = [SizedJob(name, size, job(name)) for name, size in (("small", 1), ("big", 100), ("medium", 10))]
+    run_sized_jobs(jobs, 1, "Ran")
+    assert started == ["big", "medium", "small"]
+
+
+def test_failures_dont_stop_other_jobs():
+    def boom():
+        raise RuntimeError("mksquashfs exploded")
+
+    results = run_sized_jobs([SizedJob("a", 1, boom), SizedJob("b", 1, lambda: 0)], 2, "Ran")
+    assert [result.ok for result in results] == [False, True]
+    assert results[0].error == "mksquashfs exploded"
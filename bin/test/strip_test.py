@@ -0,0 +1,57 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+from lib.elf_header import has_elf_magic
+from lib.strip import batched_by_arg_size, find_elf_executables, strip_files, strip_tree
+
+
+def _write(path: Path, content: bytes, mode: int = 0o755) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    path.chmod(mode)
+    return path
+
+
+def test_finds_only_executable_elf_files(tmp_path):
+    elf = _write(tmp_path / "bin" / "weasel", b"\x7fELF rest of it")
+    _write(tmp_path / "bin" / "weasel.sh", b"#!/bin/sh\n")
+    _write(tmp_path / "lib" / "libweasel.a", b"\x7fELF not executable", mode=0o644)
+    (tmp_path / "bin" / "link").symlink_to(elf)
+    _write(tmp_path / "bin" / "empty", b"")
+    assert find_elf_executables(tmp_path) == [elf]
+    assert has_elf_magic(elf)
+    assert not has_elf_magic(tmp_path / "missing")
+
+
+def test_batches_are_bounded():
+    paths = [Path(f"/some/dir/file{i:04}") for i in range(1000)]
+    batches = list(batched_by_arg_size(paths, max_bytes=1000, max_files=30))
+    assert [path for batch in batches for path in batch] == paths
+    assert all(len(batch) <= 30 for batch in batches)
+    assert all(sum(len(str(path)) + 1 for path in batch) <= 1000 for batch in batches)
+    assert list(batched_by_arg_size([])) == []
+
+
+def test_one_huge_path_still_gets_a_batch():
+    assert list(batched_by_arg_size([Path("x" * 100)], max_bytes=10)) == [[Path("x" * 100)]]
+
+
+@pytest.mark.skipif(not shutil.which("cc") or not shutil.which("strip"), reason="needs a C compiler and strip")
+def test_strips_and_reports_savings(tmp_path):
+    source = tmp_path / "weasel.c"
+    source.write_text("int main(void) { return 0; }\n", encoding="utf-8")
+    subprocess.check_call(["cc", "-g", "-o", str(tmp_path / "weasel"), str(source)])
+    for i in range(5):
+        _write(tmp_path / "bin" / f"weasel{i}", (tmp_path / "weasel").read_bytes())
+    _write(tmp_path / "bin" / "weasel.sh", b"#!/bin/sh\n")
+    result = strip_tree([tmp_path / "bin"], "weasel", max_workers=2)
+    assert result.files == 5
+    assert result.bytes_saved > 0
+    assert strip_files([], max_workers=2).files == 0
+
+
+def test_missing_directory_is_an_error(tmp_path):
+    with pytest.raises(RuntimeError):
+        strip_tree([tmp_path / "nope"], "weasel")
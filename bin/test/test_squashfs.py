@@ -1,8 +1,21 @@
 #!/usr/bin/env python3
 """Tests for squashfs utilities."""
 
+import tarfile
+from pathlib import Path
+
 import pytest
-from lib.squashfs import SquashfsEntry, parse_unsquashfs_line
+from lib.config import SquashfsConfig
+from lib.squashfs import (
+    CONTENT_CHECK_FULL,
+    SquashfsDifference,
+    SquashfsEntry,
+    SquashfsError,
+    compare_squashfs_contents,
+    create_squashfs_image_from_trees,
+    get_uncompressed_size,
+    parse_unsquashfs_line,
+)
 
 
 class TestUnsquashfsParser:
@@ -145,3 +158,176 @@ class TestUnsquashfsParser:
         result = parse_unsquashfs_line(line)
         # Since file type is '-' not 'l', this should be treated as a filename with arrow
         assert result == SquashfsEntry(file_type="-", size=100, path="weird/file -> not_a_link.txt")
+
+
+_LISTING = """Parallel unsquashfs: Using 8 processors
+drwxr-xr-x root/root        55 2021-03-12 09:29 squashfs-root
+drwxr-xr-x root/root        40 2021-03-12 09:29 squashfs-root/bin
+-rwxr-xr-x root/root      1234 2021-03-12 09:29 squashfs-root/bin/gcc
+-rw-r--r-- root/root       100 2021-03-12 09:29 squashfs-root/README
+lrwxrwxrwx root/root         3 2021-03-12 09:29 squashfs-root/cc -> gcc
+"""
+
+
+def _fake_unsquashfs(tmp_path, output: str, exit_code: int = 0) -> SquashfsConfig:
+    script = tmp_path / "unsquashfs"
+    (tmp_path / "listing").write_text(output, encoding="utf-8")
+    script.write_text(
+        f'#!/bin/sh\necho "$@" > {tmp_path / "args"}\ncat {tmp_path / "listing"}\nexit {exit_code}\n', encoding="utf-8"
+    )
+    script.chmod(0o755)
+    return SquashfsConfig(unsquashfs_path=str(script))
+
+
+def test_get_uncompressed_size_sums_regular_files(tmp_path):
+    config = _fake_unsquashfs(tmp_path, _LISTING)
+    assert get_uncompressed_size(config, tmp_path / "image.sqfs") == 1334
+    assert get_uncompressed_size(config, tmp_path / "image.sqfs", Path("bin")) == 1334
+    assert (tmp_path / "args").read_text(encoding="utf-8").split()[-2:] == [str(tmp_path / "image.sqfs"), "bin"]
+
+
+def test_get_uncompressed_size_failures(tmp_path):
+    with pytest.raises(SquashfsError):
+        get_uncompressed_size(_fake_unsquashfs(tmp_path, "", exit_code=1), tmp_path / "image.sqfs")
+    with pytest.raises(SquashfsError):
+        get_uncompressed_size(_fake_unsquashfs(tmp_path, "not a listing\n"), tmp_path / "image.sqfs")
+
+
+def _fake_mksquashfs(tmp_path, exit_code: int = 0) -> SquashfsConfig:
+    """A mksquashfs that saves the tar stream it's given as the "image"."""
+    script = tmp_path / "mksquashfs"
+    script.write_text(
+        f'#!/bin/sh\necho "$@" > {tmp_path / "args"}\ncat > "$2"\necho "mksquashfs said no"\nexit {exit_code}\n',
+        encoding="utf-8",
+    )
+    script.chmod(0o755)
+    return SquashfsConfig(mksquashfs_path=str(script))
+
+
+def test_create_squashfs_image_from_trees_streams_a_tar(tmp_path):
+    gcc = tmp_path / "gcc"
+    (gcc / "bin").mkdir(parents=True)
+    (gcc / "bin" / "gcc").write_bytes(b"gcc")
+    (gcc / "cc").symlink_to("bin/gcc")
+    clang = tmp_path / "clang"
+    clang.mkdir()
+    (clang / "clang").write_bytes(b"clang")
+    output = tmp_path / "out.sqfs"
+
+    def rename_owner(info: tarfile.TarInfo) -> tarfile.TarInfo | None:
+        return None if info.issym() else info.replace(uname="stoat", deep=False)
+
+    create_squashfs_image_from_trees(
+        _fake_mksquashfs(tmp_path), [(gcc, "gcc-12"), (clang, "clang")], output, rename_owner
+    )
+
+    assert (tmp_path / "args").read_text(encoding="utf-8").split()[:3] == ["-", str(output), "-tar"]
+    with tarfile.open(output) as tar:
+        assert sorted(tar.getnames()) == ["clang", "clang/clang", "gcc-12", "gcc-12/bin", "gcc-12/bin/gcc"]
+        assert tar.extractfile("gcc-12/bin/gcc").read() == b"gcc"
+        assert {member.uname for member in tar.getmembers()} == {"stoat"}
+
+
+def test_create_squashfs_image_from_trees_failures(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    with pytest.raises(SquashfsError, match="mksquashfs said no"):
+        create_squashfs_image_from_trees(
+            _fake_mksquashfs(tmp_path, exit_code=1), [(source, "x")], tmp_path / "out.sqfs"
+        )
+    with pytest.raises(SquashfsError, match="Unable to read"):
+        create_squashfs_image_from_trees(
+            _fake_mksquashfs(tmp_path), [(tmp_path / "missing", "x")], tmp_path / "out.sqfs"
+        )
+
+
+_IMAGE_LISTING = """Parallel unsquashfs: Using 8 processors
+drwxr-xr-x root/root        55 2021-03-12 09:29
+drwxr-xr-x root/root        40 2021-03-12 09:29 /gcc
+drwxr-xr-x root/root        40 2021-03-12 09:29 /gcc/bin
+lrwxrwxrwx root/root         3 2021-03-12 09:29 /gcc/bin/cc -> gcc
+-rwxr-xr-x root/root         3 2021-03-12 09:29 /gcc/bin/gcc
+-rw-r--r-- root/root         6 2021-03-12 09:29 /gcc/bin-README
+"""
+
+
+def _fake_image(tmp_path, listing: str) -> tuple[str, Path]:
+    """An unsquashfs that lists `listing`, and -cats files from the tree it returns."""
+    contents = tmp_path / "image-contents"
+    (contents / "gcc" / "bin").mkdir(parents=True)
+    (contents / "gcc" / "bin" / "gcc").write_bytes(b"gcc")
+    (contents / "gcc" / "bin-README").write_bytes(b"readme")
+    (tmp_path / "listing").write_text(listing, encoding="utf-8")
+    script = tmp_path / "unsquashfs"
+    script.write_text(
+        f'#!/bin/sh\nif [ "$1" = "-cat" ]; then cat "{contents}/$3"; exit $?; fi\ncat {tmp_path / "listing"}\n',
+        encoding="utf-8",
+    )
+    script.chmod(0o755)
+    return str(script), contents
+
+
+def _nfs_tree(root: Path) -> Path:
+    (root / "bin").mkdir(parents=True)
+    (root / "bin" / "gcc").write_bytes(b"gcc")
+    (root / "bin" / "cc").symlink_to("gcc")
+    (root / "bin-README").write_bytes(b"readme")
+    return root
+
+
+def test_compare_squashfs_contents_matching(tmp_path):
+    unsquashfs, _ = _fake_image(tmp_path, _IMAGE_LISTING)
+    nfs = _nfs_tree(tmp_path / "nfs")
+    image = tmp_path / "image.sqfs"
+    assert list(compare_squashfs_contents(image, nfs, Path("gcc"), unsquashfs_path=unsquashfs)) == []
+    assert (
+        list(compare_squashfs_contents(image, nfs, Path("gcc"), CONTENT_CHECK_FULL, unsquashfs_path=unsquashfs)) == []
+    )
+
+
+def test_compare_squashfs_contents_reports_why(tmp_path):
+    unsquashfs, contents = _fake_image(tmp_path, _IMAGE_LISTING)
+    (contents / "gcc" / "bin" / "gcc").write_bytes(b"GCC")
+    nfs = _nfs_tree(tmp_path / "nfs")
+    (nfs / "bin" / "cc").unlink()
+    (nfs / "bin" / "cc").symlink_to("clang")
+    (nfs / "bin-README").write_bytes(b"longer readme")
+    (nfs / "bin" / "extra").mkdir()
+
+    differences = list(
+        compare_squashfs_contents(
+            tmp_path / "image.sqfs", nfs, Path("gcc"), CONTENT_CHECK_FULL, unsquashfs_path=unsquashfs
+        )
+    )
+
+    assert differences == [
+        SquashfsDifference("bin/cc", "symlink target differs: squashfs=gcc, directory=clang"),
+        SquashfsDifference("bin/extra", "only in directory"),
+        SquashfsDifference("bin-README", "size differs: squashfs=6, directory=13"),
+        SquashfsDifference("bin/gcc", "contents differ"),
+    ]
+
+
+def test_compare_squashfs_contents_without_content_check_misses_same_size_changes(tmp_path):
+    unsquashfs, contents = _fake_image(tmp_path, _IMAGE_LISTING)
+    (contents / "gcc" / "bin" / "gcc").write_bytes(b"GCC")
+    nfs = _nfs_tree(tmp_path / "nfs")
+    (nfs / "bin").rename(nfs / "bin2")
+    differences = list(compare_squashfs_contents(tmp_path / "image.sqfs", nfs, Path("gcc"), unsquashfs_path=unsquashfs))
+    assert [(difference.path, difference.reason) for difference in differences] == [
+        ("bin", "only in squashfs"),
+        ("bin/cc", "only in squashfs"),
+        ("bin/gcc", "only in squashfs"),
+        ("bin2", "only in directory"),
+        ("bin2/cc", "only in directory"),
+        ("bin2/gcc", "only in directory"),
+    ]
+
+
+def test_compare_squashfs_contents_needs_listing_order(tmp_path):
+    unordered = _IMAGE_LISTING.replace("/gcc/bin/cc -> gcc", "/gcc/bin/zz -> gcc")
+    unsquashfs, _ = _fake_image(tmp_path, unordered)
+    with pytest.raises(SquashfsError, match="out of order"):
+        list(
+            compare_squashfs_contents(tmp_path / "image.sqfs", _nfs_tree(tmp_path / "nfs"), unsquashfs_path=unsquashfs)
+        )
@@ -0,0 +1,89 @@
+from pathlib import Path
+from unittest.mock import patch
+
+from lib import tree_compare
+from lib.tree_compare import compare_trees
+
+
+def _tree(root: Path) -> Path:
+    (root / "bin").mkdir(parents=True)
+    (root / "bin" / "weasel").write_bytes(b"\x7fELF weasel")
+    (root / "lib").mkdir()
+    (root / "lib" / "libweasel.so.1").write_bytes(b"library")
+    (root / "lib" / "libweasel.so").symlink_to("libweasel.so.1")
+    (root / "empty").write_bytes(b"")
+    return root
+
+
+def test_identical_trees(tmp_path):
+    diff = compare_trees(_tree(tmp_path / "a"), _tree(tmp_path / "b"))
+    assert diff.identical
+    assert diff.summary() == "identical"
+    assert diff.files_hashed == 2
+    assert diff.bytes_hashed == 2 * (len(b"\x7fELF weasel") + len(b"library"))
+
+
+def test_reports_each_kind_of_difference(tmp_path):
+    source = _tree(tmp_path / "a")
+    dest = _tree(tmp_path / "b")
+    (source / "only-source").write_text("x", encoding="utf-8")
+    (dest / "lib" / "only-dest").mkdir()
+    (dest / "bin" / "weasel").write_bytes(b"\x7fELF WEASEL")
+    (dest / "lib" / "libweasel.so.1").write_bytes(b"longer library")
+    (dest / "lib" / "libweasel.so").unlink()
+    (dest / "lib" / "libweasel.so").symlink_to("libweasel.so.2")
+    (dest / "empty").unlink()
+    (dest / "empty").mkdir()
+
+    diff = compare_trees(source, dest)
+    assert not diff.identical
+    assert diff.only_in_source == ["only-source"]
+    assert diff.only_in_dest == ["lib/only-dest"]
+    assert diff.type_differs == ["empty"]
+    assert diff.size_differs == ["lib/libweasel.so.1"]
+    assert diff.symlink_differs == ["lib/libweasel.so"]
+    assert diff.content_differs == ["bin/weasel"]
+    assert diff.to_json()["identical"] is False
+    assert "1 with different content" in diff.summary()
+
+
+def test_structural_differences_need_no_hashing(tmp_path):
+    source = _tree(tmp_path / "a")
+    dest = tmp_path / "b"
+    dest.mkdir()
+    (dest / "bin").mkdir()
+    (dest / "bin" / "weasel").write_bytes(b"different size")
+    with patch("lib.tree_compare._digest") as digest:
+        diff = compare_trees(source, dest)
+        digest.assert_not_called()
+    assert diff.only_in_source == ["empty", "lib", "lib/libweasel.so", "lib/libweasel.so.1"]
+    assert diff.size_differs == ["bin/weasel"]
+
+
+def test_missing_dest_is_a_difference(tmp_path):
+    diff = compare_trees(_tree(tmp_path / "a"), tmp_path / "missing")
+    assert not diff.identical
+    assert diff.unreadable_in_dest == ["."]
+    assert diff.only_in_source == ["bin", "bin/weasel", "empty", "lib", "lib/libweasel.so", "lib/libweasel.so.1"]
+    assert "1 unreadable in destination" in diff.summary()
+
+
+def test_missing_source_is_a_difference(tmp_path):
+    diff = compare_trees(tmp_path / "missing", _tree(tmp_path / "b"))
+    assert not diff.identical
+    assert diff.unreadable_in_source == ["."]
+    assert diff.unreadable_in_dest == []
+
+
+def test_unreadable_files_are_differences(tmp_path):
+    source = _tree(tmp_path / "a")
+    dest = _tree(tmp_path / "b")
+    real_digest = tree_compare._digest
+    with patch(
+        "lib.tree_compare._digest",
+        side_effect=lambda path: None if path == dest / "lib" / "libweasel.so.1" else real_digest(path),
+    ):
+        diff = compare_trees(source, dest)
+    assert diff.unreadable_in_dest == ["lib/libweasel.so.1"]
+    assert diff.content_differs == []
+    assert not diff.identical
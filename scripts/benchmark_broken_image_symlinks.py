@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark finding the NFS symlinks that reference broken CEFS images.
+
+Builds a synthetic NFS tree of symlinks into /cefs, then times looking up a number of unreferenced images (the worst
+case: every lookup has to consider the whole tree) the old way, with a full NFS walk per image, and the new way, with
+one walk building a map from image to symlinks.
+
+Usage:
+    PYTHONPATH=bin python scripts/benchmark_broken_image_symlinks.py [--symlinks N] [--images N]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from lib.cefs.constants import NFS_MAX_RECURSION_DEPTH
+from lib.cefs.paths import glob_with_depth
+from lib.cefs.state import CEFSState
+
+MOUNT_POINT = Path("/cefs")
+
+
+def _make_tree(nfs_dir: Path, symlinks: int) -> None:
+    per_dir = 500
+    for i in range(symlinks):
+        directory = nfs_dir / f"group{i // (per_dir * 10)}" / f"dir{i // per_dir}"
+        if i % per_dir == 0:
+            directory.mkdir(parents=True)
+        image = f"{i:024x}_synthetic"
+        (directory / f"compiler-{i}").symlink_to(MOUNT_POINT / image[:2] / image / "compiler")
+        if i % 10 == 0:
+            (directory / f"compiler-{i}.bak").symlink_to(MOUNT_POINT / image[:2] / image)
+
+
+def _per_image_walks(state: CEFSState, stems: list[str]) -> int:
+    found = 0
+    for stem in stems:
+        for path in glob_with_depth(state.nfs_dir, "*", NFS_MAX_RECURSION_DEPTH):
+            if state._check_single_symlink(path, stem):
+                found += 1
+                break
+    return found
+
+
+def _single_walk(state: CEFSState, stems: list[str]) -> int:
+    return sum(1 for stem in stems if state._find_symlinks_to_image(stem))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symlinks", type=int, default=50_000, help="Number of symlinks in the synthetic tree")
+    parser.add_argument("--images", type=int, default=30, help="Number of broken images to look up")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        nfs_dir = Path(tmp) / "nfs"
+        _make_tree(nfs_dir, args.symlinks)
+        stems = [f"{i:024x}_unreferenced" for i in range(args.images)]
+        print(f"{args.symlinks} symlinks, {args.images} unreferenced images:")
+        for label, func in (("walk per image", _per_image_walks), ("single walk", _single_walk)):
+            state = CEFSState(nfs_dir, Path(tmp) / "cefs-images", MOUNT_POINT)
+            start = time.perf_counter()
+            found = func(state, stems)
+            elapsed = time.perf_counter() - start
+            print(f"  {label:>14}: {elapsed * 1000:9.1f}ms ({found} referenced)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark loading CEFS manifests when scanning the image directory.
+
+Builds a synthetic image directory of small .sqfs files with manifests, then scans it the old way (reading each
+manifest in turn with the pure-Python YAML loader) and with CEFSState (reading them on a thread pool with libyaml's
+loader, if available), checking both produce the same state; then again with CEFSState once every image has a JSON
+manifest sidecar.
+
+Usage:
+    PYTHONPATH=bin python scripts/benchmark_manifest_loading.py [--manifests N]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+from lib.cefs.state import CEFSState
+from lib.cefs_manifest import validate_manifest, write_manifest_sidecar
+
+
+def _make_images(image_dir: Path, count: int) -> None:
+    for i in range(count):
+        stem = f"{i:024x}_synthetic"
+        subdir = image_dir / stem[-12:-10]
+        subdir.mkdir(parents=True, exist_ok=True)
+        (subdir / f"{stem}.sqfs").write_bytes(b"")
+        manifest = {
+            "version": 1,
+            "operation": "install",
+            "description": f"Synthetic image {i}",
+            "contents": [
+                {"name": f"compilers/c++/x86/gcc {i}.{j}.0", "destination": f"/opt/compiler-explorer/gcc-{i}.{j}.0"}
+                for j in range(1 + i % 4)
+            ],
+            "created_at": "2025-01-01T00:00:00+00:00",
+            "git_sha": "0123456789abcdef",
+            "command": ["ce_install", "install", f"gcc {i}"],
+        }
+        (subdir / f"{stem}.yaml").write_text(yaml.dump(manifest), encoding="utf-8")
+
+
+def _serial_references(image_dir: Path) -> dict[str, list[Path]]:
+    references = {}
+    for image in sorted(image_dir.glob("*/*.sqfs")):
+        with image.with_suffix(".yaml").open(encoding="utf-8") as f:
+            manifest = yaml.safe_load(f)
+        validate_manifest(manifest)
+        references[image.stem] = [Path(content["destination"]) for content in manifest["contents"]]
+    return references
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--manifests", type=int, default=10_000, help="Number of synthetic manifests")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image_dir = Path(tmp) / "cefs-images"
+        _make_images(image_dir, args.manifests)
+        print(f"{args.manifests} manifests (libyaml {'available' if yaml.__with_libyaml__ else 'unavailable'}):")
+
+        start = time.perf_counter()
+        expected = _serial_references(image_dir)
+        print(f"  {'one at a time':>14}: {(time.perf_counter() - start) * 1000:9.1f}ms")
+
+        state = CEFSState(Path(tmp) / "nfs", image_dir, Path("/cefs"))
+        start = time.perf_counter()
+        state.scan_cefs_images_with_manifests()
+        print(f"  {'CEFSState':>14}: {(time.perf_counter() - start) * 1000:9.1f}ms")
+
+        assert state.image_references == expected, "CEFSState disagrees with loading one at a time"
+
+        for image in image_dir.glob("*/*.sqfs"):
+            write_manifest_sidecar(image)
+        state = CEFSState(Path(tmp) / "nfs", image_dir, Path("/cefs"))
+        start = time.perf_counter()
+        state.scan_cefs_images_with_manifests()
+        print(f"  {'with sidecars':>14}: {(time.perf_counter() - start) * 1000:9.1f}ms")
+
+        assert state.image_references == expected, "CEFSState disagrees with loading one at a time"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark ce_install startup with a cold and a warm expanded-target cache.
+
+Times how long it takes to load and filter the installation targets the way `ce_install list` and
+`ce_install install` do, first with an empty cache directory and then with the cache populated.
+
+Usage:
+    PYTHONPATH=bin python scripts/benchmark_target_cache.py [--runs N] [FILTER ...]
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from lib.config_cache import ExpandedTargetCache
+from lib.installation import installer_base_config
+
+YAML_DIR = Path(__file__).resolve().parent.parent / "bin" / "yaml"
+
+
+class _FakeInstallContext:
+    destination = Path("/opt/compiler-explorer")
+    yaml_dir = YAML_DIR
+    resource_dir = YAML_DIR.parent / "resources"
+
+
+def _load(cache: ExpandedTargetCache, enabled: list[str] | bool, filters: list[str]) -> int:
+    base_config = installer_base_config(_FakeInstallContext())
+    count = 0
+    for yaml_path in YAML_DIR.glob("*.yaml"):
+        for target in cache.targets_for(yaml_path, enabled, base_config):
+            name = f"{'/'.join(target.get('context', []))} {target.get('name')}"
+            if all(f in name for f in filters):
+                count += 1
+    return count
+
+
+def _time(runs: int, func) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Number of timed runs per scenario")
+    parser.add_argument("filters", nargs="*", default=["gcc"], help="Substrings to filter target names with")
+    args = parser.parse_args()
+
+    scenarios = {
+        "list": [],  # what `ce_install list` sees by default
+        "install --enable nightly": ["nightly"],
+    }
+    for scenario, enabled in scenarios.items():
+        uncached = _time(args.runs, lambda e=enabled: _load(ExpandedTargetCache(None), e, args.filters))
+        cold = []
+        warm = []
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as cache_dir:
+                cold += _time(1, lambda d=cache_dir, e=enabled: _load(ExpandedTargetCache(Path(d)), e, args.filters))
+                warm += _time(1, lambda d=cache_dir, e=enabled: _load(ExpandedTargetCache(Path(d)), e, args.filters))
+        matched = _load(ExpandedTargetCache(None), enabled, args.filters)
+        print(f"{scenario} ({matched} matching targets):")
+        for label, timings in (("no cache", uncached), ("cold", cold), ("warm", warm)):
+            print(f"  {label:>8}: median {statistics.median(timings) * 1000:8.1f}ms, min {min(timings) * 1000:8.1f}ms")
+        print(f"  speedup warm vs no cache: {statistics.median(uncached) / statistics.median(warm):.1f}x")
+
+
+if __name__ == "__main__":
+    main()